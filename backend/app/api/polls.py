@@ -1,239 +1,389 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+import logging
+import time
 import uuid
 from datetime import datetime
 
 from app.database import get_db
 from app import models, schemas
+from app.services import bulk_votes, voting, vote_export
+from app.services.vote_buffer import vote_buffer, BufferFullError
+from app.services.vote_log import vote_log, VoteLogUnavailableError
+from app.services.poll_cache import poll_cache, etag_matches
+from app.services.poll_registry import PollMeta, poll_registry
+from app.services.broadcaster import VoteBroadcaster, get_broadcaster
+from app.services.dedupe import dedupe_filter
+from app.services.client_keys import anonymous_client_id
+from app.services import rollups
+from app.services.rollups import vote_rollups
+from app.services.metrics import votes_committed, votes_duplicate
+from app.services.admission import admission, retry_after_header
+from app.services.read_routing import get_read_db, is_replica, read_router
+from app.services.serializer import EncodedJSONResponse, FastJSONResponse, vote_body
 
-router = APIRouter()
+# 未显式返回 Response 的路由统一使用快速 JSON 编码
+router = APIRouter(default_response_class=FastJSONResponse)
+logger = logging.getLogger(__name__)
+
+async def _load_tally(db: AsyncSession, poll: PollMeta):
+    """回源读取问卷票数（元数据来自问卷注册表；写缓冲模式下叠加尚未落库的票数）"""
+    if vote_log.enabled:
+        # 投票日志模式：已载入问卷的权威票数在内存中
+        counts = vote_log.counts(poll.poll_id)
+        if counts is not None:
+            return poll.tally(counts)
+    tally = poll.tally(await voting.read_poll_counts(db, poll.poll_id))
+    for opt in tally.options:
+        if vote_buffer.enabled:
+            opt.vote_count += vote_buffer.pending_count(opt.option_id)
+        if vote_log.enabled:
+            opt.vote_count += vote_log.pending_count(opt.option_id)
+    return tally
+
+async def poll_snapshot(db: AsyncSession, poll: PollMeta):
+    """读取问卷快照，未命中时回源（同一问卷的并发未命中只回源一次）"""
+    return await poll_cache.get_or_load(
+        poll.poll_id, lambda: _load_tally(db, poll), authoritative=not is_replica(db)
+    )
+
+async def _snapshot_by_id(db: AsyncSession, poll_id: int):
+    """按问卷ID读取快照（命中时不访问问卷注册表），问卷不存在时返回 None"""
+    async def load():
+        poll = await poll_registry.get(db, poll_id)
+        return await _load_tally(db, poll) if poll is not None else None
+    return await poll_cache.get_or_load(poll_id, load, authoritative=not is_replica(db))
+
+async def preload_snapshots(db: AsyncSession) -> int:
+    """启动预热：加载进行中问卷（含当前问卷）的元数据与快照，返回加载的问卷数"""
+    polls = await poll_registry.active(db)
+    for poll in polls:
+        await poll_snapshot(db, poll)
+    return len(polls)
+
+def _cached_response(request: Request, body: bytes, etag: str) -> Response:
+    """返回预序列化的快照字节；客户端 ETag 未变化时返回 304"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return EncodedJSONResponse(content=body, headers=headers)
 
 @router.get("/poll")
-async def get_current_poll(db: Session = Depends(get_db)):
+async def get_current_poll(request: Request, db: AsyncSession = Depends(get_read_db)):
     """获取当前问卷及其选项 - 兼容前端数据格式"""
-    poll = db.query(models.Poll).first()
-    if not poll:
+    poll = await poll_registry.current(db)
+    if poll is None:
+        raise HTTPException(status_code=404, detail="未找到投票问卷")
+    snapshot = await poll_snapshot(db, poll)
+    if snapshot is None:
         raise HTTPException(status_code=404, detail="未找到投票问卷")
     
-    # 计算总票数
-    total_votes = sum(option.vote_count for option in poll.options)
-    
-    # 转换为前端期望的格式
-    poll_data = {
-        "success": True,
-        "data": {
-            "id": str(poll.poll_id),
-            "title": poll.title,
-            "description": "",  # 暂时为空
-            "options": [
-                {
-                    "id": str(option.option_id),
-                    "text": option.label,
-                    "votes": option.vote_count
-                }
-                for option in poll.options
-            ],
-            "totalVotes": total_votes,
-            "isActive": True,
-            "createdAt": poll.created_at.isoformat(),
-            "updatedAt": poll.created_at.isoformat()  # 暂时使用创建时间
-        }
-    }
+    return _cached_response(request, snapshot.poll_body, snapshot.poll_etag)
+
+@router.get("/polls")
+async def get_active_polls(db: AsyncSession = Depends(get_read_db)):
+    """获取进行中的问卷列表（元数据来自问卷注册表）"""
+    return {"success": True, "data": [poll.summary() for poll in await poll_registry.active(db)]}
+
+@router.get("/poll/{poll_ref}")
+async def get_poll(poll_ref: str, request: Request, db: AsyncSession = Depends(get_read_db)):
+    """按问卷ID或 slug 获取问卷及其选项（格式同 GET /poll）"""
+    poll = await poll_registry.resolve(db, poll_ref)
+    snapshot = await poll_snapshot(db, poll) if poll is not None else None
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="问卷不存在")
     
-    return poll_data
+    return _cached_response(request, snapshot.poll_body, snapshot.poll_etag)
 
 @router.get("/poll/{poll_id}/statistics", response_model=schemas.PollStatistics)
-async def get_poll_statistics(poll_id: int, db: Session = Depends(get_db)):
-    """获取投票统计数据"""
-    poll = db.query(models.Poll).filter(models.Poll.poll_id == poll_id).first()
-    if not poll:
+async def get_poll_statistics(poll_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    """获取投票统计数据（总票数由选项票数缓存汇总，无需扫描投票记录）"""
+    snapshot = await _snapshot_by_id(db, poll_id)
+    if snapshot is None:
         raise HTTPException(status_code=404, detail="问卷不存在")
     
-    # 计算总票数
-    total_votes = db.query(models.Vote).join(models.Option).filter(
-        models.Option.poll_id == poll_id
-    ).count()
-    
-    # 获取每个选项的统计数据
-    options_stats = []
-    for option in poll.options:
-        vote_count = option.vote_count
-        percentage = (vote_count / total_votes * 100) if total_votes > 0 else 0
-        
-        options_stats.append(schemas.VoteStatistics(
-            option_id=option.option_id,
-            label=option.label,
-            vote_count=vote_count,
-            percentage=round(percentage, 2)
-        ))
-    
-    return schemas.PollStatistics(
-        poll_id=poll.poll_id,
-        title=poll.title,
-        total_votes=total_votes,
-        options=options_stats
-    )
+    return _cached_response(request, snapshot.statistics_body, snapshot.statistics_etag)
 
 @router.post("/poll/vote")
 async def submit_vote(
     vote_data: dict,  # 改为接受字典格式
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    broadcaster: VoteBroadcaster = Depends(get_broadcaster),
 ):
     """提交投票 - 兼容前端数据格式"""
     
-    print(f"收到投票请求: {vote_data}")  # 调试日志
-    
     # 从前端数据中提取信息
     option_id = vote_data.get("optionId")
     user_token = vote_data.get("userToken", "")
     
-    print(f"解析的数据: option_id={option_id}, user_token={user_token}")  # 调试日志
-    
     if not option_id:
-        print("错误: 缺少选项ID")
+        logger.info("缺少选项ID")
         raise HTTPException(status_code=400, detail="缺少选项ID")
     
     try:
         option_id = int(option_id)  # 转换为整数
-        print(f"转换后的option_id: {option_id}")
     except ValueError:
-        print(f"错误: 无效的选项ID: {option_id}")
+        logger.info("无效的选项ID", extra={"option_id": option_id})
         raise HTTPException(status_code=400, detail="无效的选项ID")
     
     # 生成客户端ID
     client_id = user_token
     if not client_id:
-        # 使用IP地址和User-Agent生成简单的客户端标识
+        # 使用IP地址和User-Agent生成稳定的客户端标识（各 worker 一致）
         client_ip = request.client.host
         user_agent = request.headers.get("user-agent", "")
-        client_id = f"{client_ip}_{hash(user_agent)}"
+        client_id = anonymous_client_id(client_ip, user_agent)
+    
+    logger.debug("收到投票请求", extra={"option_id": option_id, "client_id": client_id})
     
-    print(f"客户端ID: {client_id}")
+    # 同一客户端的高频重复提交在访问数据库之前拒绝
+    retry_after = admission.check_vote_client(client_id)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="投票过于频繁，请稍后重试",
+            headers={"Retry-After": retry_after_header(retry_after)},
+        )
     
-    # 检查选项是否存在
-    option = db.query(models.Option).filter(
-        models.Option.option_id == option_id
-    ).first()
-    if not option:
-        print(f"错误: 选项不存在, option_id={option_id}")
+    # 选项所属问卷与问卷状态由问卷注册表判断，命中时不访问数据库
+    poll = await poll_registry.poll_of_option(db, option_id)
+    if poll is None:
+        logger.info("选项不存在", extra={"option_id": option_id})
         raise HTTPException(status_code=400, detail="选项不存在")
+    if not poll.is_active():
+        raise HTTPException(status_code=400, detail="该问卷不在投票时间内")
     
-    print(f"找到选项: {option.label}, poll_id={option.poll_id}")
+    if vote_buffer.enabled:
+        response = await _submit_buffered_vote(db, broadcaster, poll, option_id, client_id)
+        read_router.mark_write(request, response)
+        return response
+    if vote_log.enabled:
+        response = await _submit_logged_vote(db, broadcaster, poll, option_id, client_id)
+        read_router.mark_write(request, response)
+        return response
     
-    # 检查是否已经投过票（简单防重复）
-    existing_vote = db.query(models.Vote).filter(
-        models.Vote.client_id == client_id,
-        models.Vote.option_id.in_(
-            db.query(models.Option.option_id).filter(
-                models.Option.poll_id == option.poll_id
-            )
-        )
-    ).first()
+    try:
+        # 防重复写入 + 原子累加 + 读取票数，在同一个短事务内完成
+        result = await voting.record_vote(db, option_id, client_id, poll=poll)
+    except Exception as e:
+        logger.exception("投票失败", extra={"option_id": option_id, "client_id": client_id})
+        raise HTTPException(status_code=500, detail=f"投票失败: {str(e)}")
+    
+    dedupe_filter.record_result(result.tally.poll_id, client_id, result.created)
+    if result.created:
+        votes_committed.inc(labels=("direct",))
+    else:
+        votes_duplicate.inc()
+    
+    # 用事务内读取的票数更新快照，并通知广播器推送增量
+    snapshot = poll_cache.put(result.tally)
+    broadcaster.notify(snapshot)
     
-    if existing_vote:
-        print(f"用户已投票: client_id={client_id}, existing_vote_id={existing_vote.vote_id}")
+    if not result.created:
         # 虽然已投票，但返回成功状态和当前数据
-        poll = db.query(models.Poll).filter(models.Poll.poll_id == option.poll_id).first()
-        total_votes = sum(opt.vote_count for opt in poll.options)
-        
-        updated_poll = {
-            "id": str(poll.poll_id),
-            "title": poll.title,
-            "description": "",
-            "options": [
-                {
-                    "id": str(opt.option_id),
-                    "text": opt.label,
-                    "votes": opt.vote_count
-                }
-                for opt in poll.options
-            ],
-            "totalVotes": total_votes,
-            "isActive": True,
-            "createdAt": poll.created_at.isoformat(),
-            "updatedAt": poll.created_at.isoformat()
-        }
-        
-        return {
-            "success": True,
-            "message": "您已经投过票了，这是当前投票结果",
-            "poll": updated_poll
-        }
+        logger.debug("重复投票", extra={"option_id": option_id, "client_id": client_id})
+    else:
+        logger.debug("投票成功", extra={"vote_id": result.vote_id, "option_id": option_id})
+    # 复用快照中预编码的问卷字节
+    response = EncodedJSONResponse(vote_body(snapshot.poll_json, result.created))
+    # 读己之写：该客户端随后的读请求暂时走主库
+    read_router.mark_write(request, response)
+    return response
+
+@router.post("/poll/votes/bulk")
+async def submit_votes_bulk(
+    payload: dict,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    broadcaster: VoteBroadcaster = Depends(get_broadcaster),
+):
+    """
+    批量提交投票（现场终端 / 合作方离线收集后回放）
+    请求体 {"votes": [{"optionId", "userToken", "votedAt"}]}，整批在一个事务内写入，返回逐条结果
+    """
+    records = payload.get("votes")
+    if not isinstance(records, list) or not records:
+        raise HTTPException(status_code=400, detail="votes 须为非空数组")
+    if len(records) > bulk_votes.VOTE_BULK_MAX_RECORDS:
+        raise HTTPException(status_code=413, detail=f"单次最多提交 {bulk_votes.VOTE_BULK_MAX_RECORDS} 条投票")
     
+    reserved = vote_buffer.pending_clients if vote_buffer.enabled else None
+    if vote_log.enabled:
+        reserved = vote_log.pending_clients
     try:
-        print("开始创建投票记录...")
-        
-        # 创建投票记录
-        new_vote = models.Vote(
-            option_id=option_id,
-            client_id=client_id
-        )
-        db.add(new_vote)
-        
-        # 更新选项的投票计数缓存
-        option.vote_count += 1
-        
-        db.commit()
-        print(f"投票成功: vote_id={new_vote.vote_id}")
-        
-        # 获取更新后的投票数据
-        poll = db.query(models.Poll).filter(models.Poll.poll_id == option.poll_id).first()
-        total_votes = sum(opt.vote_count for opt in poll.options)
-        
-        # 返回兼容前端的格式
-        updated_poll = {
-            "id": str(poll.poll_id),
-            "title": poll.title,
-            "description": "",
-            "options": [
-                {
-                    "id": str(opt.option_id),
-                    "text": opt.label,
-                    "votes": opt.vote_count
-                }
-                for opt in poll.options
-            ],
-            "totalVotes": total_votes,
-            "isActive": True,
-            "createdAt": poll.created_at.isoformat(),
-            "updatedAt": poll.created_at.isoformat()
-        }
-        
-        print("返回投票结果")
-        return {
-            "success": True,
-            "message": "投票成功",
-            "poll": updated_poll
-        }
-        
+        result = await bulk_votes.record_votes_bulk(db, records, reserved)
+    except Exception as e:
+        logger.exception("批量投票失败", extra={"records": len(records)})
+        raise HTTPException(status_code=500, detail=f"批量投票失败: {str(e)}")
+    
+    for vote in result.created:
+        dedupe_filter.record_result(vote.poll_id, vote.client_id, True)
+    summary = result.summary()
+    votes_committed.inc(summary[bulk_votes.CREATED], labels=("bulk",))
+    votes_duplicate.inc(summary[bulk_votes.DUPLICATE])
+    for tally in result.tallies.values():
+        if vote_log.enabled:
+            # 数据库已被批量写入，下次投票时重新载入该问卷的票数与已投票客户端
+            vote_log.forget_poll(tally.poll_id)
+        for opt in tally.options:
+            if vote_buffer.enabled:
+                opt.vote_count += vote_buffer.pending_count(opt.option_id)
+            if vote_log.enabled:
+                opt.vote_count += vote_log.pending_count(opt.option_id)
+        broadcaster.notify(poll_cache.put(tally))
+    logger.info("批量投票", extra={"records": len(records), "summary": summary})
+    
+    response = FastJSONResponse({"success": True, "summary": summary, "results": result.results})
+    read_router.mark_write(request, response)
+    return response
+
+async def _submit_buffered_vote(
+    db: AsyncSession, broadcaster: VoteBroadcaster, poll: PollMeta, option_id: int, client_id: str
+):
+    """写缓冲模式：校验后放入队列立即确认，由后台任务批量落库"""
+    tally = poll.tally(await voting.read_poll_counts(db, poll.poll_id))
+    
+    # 先在进程内占位，再查库防重复，避免同一客户端的并发请求重复受理
+    duplicate = not vote_buffer.reserve(tally.poll_id, client_id)
+    if not duplicate:
+        if dedupe_filter.might_contain(tally.poll_id, client_id):
+            try:
+                duplicate = await voting.has_voted(db, tally.poll_id, client_id)
+            except Exception:
+                vote_buffer.release(tally.poll_id, client_id)
+                raise
+        if duplicate:
+            vote_buffer.release(tally.poll_id, client_id)
+        else:
+            try:
+                await vote_buffer.submit(option_id, tally.poll_id, client_id)
+            except BufferFullError:
+                raise HTTPException(status_code=503, detail="投票人数过多，请稍后重试")
+        dedupe_filter.record_result(tally.poll_id, client_id, not duplicate)
+    if duplicate:
+        votes_duplicate.inc()
+    
+    # 叠加已受理但尚未落库的票数
+    for opt in tally.options:
+        opt.vote_count += vote_buffer.pending_count(opt.option_id)
+    
+    snapshot = poll_cache.put(tally)
+    broadcaster.notify(snapshot)
+    
+    return EncodedJSONResponse(vote_body(snapshot.poll_json, not duplicate))
+
+async def _submit_logged_vote(
+    db: AsyncSession, broadcaster: VoteBroadcaster, poll: PollMeta, option_id: int, client_id: str
+):
+    """投票日志模式：内存防重复后写入本地日志，落盘即确认，由后台检查点写入数据库"""
+    # 只有问卷的首次投票需要访问数据库
+    await vote_log.load_poll(db, poll.poll_id)
+    try:
+        created = await vote_log.record(poll.poll_id, option_id, client_id)
+    except VoteLogUnavailableError:
+        raise HTTPException(status_code=503, detail="投票服务暂不可用，请稍后重试")
     except Exception as e:
-        db.rollback()
-        print(f"投票失败: {str(e)}")
-        print(f"异常类型: {type(e)}")
-        import traceback
-        print(f"异常堆栈: {traceback.format_exc()}")
+        logger.exception("投票失败", extra={"option_id": option_id, "client_id": client_id})
         raise HTTPException(status_code=500, detail=f"投票失败: {str(e)}")
+    if not created:
+        votes_duplicate.inc()
+    
+    # 等待落盘期间该问卷可能因批量投票被重新载入，此时回源读取
+    snapshot = poll_cache.put(await _load_tally(db, poll))
+    broadcaster.notify(snapshot)
+    
+    return EncodedJSONResponse(vote_body(snapshot.poll_json, created))
+
+@router.get("/poll/{poll_id}/timeseries")
+async def get_poll_timeseries(
+    poll_id: int,
+    resolution: str = Query("1m", pattern="^(1s|1m|1h)$", description="时间粒度"),
+    window: int = Query(3600, ge=1, description="时间窗口长度（秒）"),
+    end: Optional[int] = Query(None, ge=0, description="时间窗口终点（UTC 秒级时间戳），默认当前时间"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """获取各选项按时间桶汇总的票数（读取预汇总结果，不扫描投票记录）"""
+    bucket_seconds = rollups.RESOLUTIONS[resolution]
+    first, last = rollups.bucket_window(bucket_seconds, time.time() if end is None else end, window)
+    if (last - first) // bucket_seconds + 1 > rollups.VOTE_TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail="时间窗口过大，请选择更粗的时间粒度")
+    
+    snapshot = await _snapshot_by_id(db, poll_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="问卷不存在")
+    options = snapshot.tally.options
+    series = await vote_rollups.series(db, [opt.option_id for opt in options], bucket_seconds, first, last)
+    
+    return {
+        "success": True,
+        "data": {
+            "pollId": str(poll_id),
+            "resolution": resolution,
+            "bucketSeconds": bucket_seconds,
+            "start": first,
+            "end": last + bucket_seconds,
+            "buckets": list(range(first, last + 1, bucket_seconds)),
+            "options": [
+                {"id": str(opt.option_id), "text": opt.label, "votes": series[opt.option_id]}
+                for opt in options
+            ]
+        }
+    }
+
+async def _stream_votes(bind, poll_id: int, fmt: str, cursor: Optional[int]):
+    """流式导出使用独立会话：请求依赖的会话在响应开始发送前即被关闭"""
+    async with AsyncSession(bind=bind) as export_db:
+        async for chunk in vote_export.stream_votes(export_db, poll_id, fmt, cursor):
+            yield chunk
 
 @router.get("/poll/{poll_id}/votes", response_model=List[schemas.Vote])
-async def get_poll_votes(poll_id: int, db: Session = Depends(get_db)):
-    """获取投票记录（管理功能）"""
-    votes = db.query(models.Vote).join(models.Option).filter(
-        models.Option.poll_id == poll_id
-    ).all()
+async def get_poll_votes(
+    poll_id: int,
+    response: Response,
+    cursor: Optional[int] = Query(None, ge=0, description="上一页最后一条记录的 vote_id"),
+    limit: int = Query(vote_export.VOTES_PAGE_DEFAULT_LIMIT, ge=1, le=vote_export.VOTES_PAGE_MAX_LIMIT),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$", description="json 分页 / ndjson、csv 流式导出全部记录"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """获取投票记录（管理功能）：按 vote_id 键集分页，或流式导出全部记录"""
+    if fmt != "json":
+        return StreamingResponse(
+            _stream_votes(db.bind, poll_id, fmt, cursor),
+            media_type=vote_export.EXPORT_MEDIA_TYPES[fmt],
+            headers={"Content-Disposition": f'attachment; filename="poll_{poll_id}_votes.{fmt}"'},
+        )
     
+    votes = await vote_export.read_votes_page(db, poll_id, cursor, limit)
+    if len(votes) == limit:
+        # 还有下一页：客户端以该值作为 cursor 继续读取
+        response.headers["X-Next-Cursor"] = str(votes[-1]["vote_id"])
     return votes
 
 @router.post("/poll", response_model=schemas.Poll)
-async def create_poll(poll_data: schemas.PollCreate, db: Session = Depends(get_db)):
+async def create_poll(
+    poll_data: schemas.PollCreate,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
     """创建新的投票问卷（管理功能）"""
     try:
         # 创建问卷
-        new_poll = models.Poll(title=poll_data.title)
+        new_poll = models.Poll(
+            title=poll_data.title,
+            slug=poll_data.slug,
+            status=poll_data.status,
+            starts_at=poll_data.starts_at,
+            ends_at=poll_data.ends_at,
+        )
         db.add(new_poll)
-        db.flush()  # 获取poll_id
+        await db.flush()  # 获取poll_id
         
         # 创建选项
         for option_data in poll_data.options:
@@ -243,11 +393,24 @@ async def create_poll(poll_data: schemas.PollCreate, db: Session = Depends(get_d
             )
             db.add(new_option)
         
-        db.commit()
-        db.refresh(new_poll)
+        await db.commit()
+        # 异步会话不支持懒加载，用 selectinload 一次性预加载选项（连同服务端默认值）
+        new_poll = await db.scalar(
+            select(models.Poll)
+            .options(selectinload(models.Poll.options))
+            .where(models.Poll.poll_id == new_poll.poll_id)
+            .execution_options(populate_existing=True)
+        )
+        for option in new_poll.options:
+            dedupe_filter.register_option(option.option_id, new_poll.poll_id)
+        poll_registry.created(new_poll)
+        read_router.mark_write(request, response)
         
         return new_poll
         
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="slug 已被其他问卷使用")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"创建问卷失败: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+日志配置
+- 请求线程 / 事件循环只把日志记录放入内存队列，由后台线程（QueueListener）格式化并写出，不阻塞请求
+- 默认输出 JSON 结构化日志，每条记录带 request_id（由中间件从 X-Request-ID 读取或生成）
+- 日志级别按环境配置（LOG_LEVEL / LOG_LEVELS），运行时可通过 /logging 接口调整
+- DEBUG 级别的高频事件按 LOG_DEBUG_SAMPLE_RATE 采样输出
+- SQL 回显（sqlalchemy.engine）与 Socket.IO 帧日志（socketio / engineio）默认关闭，调整对应日志级别即可开启
+"""
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from typing import Dict, Optional
+
+# 运行环境：production / development
+APP_ENV = os.getenv("APP_ENV", "production")
+# 根日志级别（生产环境默认 INFO，开发环境默认 DEBUG）
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG" if APP_ENV == "development" else "INFO")
+# 按日志名单独设置级别，如 "sqlalchemy.engine=INFO,socketio=INFO"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# 输出格式：json / text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# DEBUG 级别日志的采样率（0~1）
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0" if APP_ENV == "development" else "0.01"))
+# 日志队列容量，写出跟不上时丢弃新记录而不是阻塞请求
+LOG_QUEUE_SIZE = 10000
+
+# 默认静默的高频日志：SQL 回显、Socket.IO / Engine.IO 帧日志
+QUIET_LOGGERS = {
+    "sqlalchemy.engine": logging.WARNING,
+    "socketio": logging.WARNING,
+    "engineio": logging.WARNING,
+}
+
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="")
+
+# LogRecord 自带的属性，其余属性视为结构化字段（extra）
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+_exception_formatter = logging.Formatter()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+class RequestContextFilter(logging.Filter):
+    """在产生日志的上下文中附加 request_id（须在入队前执行）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """DEBUG 及以下级别的记录按采样率放行"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列已满时丢弃记录并计数"""
+    dropped = 0
+
+    def prepare(self, record):
+        # 只做最少的处理：合并消息参数、把异常转为文本，格式化留给后台线程
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """单行 JSON 日志"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", ""):
+            data["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """解析 "name=LEVEL,name=LEVEL" 形式的日志级别配置"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    levels: str = LOG_LEVELS,
+    fmt: str = LOG_FORMAT,
+    debug_sample_rate: float = LOG_DEBUG_SAMPLE_RATE,
+):
+    """配置根日志：队列 handler + 后台线程写出（重复调用不会重复添加 handler）"""
+    global _listener, _queue_handler
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    for name, logger_level in {**QUIET_LOGGERS, **parse_levels(levels)}.items():
+        logging.getLogger(name).setLevel(logger_level)
+    if _queue_handler is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(RequestContextFilter())
+    _queue_handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+    root.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """停止后台写出线程（写出队列中剩余的记录）并移除队列 handler，之后可再次调用 configure_logging"""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def current_levels() -> Dict[str, str]:
+    """根日志与已显式设置级别的日志的当前级别"""
+    levels = {"root": logging.getLevelName(logging.getLogger().level)}
+    for name, logger in sorted(logging.root.manager.loggerDict.items()):
+        if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+            levels[name] = logging.getLevelName(logger.level)
+    return levels
+
+
+def set_levels(levels: Dict[str, str]):
+    """运行时调整日志级别（"root" 表示根日志），级别名无效时抛出 ValueError"""
+    resolved = {}
+    for name, level in levels.items():
+        value = logging.getLevelName(str(level).upper())
+        if not isinstance(value, int):
+            raise ValueError(f"无效的日志级别: {level}")
+        resolved[name] = value
+    for name, value in resolved.items():
+        logging.getLogger(None if name == "root" else name).setLevel(value)
+
+
+class RequestIdMiddleware:
+    """ASGI 中间件：为每个 HTTP 请求设置 request_id，并通过 X-Request-ID 响应头返回"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = ""
+        for key, value in scope.get("headers", []):
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-request-id", request_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -1,79 +1,310 @@
-from fastapi import FastAPI
+"""
+应用入口
+导入本模块没有副作用：数据库引擎、Socket.IO 服务与广播器都在 create_app() 中创建并保存在 app.state，
+uvicorn 以工厂方式启动：uvicorn app.main:create_socket_app --factory
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import Body, Depends, FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 import socketio
 from app.api import polls
+from app.services.vote_buffer import vote_buffer
+from app.services.vote_log import vote_log
+from app.services.broadcaster import VoteBroadcaster
+from app.services.dedupe import dedupe_filter
+from app.services.reconciler import reconciler
+from app.services.rollups import vote_rollups
+from app.services.poll_cache import poll_cache
+from app.services.poll_registry import poll_registry
+from app.services.pubsub import create_client_manager, AsyncUnixSocketManager
+from app.services import metrics
+from app.services.admission import AdmissionMiddleware, admission
+from app.services.admin_auth import require_admin
+from app.services.query_profiler import QueryProfilerMiddleware, query_profiler
+from app.services.read_routing import read_router
+from app.services.counters import vote_counters
+from app.services.lifecycle import LifecycleMiddleware, lifecycle, warm_pool
+from app.services.serializer import FastJSONResponse
+from app.database import Database
+from app.logging_config import RequestIdMiddleware, configure_logging, current_levels, set_levels, shutdown_logging
 import os
 
-# 创建FastAPI应用
-app = FastAPI(
-    title="投票系统API",
-    description="简化版实时投票系统",
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc"
-)
-
-# 配置CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 生产环境应该限制具体域名
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# 创建Socket.IO实例
-sio = socketio.AsyncServer(
-    async_mode='asgi',
-    cors_allowed_origins="*",
-    logger=True,
-    engineio_logger=True
-)
-
-# 包含API路由
-app.include_router(polls.router, prefix="/api", tags=["polls"])
-
-# Socket.IO事件处理
-@sio.event
-async def connect(sid, environ):
-    print(f"客户端 {sid} 已连接")
-    # 可以在这里发送当前统计数据
-    await sio.emit('message', {'data': '欢迎连接投票系统'}, room=sid)
-
-@sio.event
-async def disconnect(sid):
-    print(f"客户端 {sid} 已断开连接")
-
-@sio.event
-async def join_poll(sid, data):
-    """加入特定投票房间"""
-    poll_id = data.get('poll_id')
-    if poll_id:
-        await sio.enter_room(sid, f"poll_{poll_id}")
-        print(f"客户端 {sid} 加入投票房间 poll_{poll_id}")
-
-# 广播投票更新的函数
-async def broadcast_vote_update(poll_id: int, statistics: dict):
-    """向所有连接的客户端广播投票更新"""
-    await sio.emit('vote_update', statistics, room=f"poll_{poll_id}")
-
-# 将Socket.IO集成到FastAPI
-socket_app = socketio.ASGIApp(sio, app)
-
-# 健康检查端点
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy", "message": "投票系统运行正常"}
+logger = logging.getLogger(__name__)
+
+def instrument_database(database: Database):
+    """引擎级指标与 SQL 剖析（每个 Database 只登记一次）"""
+    if database.instrumented:
+        return
+    database.instrumented = True
+    metrics.instrument_engine(database.async_engine.sync_engine, "async", database.pool_capacity)
+    query_profiler.instrument(database.async_engine.sync_engine)
+    for i, replica_engine in enumerate(database.replica_engines):
+        metrics.instrument_engine(replica_engine.sync_engine, f"replica{i}", database.pool_capacity)
+        query_profiler.instrument(replica_engine.sync_engine)
+
+def bind_services(database: Database):
+    """
+    进程内共享的后台任务与读写路由使用该应用的数据库
+    写缓冲、投票日志、缓存等状态按进程共享，由正在运行（已进入 lifespan）的应用绑定
+    """
+    for service in (vote_buffer, vote_log, dedupe_filter, reconciler, vote_rollups):
+        service.session_factory = database.async_session
+    read_router.bind(database.async_session, database.replica_engines)
+
+def warmup_steps(database: Database):
+    """启动预热步骤：连接池 -> 进行中问卷快照 -> 防重复过滤器"""
+    async def preload_polls():
+        async with database.async_session() as db:
+            return await polls.preload_snapshots(db)
+
+    return [
+        ("pool", lambda: warm_pool(database.async_engine)),
+        *((f"replica{i}_pool", lambda e=e: warm_pool(e)) for i, e in enumerate(database.replica_engines)),
+        ("polls", preload_polls),
+        ("dedupe", dedupe_filter.wait_ready),
+    ]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动/停止后台任务"""
+    # 上一次关闭时已停止日志写出线程（同一进程内再次启动，如测试）
+    configure_logging()
+    database: Database = app.state.database
+    broadcaster: VoteBroadcaster = app.state.broadcaster
+    bind_services(database)
+    if vote_buffer.enabled:
+        vote_buffer.start()
+    if vote_log.enabled:
+        # 重放上次未写入数据库的日志后才开始受理投票
+        await vote_log.start()
+    # 后台预热防重复过滤器，预热完成前所有投票回源数据库校验
+    dedupe_filter.start()
+    # 后台按水位线增量对账 vote_count 与投票记录
+    reconciler.start()
+    # 后台增量汇总投票时间序列
+    vote_rollups.start()
+    # 后台检测只读副本的复制延迟
+    read_router.start()
+    loop_lag_monitor = asyncio.create_task(metrics.monitor_loop_lag())
+    # 后台预热连接池、问卷快照与防重复过滤器，完成后 /ready 返回 200
+    lifecycle.start(warmup_steps(database))
+    yield
+    # 停止受理写请求，等待进行中的请求完成
+    await lifecycle.drain()
+    loop_lag_monitor.cancel()
+    await read_router.stop()
+    await vote_rollups.stop()
+    await reconciler.stop()
+    await dedupe_filter.stop()
+    # 关闭时排空写缓冲，确保已受理的投票全部落库
+    await vote_buffer.stop()
+    await vote_log.stop()
+    # 发出尚在等待中的票数推送
+    await broadcaster.close()
+    sio = app.state.sio
+    if isinstance(sio.manager, AsyncUnixSocketManager):
+        await sio.manager.close()
+    await database.dispose()
+    # 最后写出队列中剩余的日志（包括上面各步骤的关闭日志）
+    shutdown_logging()
+
+def register_collectors(broadcaster: VoteBroadcaster):
+    """抓取时采集各服务组件的状态（按名称登记，重复创建应用时替换为最新一次）"""
+    metrics.stats_collector("vote_buffer", vote_buffer.snapshot, "投票写缓冲")
+    metrics.stats_collector("vote_log", vote_log.snapshot, "投票日志")
+    metrics.stats_collector("vote_broadcaster", broadcaster.stats, "票数广播器")
+    metrics.stats_collector("poll_cache", poll_cache.stats, "问卷快照缓存")
+    metrics.stats_collector("poll_registry", poll_registry.stats, "问卷注册表")
+    metrics.stats_collector("dedupe_filter", dedupe_filter.stats, "防重复过滤器")
+    metrics.stats_collector("admission", admission.stats, "准入控制")
+    metrics.stats_collector("lifecycle", lifecycle.stats, "应用生命周期")
+
+def create_sio(database: Database) -> socketio.AsyncServer:
+    """创建Socket.IO实例并登记事件处理（配置 SOCKETIO_MANAGER_URL 后通过消息总线跨 worker 分发房间消息）"""
+    sio = socketio.AsyncServer(
+        async_mode='asgi',
+        client_manager=create_client_manager(),
+        cors_allowed_origins="*",
+        # 帧日志默认静默，将 socketio / engineio 日志级别调为 INFO 即可开启
+        logger=logging.getLogger("socketio.server"),
+        engineio_logger=logging.getLogger("engineio.server"),
+    )
+
+    @sio.event
+    async def connect(sid, environ):
+        logger.debug("Socket.IO 客户端已连接", extra={"sid": sid})
+        # 可以在这里发送当前统计数据
+        await sio.emit('message', {'data': '欢迎连接投票系统'}, room=sid)
+
+    @sio.event
+    async def disconnect(sid):
+        logger.debug("Socket.IO 客户端已断开连接", extra={"sid": sid})
+
+    @sio.event
+    async def join_poll(sid, data):
+        """
+        加入特定投票房间（pollId 为问卷ID、slug 或 "current"）
+        通过 ack 返回追赶消息：客户端带上已有快照的 epoch / version 时返回此后的增量，否则返回完整快照；
+        问卷元数据与快照均来自内存缓存，重连风暴不会逐个查询数据库，客户端也无需再请求 /api/poll
+        """
+        poll_ref = data.get('poll_id') or data.get('pollId')
+        if not poll_ref:
+            return None
+        try:
+            version = int(data['version']) if data.get('version') is not None else None
+        except (TypeError, ValueError):
+            version = None
+        # 会话在首次执行查询时才占用连接，缓存命中时不访问数据库
+        async with database.async_session() as db:
+            if poll_ref == 'current':
+                poll = await poll_registry.current(db)
+            else:
+                poll = await poll_registry.resolve(db, str(poll_ref))
+            snapshot = await polls.poll_snapshot(db, poll) if poll is not None else None
+        if snapshot is None:
+            return None
+        await sio.enter_room(sid, f"poll_{poll.poll_id}")
+        logger.debug("Socket.IO 客户端加入投票房间", extra={"sid": sid, "room": f"poll_{poll.poll_id}"})
+        return poll_cache.catch_up(snapshot, data.get('epoch'), version)
+
+    metrics.instrument_socketio(sio)
+    return sio
+
+def create_app(database: Optional[Database] = None) -> FastAPI:
+    """
+    创建应用：数据库引擎、FastAPI 实例、中间件、路由、Socket.IO 服务与广播器
+    未传入 database 时按环境变量创建；Socket.IO 与 FastAPI 组合后的 ASGI 应用为 app.state.socket_app
+    """
+    # 日志写入内存队列，由后台线程格式化输出
+    configure_logging()
+    database = database or Database()
+    instrument_database(database)
+
+    app = FastAPI(
+        title="投票系统API",
+        description="简化版实时投票系统",
+        version="1.0.0",
+        docs_url="/docs",
+        redoc_url="/redoc",
+        lifespan=lifespan
+    )
+
+    # 准入控制：限流与负载保护（位于 CORS 之内，拒绝响应同样带跨域头）
+    app.add_middleware(AdmissionMiddleware)
+    # 停机期间拒绝写请求，并统计进行中的请求
+    app.add_middleware(LifecycleMiddleware)
+
+    # 配置CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # 生产环境应该限制具体域名
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # 请求耗时、状态码与每请求 SQL 语句数
+    app.add_middleware(metrics.MetricsMiddleware)
+    # 按请求的 SQL 剖析与 N+1 检测（QUERY_PROFILER=true 时生效）
+    app.add_middleware(QueryProfilerMiddleware)
+    # 为每个请求分配 request_id（最外层，使其他中间件的日志也带上 request_id）
+    app.add_middleware(RequestIdMiddleware)
+
+    # 包含API路由
+    app.include_router(polls.router, prefix="/api", tags=["polls"])
+
+    sio = create_sio(database)
+
+    # 广播投票更新的函数
+    async def broadcast_vote_update(poll_id: int, update: dict):
+        """向订阅该问卷的客户端广播票数增量（由广播器合并、限频后调用）"""
+        await sio.emit('vote_update', update, room=f"poll_{poll_id}")
+
+    # 每个应用有自己的广播器，只推送到本应用的 Socket.IO 服务
+    broadcaster = VoteBroadcaster(emit=broadcast_vote_update)
+    register_collectors(broadcaster)
+
+    # 健康检查端点（进程存活即返回 200）
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy", "message": "投票系统运行正常"}
+
+    # 就绪检查：预热完成前与停机期间返回 503
+    @app.get("/ready")
+    async def readiness_check():
+        status_code = 200 if lifecycle.ready else 503
+        return FastJSONResponse({"status": lifecycle.state}, status_code=status_code)
+
+    # Prometheus 指标
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+    # 日志级别：查看 / 运行时调整（如 {"loggers": {"sqlalchemy.engine": "INFO"}} 开启 SQL 回显），需管理令牌
+    @app.get("/logging", dependencies=[Depends(require_admin)])
+    async def get_logging_levels():
+        return current_levels()
+
+    @app.post("/logging", dependencies=[Depends(require_admin)])
+    async def update_logging_levels(loggers: dict = Body(..., embed=True)):
+        try:
+            set_levels(loggers)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return current_levels()
+
+    # 最近请求的 SQL 剖析结果（含语句与调用位置）：只在开启 QUERY_PROFILER 时登记，需管理令牌
+    if query_profiler.enabled:
+        @app.get("/debug/queries", dependencies=[Depends(require_admin)])
+        async def debug_queries(limit: int = 20):
+            profiles = list(query_profiler.recent)[-limit:] if limit > 0 else []
+            return {
+                "enabled": query_profiler.enabled,
+                "requests": [profile.summary() for profile in reversed(profiles)],
+            }
+
+    # 投票写入指标（写缓冲批量大小、落库延迟、队列深度，防重复过滤器命中情况，对账进度）
+    @app.get("/ingest/stats")
+    async def ingest_stats():
+        return {
+            **vote_buffer.snapshot(),
+            "dedupe": dedupe_filter.stats(),
+            "reconciler": reconciler.stats(),
+            "rollups": vote_rollups.stats(),
+            "admission": admission.stats(),
+            "read_routing": read_router.stats(),
+            "counters": vote_counters.stats(),
+            "vote_log": vote_log.snapshot(),
+            "lifecycle": lifecycle.stats(),
+        }
+
+    app.state.database = database
+    app.state.broadcaster = broadcaster
+    app.state.sio = sio
+    # 将Socket.IO集成到FastAPI
+    app.state.socket_app = socketio.ASGIApp(sio, app)
+    return app
+
+def create_socket_app() -> socketio.ASGIApp:
+    """uvicorn 工厂入口：创建应用并返回组合了 Socket.IO 的 ASGI 应用"""
+    return create_app().state.socket_app
 
 if __name__ == "__main__":
     import uvicorn
+    from dotenv import load_dotenv
+    # 启动入口加载 .env（重载模式下的工作进程继承这些环境变量）
+    load_dotenv()
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
     
     uvicorn.run(
-        "app.main:socket_app",
+        "app.main:create_socket_app",
+        factory=True,
         host=host,
         port=port,
         reload=True,
-        log_level="info"
+        log_level="info",
     ) 
\ No newline at end of file
@@ -1,26 +1,37 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, BINARY, Index
 from sqlalchemy.dialects.mysql import BIGINT
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
+# 主键类型：MySQL 使用无符号 BIGINT，SQLite 下退化为 INTEGER 以支持自增（测试环境）
+ID_TYPE = BIGINT(unsigned=True).with_variant(Integer, "sqlite")
+
 class Poll(Base):
     """投票问卷表"""
     __tablename__ = "polls"
+    __table_args__ = (
+        Index("uk_polls_slug", "slug", unique=True),
+        Index("idx_polls_status_window", "status", "starts_at", "ends_at"),
+    )
     
-    poll_id = Column(BIGINT(unsigned=True), primary_key=True, autoincrement=True, comment="问卷唯一主键，自增")
+    poll_id = Column(ID_TYPE, primary_key=True, autoincrement=True, comment="问卷唯一主键，自增")
     title = Column(String(255), nullable=False, comment="问卷标题")
+    slug = Column(String(64), nullable=True, comment="问卷短标识（可选，用于按 slug 访问问卷）")
+    status = Column(String(16), nullable=False, default="active", server_default="active", comment="状态：draft / active / closed")
+    starts_at = Column(DateTime, nullable=True, comment="开始投票时间（UTC），为空表示立即开始")
+    ends_at = Column(DateTime, nullable=True, comment="结束投票时间（UTC），为空表示不限")
     created_at = Column(DateTime, nullable=False, server_default=func.current_timestamp(), comment="创建时间")
     
     # 关系映射
-    options = relationship("Option", back_populates="poll", cascade="all, delete-orphan")
+    options = relationship("Option", back_populates="poll", cascade="all, delete-orphan", order_by="Option.option_id")
 
 class Option(Base):
     """投票选项表"""
     __tablename__ = "options"
     
-    option_id = Column(BIGINT(unsigned=True), primary_key=True, autoincrement=True, comment="选项唯一主键，自增")
-    poll_id = Column(BIGINT(unsigned=True), ForeignKey("polls.poll_id", ondelete="CASCADE", onupdate="CASCADE"), nullable=False, comment="所属问卷ID")
+    option_id = Column(ID_TYPE, primary_key=True, autoincrement=True, comment="选项唯一主键，自增")
+    poll_id = Column(ID_TYPE, ForeignKey("polls.poll_id", ondelete="CASCADE", onupdate="CASCADE"), nullable=False, comment="所属问卷ID")
     label = Column(String(100), nullable=False, comment="选项文本")
     vote_count = Column(Integer, nullable=False, default=0, comment="累计票数缓存")
     
@@ -31,11 +42,62 @@ class Option(Base):
 class Vote(Base):
     """投票记录表"""
     __tablename__ = "votes"
+    # SQLite 默认会复用已删除的最大ID，归档 / 重置后新投票的 vote_id 可能落在各水位线之前；AUTOINCREMENT 保证单调递增
+    __table_args__ = {"sqlite_autoincrement": True}
     
-    vote_id = Column(BIGINT(unsigned=True), primary_key=True, autoincrement=True, comment="投票记录唯一主键，自增")
-    option_id = Column(BIGINT(unsigned=True), ForeignKey("options.option_id", ondelete="CASCADE", onupdate="CASCADE"), nullable=False, comment="所投选项ID")
+    vote_id = Column(ID_TYPE, primary_key=True, autoincrement=True, comment="投票记录唯一主键，自增")
+    option_id = Column(ID_TYPE, ForeignKey("options.option_id", ondelete="CASCADE", onupdate="CASCADE"), nullable=False, comment="所投选项ID")
     voted_at = Column(DateTime, nullable=False, server_default=func.current_timestamp(), comment="投票时间戳")
     client_id = Column(String(64), nullable=True, comment="客户端标识")
     
     # 关系映射
-    option = relationship("Option", back_populates="votes") 
\ No newline at end of file
+    option = relationship("Option", back_populates="votes")
+
+class PollVoter(Base):
+    """问卷投票人表（每个客户端在每个问卷只能有一行，用于防重复投票）"""
+    __tablename__ = "poll_voters"
+    __table_args__ = (Index("idx_poll_voters_voted_at", "voted_at"),)
+    
+    poll_id = Column(ID_TYPE, ForeignKey("polls.poll_id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True, autoincrement=False, comment="问卷ID")
+    client_key = Column(BINARY(16), primary_key=True, comment="客户端标识摘要（SHA-256 前16字节）")
+    voted_at = Column(DateTime, nullable=False, server_default=func.current_timestamp(), comment="投票时间戳")
+
+class TallyCheckpoint(Base):
+    """票数对账检查点表（截至水位线 votes 表中各选项的票数）"""
+    __tablename__ = "tally_checkpoints"
+    
+    option_id = Column(ID_TYPE, ForeignKey("options.option_id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True, autoincrement=False, comment="选项ID")
+    counted_votes = Column(BigInteger, nullable=False, default=0, comment="截至水位线的投票记录数")
+
+class Watermark(Base):
+    """后台增量任务水位线表（按任务名记录已处理到的 vote_id）"""
+    __tablename__ = "watermarks"
+    
+    name = Column(String(32), primary_key=True, comment="任务名")
+    vote_id = Column(BigInteger, nullable=False, default=0, comment="已处理到的 vote_id（含）")
+    updated_at = Column(DateTime, nullable=False, server_default=func.current_timestamp(), onupdate=func.current_timestamp(), comment="更新时间")
+
+class ReplicaHeartbeat(Base):
+    """主库心跳表（读写分离按副本上读到的心跳时间戳计算复制延迟）"""
+    __tablename__ = "replica_heartbeats"
+    
+    name = Column(String(32), primary_key=True, comment="心跳名")
+    beat_ms = Column(BigInteger, nullable=False, default=0, comment="主库写入心跳时的 UNIX 毫秒时间戳")
+
+class VoteRollup(Base):
+    """投票时间序列汇总表（按选项、时间粒度、时间桶累计票数）"""
+    __tablename__ = "vote_rollups"
+    __table_args__ = (Index("idx_vote_rollups_bucket", "resolution", "bucket_start"),)
+    
+    option_id = Column(ID_TYPE, ForeignKey("options.option_id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True, autoincrement=False, comment="选项ID")
+    resolution = Column(Integer, primary_key=True, autoincrement=False, comment="时间粒度（秒）：1 / 60 / 3600")
+    bucket_start = Column(BigInteger, primary_key=True, autoincrement=False, comment="时间桶起点（UTC 秒级时间戳）")
+    vote_count = Column(Integer, nullable=False, default=0, comment="该时间桶内的票数")
+
+class OptionCounterShard(Base):
+    """选项票数分片表（开启计数分片时票数增量分散写入各分片行，选项票数 = options.vote_count + 各分片之和）"""
+    __tablename__ = "option_counter_shards"
+    
+    option_id = Column(ID_TYPE, ForeignKey("options.option_id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True, autoincrement=False, comment="选项ID")
+    shard = Column(Integer, primary_key=True, autoincrement=False, comment="分片号")
+    vote_count = Column(Integer, nullable=False, default=0, comment="该分片累计的票数")
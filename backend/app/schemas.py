@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from datetime import datetime
+from pydantic import BaseModel, Field, field_validator, model_validator
+from datetime import datetime, timezone
 from typing import List, Optional
 
 # 基础模式
@@ -21,6 +21,32 @@ class VoteCreate(VoteBase):
 
 class PollCreate(PollBase):
     options: List[OptionCreate] = Field(..., description="选项列表")
+    slug: Optional[str] = Field(None, max_length=64, pattern="^[a-z0-9][a-z0-9-]*$", description="问卷短标识（小写字母、数字与连字符）")
+    status: str = Field("active", pattern="^(draft|active|closed)$", description="状态")
+    starts_at: Optional[datetime] = Field(None, description="开始投票时间（UTC）")
+    ends_at: Optional[datetime] = Field(None, description="结束投票时间（UTC）")
+    
+    @field_validator("slug")
+    @classmethod
+    def slug_not_numeric(cls, value):
+        # 纯数字会与问卷ID混淆
+        if value is not None and value.isdigit():
+            raise ValueError("slug 不能为纯数字")
+        return value
+    
+    @field_validator("starts_at", "ends_at")
+    @classmethod
+    def to_utc(cls, value):
+        # 带时区的时间转换为 UTC 存储（不带时区的按 UTC 处理）
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    
+    @model_validator(mode="after")
+    def check_window(self):
+        if self.starts_at and self.ends_at and self.ends_at <= self.starts_at:
+            raise ValueError("结束时间须晚于开始时间")
+        return self
 
 # 响应模式
 class Option(OptionBase):
@@ -41,6 +67,10 @@ class Vote(VoteBase):
 
 class Poll(PollBase):
     poll_id: int
+    slug: Optional[str] = None
+    status: str = "active"
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
     created_at: datetime
     options: List[Option] = []
     
@@ -0,0 +1,22 @@
+"""
+运维端点鉴权
+运行时调整日志级别、查看 SQL 剖析明细等端点只对持有 ADMIN_TOKEN 的请求开放：
+- 请求头 Authorization: Bearer <ADMIN_TOKEN>，令牌不符返回 401
+- 未配置 ADMIN_TOKEN 时这些端点一律返回 404（默认关闭）
+"""
+import os
+import secrets
+
+from fastapi import HTTPException, Request
+
+# 运维端点令牌，留空关闭运维端点
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def require_admin(request: Request):
+    """运维端点的依赖项：校验 Bearer 令牌"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="需要管理令牌", headers={"WWW-Authenticate": "Bearer"})
@@ -0,0 +1,260 @@
+"""
+准入控制
+在请求进入路由、占用数据库连接之前快速拒绝超额流量，使正常用户的延迟不受刷票流量拖累：
+- 按路由配置的令牌桶限流，以客户端 IP 为键（RATE_LIMITS，默认关闭），超额返回 429；
+  请求来自 TRUSTED_PROXIES 中的反向代理 / 负载均衡时取 X-Forwarded-For 中最后一个不可信的地址，
+  否则经代理或 NAT 的所有用户共用同一个桶
+- 投票接口另按派生的 client_id 限流（VOTE_CLIENT_RATE_LIMIT），由路由调用
+- 负载保护：连接池等待队列或事件循环延迟超过阈值时，对 /api/ 下的写请求直接返回 503；
+  读请求大多由内存快照直接返回、不占用连接，不受影响
+限流状态保存在各 worker 内存中，多 worker 部署时每个 worker 各自限流
+"""
+import ipaddress
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# 按路由的 IP 限流："METHOD 路径=每秒令牌数:桶容量"，逗号分隔，留空关闭（如 POST /api/poll/vote=20:40）
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+# 可信的反向代理地址（IP 或网段，逗号分隔），来自这些地址的请求按 X-Forwarded-For 识别客户端 IP
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "")
+# 投票接口按 client_id 限流（每秒令牌数:桶容量），留空关闭
+VOTE_CLIENT_RATE_LIMIT = os.getenv("VOTE_CLIENT_RATE_LIMIT", "1:5")
+# 连接池的连接持续全部借出（新请求开始排队）超过该值（毫秒）时拒绝新请求（0 关闭）
+LOAD_SHED_POOL_SATURATED_MS = float(os.getenv("LOAD_SHED_POOL_SATURATED_MS", "200"))
+# 事件循环延迟超过该值（毫秒）时拒绝新请求（0 关闭）
+LOAD_SHED_LOOP_LAG_MS = float(os.getenv("LOAD_SHED_LOOP_LAG_MS", "250"))
+# 负载保护作用的路径前缀（健康检查、指标等接口不受影响）
+LOAD_SHED_PREFIX = "/api/"
+# 负载保护不拒绝的请求方法（读请求大多命中内存快照，不占用连接池）
+LOAD_SHED_EXEMPT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# 每个限流器最多跟踪的键数，超出后淘汰最久未访问的键
+RATE_LIMIT_MAX_KEYS = 100000
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+admission_rejected = metrics.registry.counter(
+    "admission_rejected_total", "准入控制拒绝的请求数", ("reason",)
+)
+
+
+def parse_rate(spec: str) -> Optional[Tuple[float, float]]:
+    """解析 "每秒令牌数:桶容量"，留空返回 None"""
+    spec = spec.strip()
+    if not spec:
+        return None
+    rate, _, burst = spec.partition(":")
+    return float(rate), float(burst or rate)
+
+
+def parse_rate_limits(spec: str) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """解析 "POST /api/poll/vote=20:40,..." 形式的按路由限流配置"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, rate = item.partition("=")
+        method, _, path = route.strip().partition(" ")
+        limits[(method.upper(), path.strip())] = parse_rate(rate)
+    return limits
+
+
+def parse_networks(spec: str) -> List[Network]:
+    """解析逗号分隔的 IP / 网段"""
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip()]
+
+
+def _trusted(address: str, networks: Sequence[Network]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_ip(scope, trusted_proxies: Sequence[Network]) -> str:
+    """
+    请求的客户端 IP：直连地址不是可信代理时即为客户端；
+    否则从右向左遍历 X-Forwarded-For，跳过可信代理，取第一个不可信的地址（左侧的条目可由客户端伪造）
+    """
+    client = scope.get("client")
+    peer = client[0] if client else ""
+    if not trusted_proxies or not _trusted(peer, trusted_proxies):
+        return peer
+    forwarded = []
+    for name, value in scope.get("headers", ()):
+        if name == b"x-forwarded-for":
+            forwarded.extend(part.strip() for part in value.decode("latin-1").split(","))
+    for address in reversed(forwarded):
+        if address and not _trusted(address, trusted_proxies):
+            return address
+    return forwarded[0] if forwarded and forwarded[0] else peer
+
+
+class TokenBucketLimiter:
+    """按键的令牌桶：每秒补充 rate 个令牌，最多积累 burst 个"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # 键 -> [剩余令牌数, 上次更新时间]，按最近访问排序
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.rejected = 0
+
+    def acquire(self, key: str, now: Optional[float] = None) -> float:
+        """取一个令牌：成功返回 0，否则返回需等待的秒数"""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        self.rejected += 1
+        return (1 - bucket[0]) / self.rate
+
+    def reset(self):
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class LoadShedder:
+    """连接池排队或事件循环延迟超过阈值时判定为过载"""
+
+    def __init__(
+        self,
+        pool_saturated_ms: float = LOAD_SHED_POOL_SATURATED_MS,
+        loop_lag_ms: float = LOAD_SHED_LOOP_LAG_MS,
+    ):
+        self.pool_saturated = pool_saturated_ms / 1000
+        self.loop_lag = loop_lag_ms / 1000
+        self.shed = 0
+
+    def overloaded(self) -> Optional[str]:
+        """过载时返回原因（pool / loop_lag），否则返回 None"""
+        if self.pool_saturated > 0 and metrics.pool_saturated_for() >= self.pool_saturated:
+            return "pool"
+        if self.loop_lag > 0 and metrics.current_loop_lag() >= self.loop_lag:
+            return "loop_lag"
+        return None
+
+
+class AdmissionController:
+    """按路由 IP 限流 + 投票 client_id 限流 + 负载保护"""
+
+    def __init__(
+        self,
+        rate_limits: str = RATE_LIMITS,
+        vote_client_rate: str = VOTE_CLIENT_RATE_LIMIT,
+        shedder: Optional[LoadShedder] = None,
+        trusted_proxies: str = TRUSTED_PROXIES,
+    ):
+        self.route_limiters = {
+            route: TokenBucketLimiter(*rate)
+            for route, rate in parse_rate_limits(rate_limits).items() if rate is not None
+        }
+        client_rate = parse_rate(vote_client_rate)
+        self.vote_client_limiter = TokenBucketLimiter(*client_rate) if client_rate else None
+        self.shedder = shedder or LoadShedder()
+        self.trusted_proxies = parse_networks(trusted_proxies)
+
+    def check_request(self, method: str, path: str, client_ip: str) -> Optional[Tuple[int, str, float]]:
+        """请求进入路由前的检查：拒绝时返回 (状态码, 原因, Retry-After 秒数)"""
+        if path.startswith(LOAD_SHED_PREFIX) and method not in LOAD_SHED_EXEMPT_METHODS:
+            reason = self.shedder.overloaded()
+            if reason is not None:
+                self.shedder.shed += 1
+                admission_rejected.inc(labels=(reason,))
+                return 503, reason, 1.0
+        limiter = self.route_limiters.get((method, path))
+        if limiter is not None:
+            retry_after = limiter.acquire(client_ip)
+            if retry_after > 0:
+                admission_rejected.inc(labels=("rate_limit",))
+                return 429, "rate_limit", retry_after
+        return None
+
+    def check_vote_client(self, client_id: str) -> float:
+        """投票接口按 client_id 限流：允许返回 0，否则返回需等待的秒数"""
+        if self.vote_client_limiter is None:
+            return 0.0
+        retry_after = self.vote_client_limiter.acquire(client_id)
+        if retry_after > 0:
+            admission_rejected.inc(labels=("client_rate_limit",))
+        return retry_after
+
+    def reset(self):
+        for limiter in self.route_limiters.values():
+            limiter.reset()
+        if self.vote_client_limiter is not None:
+            self.vote_client_limiter.reset()
+
+    def stats(self) -> dict:
+        return {
+            "tracked_ips": sum(len(limiter) for limiter in self.route_limiters.values()),
+            "rate_limited": sum(limiter.rejected for limiter in self.route_limiters.values()),
+            "tracked_clients": len(self.vote_client_limiter) if self.vote_client_limiter else 0,
+            "client_rate_limited": self.vote_client_limiter.rejected if self.vote_client_limiter else 0,
+            "shed": self.shedder.shed,
+        }
+
+
+REJECT_MESSAGES = {
+    "rate_limit": "请求过于频繁，请稍后重试",
+    "pool": "服务繁忙，请稍后重试",
+    "loop_lag": "服务繁忙，请稍后重试",
+}
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After 取整秒，至少 1 秒"""
+    return str(max(1, int(seconds + 0.999)))
+
+
+class AdmissionMiddleware:
+    """ASGI 中间件：在路由与数据库之前执行限流与负载保护"""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or admission
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rejected = self.controller.check_request(
+            scope["method"], scope["path"], client_ip(scope, self.controller.trusted_proxies)
+        )
+        if rejected is None:
+            await self.app(scope, receive, send)
+            return
+        status, reason, retry_after = rejected
+        logger.debug("准入控制拒绝请求", extra={"path": scope["path"], "reason": reason})
+        body = ('{"detail":"%s"}' % REJECT_MESSAGES[reason]).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", retry_after_header(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# 全局准入控制（main 中登记中间件，投票路由调用 check_vote_client）
+admission = AdmissionController()
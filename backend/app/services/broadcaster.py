@@ -0,0 +1,131 @@
+"""
+投票更新广播器
+投票路径只负责发出信号，广播器按问卷合并突发更新：
+每个 poll_{id} 房间每秒最多推送 K 次，每次只携带自上次推送以来票数发生变化的选项及版本号；
+baseVersion 为上次推送的版本号，客户端持有的版本不早于它（且 epoch 相同）时才能据此推进自己的版本号
+每个应用有自己的广播器（app.state.broadcaster），推送到该应用的 Socket.IO 服务
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import Request
+
+from app.services.poll_cache import PollSnapshot
+
+logger = logging.getLogger(__name__)
+
+# 每个问卷房间每秒最多推送次数
+VOTE_BROADCAST_MAX_RATE = float(os.getenv("VOTE_BROADCAST_MAX_RATE", "5"))
+
+Emitter = Callable[[int, dict], Awaitable[None]]
+
+
+class VoteBroadcaster:
+    """按问卷合并、限频的票数增量广播器"""
+
+    def __init__(self, max_rate: float = VOTE_BROADCAST_MAX_RATE, emit: Optional[Emitter] = None):
+        self.min_interval = 1 / max_rate if max_rate > 0 else 0.0
+        self._emit = emit
+        # 每个问卷最新的快照（待推送）
+        self._latest: Dict[int, PollSnapshot] = {}
+        # 每个问卷上次推送时各选项的票数
+        self._emitted_counts: Dict[int, Dict[int, int]] = {}
+        self._emitted_versions: Dict[int, int] = {}
+        self._last_emit_at: Dict[int, float] = {}
+        self._scheduled: Dict[int, asyncio.Task] = {}
+        self.signals = 0
+        self.emits = 0
+        self.coalesced = 0
+
+    def notify(self, snapshot: PollSnapshot):
+        """投票路径调用：登记最新快照，必要时安排一次推送（不阻塞调用方）"""
+        if self._emit is None:
+            return
+        poll_id = snapshot.tally.poll_id
+        latest = self._latest.get(poll_id)
+        if latest is not None and latest.version >= snapshot.version:
+            return
+        self._latest[poll_id] = snapshot
+        self.signals += 1
+        scheduled = self._scheduled.get(poll_id)
+        if scheduled is not None and not scheduled.done():
+            # 已有待执行的推送，本次更新将被合并
+            self.coalesced += 1
+            return
+        last = self._last_emit_at.get(poll_id)
+        delay = 0.0 if last is None else max(0.0, last + self.min_interval - time.monotonic())
+        self._scheduled[poll_id] = asyncio.get_running_loop().create_task(
+            self._emit_later(poll_id, delay)
+        )
+
+    def build_update(self, poll_id: int) -> Optional[dict]:
+        """计算自上次推送以来发生变化的选项，无变化时返回 None"""
+        snapshot = self._latest.get(poll_id)
+        if snapshot is None:
+            return None
+        emitted = self._emitted_counts.setdefault(poll_id, {})
+        changed = [
+            {"id": str(opt.option_id), "votes": opt.vote_count}
+            for opt in snapshot.tally.options
+            if emitted.get(opt.option_id) != opt.vote_count
+        ]
+        if not changed:
+            return None
+        for opt in snapshot.tally.options:
+            emitted[opt.option_id] = opt.vote_count
+        base_version = self._emitted_versions.get(poll_id, 0)
+        self._emitted_versions[poll_id] = snapshot.version
+        return {
+            "pollId": str(poll_id),
+            "epoch": snapshot.epoch,
+            "baseVersion": base_version,
+            "version": snapshot.version,
+            "options": changed,
+            "totalVotes": snapshot.tally.total_votes,
+        }
+
+    async def _emit_later(self, poll_id: int, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._emit_now(poll_id)
+
+    async def _emit_now(self, poll_id: int):
+        # 先记录推送时间并移除调度标记，推送期间到达的新信号将按限频安排下一次推送
+        self._last_emit_at[poll_id] = time.monotonic()
+        self._scheduled.pop(poll_id, None)
+        update = self.build_update(poll_id)
+        if update is None:
+            return
+        self.emits += 1
+        try:
+            await self._emit(poll_id, update)
+        except Exception:
+            logger.warning("广播投票更新失败", extra={"poll_id": poll_id}, exc_info=True)
+
+    async def close(self):
+        """取消等待中的推送并立即发出，确保最后的票数送达客户端"""
+        pending = [(poll_id, task) for poll_id, task in self._scheduled.items() if not task.done()]
+        for poll_id, task in pending:
+            task.cancel()
+        for poll_id, task in pending:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            await self._emit_now(poll_id)
+
+    def stats(self) -> dict:
+        return {
+            "signals": self.signals,
+            "emits": self.emits,
+            "coalesced": self.coalesced,
+            "scheduled": len(self._scheduled),
+        }
+
+
+def get_broadcaster(request: Request) -> VoteBroadcaster:
+    """依赖项：当前应用的广播器"""
+    return request.app.state.broadcaster
@@ -0,0 +1,235 @@
+"""
+批量投票写入（现场终端 / 合作方离线收集后回放）
+整批投票在一个事务内完成，语句数与记录数无关：
+- 逐条校验 optionId / userToken / votedAt，批内按 (问卷, 客户端) 去重
+- 按选项经问卷注册表解析所属问卷，问卷不在投票时间内（草稿、已结束、未开始）的记录逐条拒绝
+- 按问卷分块查询 poll_voters 排除已投过票的客户端
+- 多行 INSERT IGNORE 登记投票人、多行 INSERT 写入投票记录，一条语句按选项累加聚合后的票数增量
+- 登记投票人的影响行数少于预期说明有并发投票抢先写入，回滚后重新查询已投票客户端再试一次
+"""
+import logging
+import os
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.services.client_keys import client_key
+from app.services.counters import vote_counters
+from app.services.poll_registry import PollMeta, poll_registry, utcnow
+from app.services.voting import PollTally, insert_ignore, read_poll_counts
+
+logger = logging.getLogger(__name__)
+
+votes_table = models.Vote.__table__
+voters_table = models.PollVoter.__table__
+
+# 单次请求最多记录数
+VOTE_BULK_MAX_RECORDS = int(os.getenv("VOTE_BULK_MAX_RECORDS", "50000"))
+# 多行语句每条最多包含的行数
+VOTE_BULK_CHUNK = 1000
+# votedAt 允许超前服务器时间的范围（终端时钟误差）
+VOTED_AT_MAX_SKEW = timedelta(minutes=5)
+# 并发冲突时的重试次数
+VOTE_BULK_RETRIES = 1
+
+CREATED = "created"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+OPTION_NOT_FOUND = "option_not_found"
+POLL_INACTIVE = "poll_inactive"
+
+
+class BulkVoteConflict(Exception):
+    """登记投票人时与并发投票冲突"""
+
+
+@dataclass
+class BulkVote:
+    index: int
+    option_id: int
+    client_id: str
+    voted_at: Optional[datetime]
+    poll_id: int = 0
+    key: bytes = b""
+
+
+@dataclass
+class BulkResult:
+    # 与请求记录一一对应：{"status": ..., "error": ...}
+    results: List[dict]
+    created: List[BulkVote] = field(default_factory=list)
+    tallies: Dict[int, PollTally] = field(default_factory=dict)
+
+    def summary(self) -> Dict[str, int]:
+        counts = Counter(result["status"] for result in self.results)
+        return {
+            status: counts.get(status, 0)
+            for status in (CREATED, DUPLICATE, INVALID, OPTION_NOT_FOUND, POLL_INACTIVE)
+        }
+
+
+def _parse_voted_at(value, now: datetime) -> datetime:
+    """ISO 8601 时间转换为 UTC（不带时区的按 UTC 处理）"""
+    if not isinstance(value, str):
+        raise ValueError("votedAt 须为 ISO 8601 字符串")
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if parsed > now + VOTED_AT_MAX_SKEW:
+        raise ValueError("votedAt 晚于当前时间")
+    return parsed
+
+
+def parse_records(records: Sequence) -> BulkResult:
+    """逐条校验，返回预填了校验错误的结果与待写入的投票（BulkResult.created 暂存有效记录）"""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    result = BulkResult(results=[])
+    for index, record in enumerate(records):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("记录须为对象")
+            try:
+                option_id = int(record.get("optionId"))
+            except (TypeError, ValueError):
+                raise ValueError("无效的选项ID")
+            client_id = record.get("userToken")
+            if not isinstance(client_id, str) or not client_id or len(client_id) > 64:
+                raise ValueError("userToken 须为 1~64 个字符")
+            voted_at = record.get("votedAt")
+            voted_at = _parse_voted_at(voted_at, now) if voted_at is not None else None
+        except ValueError as e:
+            result.results.append({"status": INVALID, "error": str(e)})
+            continue
+        result.results.append({"status": CREATED})
+        result.created.append(BulkVote(index, option_id, client_id, voted_at))
+    return result
+
+
+def _chunks(items: Sequence, size: int = VOTE_BULK_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def _existing_voters(db: AsyncSession, votes: List[BulkVote]) -> set:
+    """已在 poll_voters 中登记的 (问卷, 客户端摘要)"""
+    keys_by_poll: Dict[int, List[bytes]] = defaultdict(list)
+    for vote in votes:
+        keys_by_poll[vote.poll_id].append(vote.key)
+    existing = set()
+    for poll_id, keys in keys_by_poll.items():
+        for chunk in _chunks(keys):
+            rows = await db.execute(
+                select(voters_table.c.client_key).where(
+                    voters_table.c.poll_id == poll_id,
+                    voters_table.c.client_key.in_(chunk),
+                )
+            )
+            existing.update((poll_id, key) for key in rows.scalars())
+    return existing
+
+
+async def _write(db: AsyncSession, votes: List[BulkVote]):
+    """在当前事务内写入已确认不重复的投票"""
+    for chunk in _chunks(votes):
+        claimed = await db.execute(
+            insert_ignore(voters_table).values([{"poll_id": v.poll_id, "client_key": v.key} for v in chunk])
+        )
+        if claimed.rowcount != len(chunk):
+            raise BulkVoteConflict()
+    # 未携带 votedAt 的记录使用数据库默认时间，两类记录分别写入（多行 INSERT 的列须一致）
+    with_time = [v for v in votes if v.voted_at is not None]
+    without_time = [v for v in votes if v.voted_at is None]
+    for chunk in _chunks(with_time):
+        await db.execute(insert(votes_table).values([
+            {"option_id": v.option_id, "client_id": v.client_id, "voted_at": v.voted_at} for v in chunk
+        ]))
+    for chunk in _chunks(without_time):
+        await db.execute(insert(votes_table).values([
+            {"option_id": v.option_id, "client_id": v.client_id} for v in chunk
+        ]))
+    # 一条语句按选项累加各自的增量
+    await vote_counters.add(db, Counter(v.option_id for v in votes))
+
+
+async def write_votes(db: AsyncSession, votes: List[BulkVote]) -> List[BulkVote]:
+    """
+    在当前事务内写入投票，返回实际写入的投票（写缓冲落库、投票日志检查点共用）
+    已在 poll_voters 中登记的客户端（及批内重复）被排除，只有登记成功的投票才写入投票记录与票数增量；
+    登记的影响行数少于预期（并发投票抢先登记）时抛出 BulkVoteConflict，由调用方回滚后重试
+    """
+    existing = await _existing_voters(db, votes)
+    fresh = []
+    for vote in votes:
+        if (vote.poll_id, vote.key) not in existing:
+            existing.add((vote.poll_id, vote.key))
+            fresh.append(vote)
+    await _write(db, fresh)
+    return fresh
+
+
+async def record_votes_bulk(db: AsyncSession, records: Sequence, reserved: Optional[set] = None) -> BulkResult:
+    """
+    批量提交投票，返回逐条结果与写入后各问卷的票数
+    reserved 为进程内已受理但尚未落库的 (问卷, client_id)（写缓冲模式），视为重复
+    """
+    result = parse_records(records)
+    candidates, result.created = result.created, []
+    if not candidates:
+        return result
+
+    # 与单票投票一致：选项所属问卷与问卷状态由问卷注册表判断（命中时不访问数据库）
+    polls_of_options: Dict[int, Optional[PollMeta]] = {}
+    for option_id in sorted({vote.option_id for vote in candidates}):
+        polls_of_options[option_id] = await poll_registry.poll_of_option(db, option_id)
+    now = utcnow()
+
+    valid: List[BulkVote] = []
+    seen = set()
+    for vote in candidates:
+        poll = polls_of_options[vote.option_id]
+        if poll is None:
+            result.results[vote.index] = {"status": OPTION_NOT_FOUND}
+            continue
+        if not poll.is_active(now):
+            result.results[vote.index] = {"status": POLL_INACTIVE, "error": "该问卷不在投票时间内"}
+            continue
+        vote.poll_id = poll.poll_id
+        vote.key = client_key(vote.client_id)
+        if (vote.poll_id, vote.key) in seen or (reserved and (vote.poll_id, vote.client_id) in reserved):
+            result.results[vote.index] = {"status": DUPLICATE}
+            continue
+        seen.add((vote.poll_id, vote.key))
+        valid.append(vote)
+
+    for attempt in range(VOTE_BULK_RETRIES + 1):
+        try:
+            fresh = await write_votes(db, valid)
+            poll_ids = sorted({vote.poll_id for vote in valid})
+            tallies = {}
+            for poll_id in poll_ids:
+                poll = await poll_registry.get(db, poll_id)
+                if poll is not None:
+                    tallies[poll_id] = poll.tally(await read_poll_counts(db, poll_id))
+            await db.commit()
+            break
+        except BulkVoteConflict:
+            await db.rollback()
+            if attempt == VOTE_BULK_RETRIES:
+                raise
+            logger.info("批量投票与并发投票冲突，重试", extra={"records": len(valid)})
+        except Exception:
+            await db.rollback()
+            raise
+
+    fresh_indexes = {vote.index for vote in fresh}
+    for vote in valid:
+        if vote.index not in fresh_indexes:
+            result.results[vote.index] = {"status": DUPLICATE}
+    result.created = fresh
+    result.tallies = tallies
+    return result
@@ -0,0 +1,20 @@
+"""
+客户端标识
+- 未提供 userToken 时由 IP 与 User-Agent 生成稳定的客户端标识（不依赖 Python 按进程加盐的 hash()）
+- 客户端标识统一归一化为定长 16 字节摘要，作为 poll_voters 表的防重复键
+  摘要取 SHA-256 的前 16 字节，MySQL 中可用 UNHEX(LEFT(SHA2(client_id, 256), 32)) 计算出相同的值
+"""
+import hashlib
+
+CLIENT_KEY_SIZE = 16
+
+
+def client_key(client_id: str) -> bytes:
+    """客户端标识 -> 16 字节定长摘要"""
+    return hashlib.sha256(client_id.encode("utf-8")).digest()[:CLIENT_KEY_SIZE]
+
+
+def anonymous_client_id(client_ip: str, user_agent: str) -> str:
+    """由 IP 与 User-Agent 生成客户端标识，各 worker 之间结果一致"""
+    agent_digest = hashlib.sha256(user_agent.encode("utf-8")).hexdigest()[:16]
+    return f"{client_ip}_{agent_digest}"
@@ -0,0 +1,110 @@
+"""
+选项票数计数器
+默认每票直接累加 options.vote_count；两个选项的热门问卷只有两行可写，InnoDB 行锁使所有 worker 的投票在这两行上串行。
+开启分片（VOTE_COUNTER_SHARDS=N）后，增量改为累加写入 option_counter_shards 中该选项的 N 个分片行之一：
+- 分片选择：random（默认，每次随机，同一 worker 内的并发事务也能分散）或 worker（按进程号固定分片）
+- 分片行不存在时由 INSERT ... ON DUPLICATE KEY UPDATE 创建，无需预先初始化
+- 读取票数 = options.vote_count + 该选项各分片之和（同一条查询内的关联子查询，按主键前缀范围扫描），
+  票数快照仍由问卷缓存缓存
+- 已有的 vote_count 作为基数保留，开启时无需迁移；关闭分片后增量重新写回 vote_count，分片中的票数照常计入
+"""
+import logging
+import os
+import random
+from typing import Mapping
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+options_table = models.Option.__table__
+shards_table = models.OptionCounterShard.__table__
+
+# 每个选项的计数分片数，0 或 1 表示不分片（直接累加 options.vote_count）
+VOTE_COUNTER_SHARDS = int(os.getenv("VOTE_COUNTER_SHARDS", "0"))
+# 分片选择方式：random / worker
+VOTE_COUNTER_SHARD_MODE = os.getenv("VOTE_COUNTER_SHARD_MODE", "random")
+
+
+def option_total():
+    """选项当前票数：vote_count 基数 + 各分片之和（用于 options 表上的查询列）"""
+    shard_sum = (
+        select(func.coalesce(func.sum(shards_table.c.vote_count), 0))
+        .where(shards_table.c.option_id == options_table.c.option_id)
+        .scalar_subquery()
+    )
+    return options_table.c.vote_count + shard_sum
+
+
+def _upsert(dialect: str, rows: list):
+    """累加写入分片行：主键冲突时 vote_count 相加"""
+    if dialect == "mysql":
+        stmt = mysql.insert(shards_table).values(rows)
+        return stmt.on_duplicate_key_update(vote_count=shards_table.c.vote_count + stmt.inserted.vote_count)
+    stmt = sqlite.insert(shards_table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[shards_table.c.option_id, shards_table.c.shard],
+        set_={"vote_count": shards_table.c.vote_count + stmt.excluded.vote_count},
+    )
+
+
+class VoteCounters:
+    """按配置把票数增量写入 options.vote_count 或分片行"""
+
+    def __init__(self, shards: int = VOTE_COUNTER_SHARDS, mode: str = VOTE_COUNTER_SHARD_MODE):
+        if mode not in ("random", "worker"):
+            raise ValueError(f"未知的分片选择方式: {mode}")
+        self.shards = shards
+        self.mode = mode
+        self.increments = 0
+
+    @property
+    def sharded(self) -> bool:
+        return self.shards > 1
+
+    def pick_shard(self) -> int:
+        if self.mode == "worker":
+            return os.getpid() % self.shards
+        return random.randrange(self.shards)
+
+    async def add(self, db: AsyncSession, deltas: Mapping[int, int]):
+        """在当前事务内按选项累加票数增量（一条语句）"""
+        deltas = {option_id: delta for option_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        self.increments += 1
+        option_ids = sorted(deltas)
+        if self.sharded:
+            rows = [
+                {"option_id": option_id, "shard": self.pick_shard(), "vote_count": deltas[option_id]}
+                for option_id in option_ids
+            ]
+            await db.execute(_upsert(db.bind.dialect.name, rows))
+        elif len(option_ids) == 1:
+            await db.execute(
+                update(options_table)
+                .where(options_table.c.option_id == option_ids[0])
+                .values(vote_count=options_table.c.vote_count + deltas[option_ids[0]])
+            )
+        else:
+            # vote_count + CASE option_id WHEN ... THEN delta END
+            await db.execute(
+                update(options_table)
+                .where(options_table.c.option_id.in_(option_ids))
+                .values(vote_count=options_table.c.vote_count + case(deltas, value=options_table.c.option_id))
+            )
+
+    def stats(self) -> dict:
+        return {
+            "shards": self.shards if self.sharded else 0,
+            "mode": self.mode,
+            "increments": self.increments,
+        }
+
+
+# 全局计数器（投票、写缓冲落库、批量投票共用）
+vote_counters = VoteCounters()
@@ -0,0 +1,260 @@
+"""
+投票防重复过滤器
+为每个问卷在内存中维护已投票客户端集合（精确集合或布隆过滤器）：
+- 成员为客户端的 16 字节摘要（client_keys.client_key），布隆过滤器直接用摘要生成哈希位置
+- 启动时从 poll_voters 表（防重复的权威来源）预热，投票提交后同步更新；
+  投票记录被归档删除后投票人仍保留，过滤器不受影响
+- 后台按 poll_voters.voted_at 增量同步其他 worker 登记的投票人，水位线取上一轮开始时数据库的当前时间
+  （滞后一轮），晚于登记时间提交的投票人在下一轮重读时登记
+- 判定"一定未投过票"的请求跳过数据库防重复查询，只有"可能重复"的请求才回源校验
+- 只在写缓冲模式（VOTE_INGEST_MODE=buffered）下启用：direct 模式由 poll_voters 的一条
+  INSERT IGNORE 完成防重复，过滤器省不掉这次写入；log 模式在内存中防重复
+"""
+import asyncio
+import logging
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import func, select, tuple_
+
+from app import models
+from app.services.client_keys import client_key
+from app.services.vote_buffer import VOTE_INGEST_MODE
+
+logger = logging.getLogger(__name__)
+
+voters_table = models.PollVoter.__table__
+options_table = models.Option.__table__
+
+# 过滤器类型：bloom（布隆过滤器，默认）/ exact（精确集合）/ off（关闭，每票都查库）
+DEDUPE_FILTER = os.getenv("DEDUPE_FILTER", "bloom")
+# 布隆过滤器误判率（误判只会让请求回源数据库校验，不影响正确性）
+DEDUPE_FALSE_POSITIVE_RATE = float(os.getenv("DEDUPE_FALSE_POSITIVE_RATE", "0.001"))
+# 每个问卷布隆过滤器的初始容量，超出后自动扩容
+DEDUPE_BLOOM_CAPACITY = int(os.getenv("DEDUPE_BLOOM_CAPACITY", "10000"))
+# 增量同步其他 worker 写入的间隔（毫秒）
+DEDUPE_REFRESH_MS = int(os.getenv("DEDUPE_REFRESH_MS", "1000"))
+# 预热/同步时每批读取的行数
+DEDUPE_LOAD_BATCH = 10000
+
+
+class BloomFilter:
+    """定容布隆过滤器（双重哈希生成 k 个位置）"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: bytes):
+        # key 本身即均匀分布的摘要，无需再次哈希
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: bytes):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class ScalableBloomFilter:
+    """可扩容布隆过滤器：写满后追加容量翻倍、误判率减半的新层，总体误判率有上界"""
+
+    def __init__(self, capacity: int = DEDUPE_BLOOM_CAPACITY, error_rate: float = DEDUPE_FALSE_POSITIVE_RATE):
+        self.error_rate = error_rate
+        self.layers = [BloomFilter(capacity, error_rate / 2)]
+
+    def add(self, key: bytes):
+        if key in self:
+            return
+        layer = self.layers[-1]
+        if layer.count >= layer.capacity:
+            layer = BloomFilter(layer.capacity * 2, self.error_rate / 2 ** (len(self.layers) + 1))
+            self.layers.append(layer)
+        layer.add(key)
+
+    def __contains__(self, key: bytes) -> bool:
+        return any(key in layer for layer in self.layers)
+
+    def __len__(self) -> int:
+        return sum(layer.count for layer in self.layers)
+
+
+class DuplicateVoteFilter:
+    """按问卷维护的已投票客户端过滤器"""
+
+    def __init__(
+        self,
+        session_factory=None,
+        kind: str = DEDUPE_FILTER,
+        refresh_ms: int = DEDUPE_REFRESH_MS,
+        buffered: bool = VOTE_INGEST_MODE == "buffered",
+    ):
+        # 全局实例的会话工厂由应用启动时绑定为该应用的数据库（app.main.lifespan）
+        self.session_factory = session_factory
+        self.kind = kind
+        self.buffered = buffered
+        self.refresh_interval = refresh_ms / 1000
+        self.ready = False
+        self._members: Dict[int, object] = {}
+        # 选项 -> 问卷 映射，用于在查库前确定投票所属问卷
+        self._option_poll: Dict[int, int] = {}
+        # 已同步到的 poll_voters.voted_at（None 表示尚未完成全表载入）
+        self._synced_until: Optional[datetime] = None
+        # 上一轮开始时数据库的当前时间，本轮水位线推进到这里
+        self._observed_at: Optional[datetime] = None
+        self._max_option_id = 0
+        self._task: Optional[asyncio.Task] = None
+        self.definitely_new = 0
+        self.possible_duplicates = 0
+        self.confirmed_duplicates = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.buffered and self.kind != "off"
+
+    def _new_members(self):
+        return set() if self.kind == "exact" else ScalableBloomFilter()
+
+    def poll_of(self, option_id: int) -> Optional[int]:
+        return self._option_poll.get(option_id)
+
+    def register_option(self, option_id: int, poll_id: int):
+        """登记新建的选项（新问卷的已投票集合为空）"""
+        self._option_poll[option_id] = poll_id
+        self._members.setdefault(poll_id, self._new_members())
+
+    def add(self, poll_id: int, client_id: str):
+        """投票提交后登记客户端"""
+        self.add_key(poll_id, client_key(client_id))
+
+    def add_key(self, poll_id: int, key: bytes):
+        """登记客户端摘要（与 poll_voters.client_key 相同）"""
+        if not self.enabled:
+            return
+        members = self._members.get(poll_id)
+        if members is None:
+            members = self._members[poll_id] = self._new_members()
+        members.add(key)
+
+    def might_contain(self, poll_id: Optional[int], client_id: str) -> bool:
+        """是否可能已投过票；未预热或问卷未知时保守返回 True"""
+        if not self.enabled or not self.ready or poll_id is None or poll_id not in self._members:
+            self.possible_duplicates += 1
+            return True
+        if client_key(client_id) in self._members[poll_id]:
+            self.possible_duplicates += 1
+            return True
+        self.definitely_new += 1
+        return False
+
+    def record_result(self, poll_id: int, client_id: str, created: bool):
+        """回源校验/提交后登记结果"""
+        if not created:
+            self.confirmed_duplicates += 1
+        self.add(poll_id, client_id)
+
+    async def warm(self):
+        """从 poll_voters 表预热（按主键分批读取），之后的增量由 refresh 同步"""
+        if not self.enabled:
+            return
+        await self.refresh()
+        self.ready = True
+        logger.info("防重复过滤器预热完成: %d 个问卷, %d 个选项", len(self._members), len(self._option_poll))
+
+    async def refresh(self):
+        """
+        增量同步新增的选项与投票人
+        按主键分批读取 voted_at 不早于水位线的投票人；水位线推进到上一轮开始时数据库的当前时间，
+        上一轮之后的区间下一轮重读（重复登记没有副作用），预热后的第一轮会重读一遍全表
+        """
+        async with self.session_factory() as db:
+            # 与 poll_voters.voted_at 的默认值取自同一时钟
+            started_at = (await db.execute(select(func.current_timestamp()))).scalar_one()
+            rows = (await db.execute(
+                select(options_table.c.option_id, options_table.c.poll_id)
+                .where(options_table.c.option_id > self._max_option_id)
+                .order_by(options_table.c.option_id)
+            )).all()
+            for option_id, poll_id in rows:
+                self.register_option(option_id, poll_id)
+                self._max_option_id = max(self._max_option_id, option_id)
+
+            query = select(voters_table.c.poll_id, voters_table.c.client_key)
+            if self._synced_until is not None:
+                query = query.where(voters_table.c.voted_at >= self._synced_until)
+            cursor = None
+            while True:
+                batch = query
+                if cursor is not None:
+                    batch = batch.where(tuple_(voters_table.c.poll_id, voters_table.c.client_key) > cursor)
+                rows = (await db.execute(
+                    batch.order_by(voters_table.c.poll_id, voters_table.c.client_key).limit(DEDUPE_LOAD_BATCH)
+                )).all()
+                for poll_id, key in rows:
+                    self.add_key(poll_id, key)
+                if rows:
+                    cursor = tuple(rows[-1])
+                if len(rows) < DEDUPE_LOAD_BATCH:
+                    break
+
+        if self._observed_at is not None:
+            # DATETIME 精度为秒，水位线向前留出 1 秒
+            self._synced_until = self._observed_at - timedelta(seconds=1)
+        self._observed_at = started_at
+
+    async def wait_ready(self, interval: float = 0.05):
+        """等待后台预热完成（由应用启动预热调用，超时由调用方控制）"""
+        while self.enabled and not self.ready:
+            await asyncio.sleep(interval)
+        return self.stats()["polls"]
+
+    def start(self):
+        """启动后台任务：首次同步即完成预热，之后定期增量同步"""
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                if self.ready:
+                    await self.refresh()
+                else:
+                    # 预热失败（如启动时数据库不可用）期间所有请求都回源校验，不影响正确性
+                    await self.warm()
+            except Exception as e:
+                logger.warning("防重复过滤器同步失败: %s", e)
+            await asyncio.sleep(self.refresh_interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind if self.buffered else "off",
+            "ready": self.ready,
+            "polls": len(self._members),
+            "definitely_new": self.definitely_new,
+            "possible_duplicates": self.possible_duplicates,
+            "confirmed_duplicates": self.confirmed_duplicates,
+            "synced_until": self._synced_until.isoformat() if self._synced_until else None,
+        }
+
+
+# 全局防重复过滤器（应用启动时预热）
+dedupe_filter = DuplicateVoteFilter()
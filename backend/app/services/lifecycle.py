@@ -0,0 +1,177 @@
+"""
+应用生命周期：启动预热、就绪状态与优雅停机
+- 启动后在后台依次执行预热步骤：预先建立连接池连接、加载进行中问卷的快照、等待防重复过滤器预热完成，
+  完成前 /ready 返回 503（/health 只表示进程存活，不受影响），负载均衡据此在预热完成后再分发流量
+- 预热超时（WARMUP_TIMEOUT_MS）后同样标记为就绪：各组件未预热时只是回源数据库，不影响正确性
+- 停机时先进入 draining 状态：/ready 返回 503，/api/ 下的写请求（投票、批量投票、创建问卷）直接返回 503，
+  再等待进行中的请求完成（最多 SHUTDOWN_DRAIN_MS），之后由 lifespan 排空写缓冲与待发出的推送
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# 启动时预先建立的连接池连接数（每个引擎，不超过连接池容量；0 关闭）
+WARMUP_POOL_CONNECTIONS = int(os.getenv("WARMUP_POOL_CONNECTIONS", "5"))
+# 预热最长耗时（毫秒），超时后直接标记为就绪
+WARMUP_TIMEOUT_MS = int(os.getenv("WARMUP_TIMEOUT_MS", "15000"))
+# 停机时等待进行中请求完成的最长时间（毫秒）
+SHUTDOWN_DRAIN_MS = int(os.getenv("SHUTDOWN_DRAIN_MS", "10000"))
+
+# 停机期间拒绝的写请求路径前缀
+DRAIN_PREFIX = "/api/"
+# 停机期间仍然受理的请求方法
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+STARTING = "starting"
+READY = "ready"
+DRAINING = "draining"
+
+WarmupStep = Tuple[str, Callable[[], Awaitable[object]]]
+
+
+async def warm_pool(engine, connections: int = WARMUP_POOL_CONNECTIONS) -> int:
+    """同时打开若干连接并执行一次查询后归还连接池，返回预热的连接数"""
+    size = getattr(engine.pool, "size", None)
+    if callable(size):
+        # 超出连接池容量的连接归还时会被关闭，预热无意义
+        connections = min(connections, size())
+    if connections <= 0:
+        return 0
+
+    async def open_one(stack: AsyncExitStack):
+        conn = await stack.enter_async_context(engine.connect())
+        await conn.execute(text("SELECT 1"))
+
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(*(open_one(stack) for _ in range(connections)))
+    return connections
+
+
+class AppLifecycle:
+    """就绪状态、预热步骤与进行中请求计数"""
+
+    def __init__(self, warmup_timeout_ms: int = WARMUP_TIMEOUT_MS, drain_ms: int = SHUTDOWN_DRAIN_MS):
+        self.warmup_timeout = warmup_timeout_ms / 1000
+        self.drain_timeout = drain_ms / 1000
+        self.state = STARTING
+        self.in_flight = 0
+        self.rejected = 0
+        # 步骤名 -> {"ms": 耗时, "result": 返回值 / "error": 异常}
+        self.steps: Dict[str, dict] = {}
+        self.warmup_ms: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    @property
+    def draining(self) -> bool:
+        return self.state == DRAINING
+
+    def accepts(self, method: str, path: str) -> bool:
+        """停机期间只受理读请求"""
+        return not self.draining or method in READ_METHODS or not path.startswith(DRAIN_PREFIX)
+
+    def start(self, steps: List[WarmupStep]):
+        """在后台执行预热，完成后标记为就绪"""
+        self.state = STARTING
+        self._task = asyncio.create_task(self.warmup(steps))
+
+    async def warmup(self, steps: List[WarmupStep]):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._run_steps(steps), self.warmup_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("预热超时，未完成的组件将在首次请求时回源加载", extra={"steps": self.steps})
+        self.warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+        if self.state == STARTING:
+            self.state = READY
+            logger.info("预热完成，开始受理流量", extra={"warmup_ms": self.warmup_ms, "steps": self.steps})
+
+    async def _run_steps(self, steps: List[WarmupStep]):
+        for name, step in steps:
+            started = time.perf_counter()
+            try:
+                result = {"result": await step()}
+            except Exception as e:
+                # 单个步骤失败不影响后续步骤，相应组件在首次请求时回源
+                logger.warning("预热步骤失败", extra={"step": name}, exc_info=True)
+                result = {"error": str(e)}
+            result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self.steps[name] = result
+
+    async def drain(self):
+        """停止受理写请求，等待进行中的请求完成"""
+        self.state = DRAINING
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        deadline = time.monotonic() + self.drain_timeout
+        while self.in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.in_flight > 0:
+            logger.warning("停机等待超时，仍有请求未完成", extra={"in_flight": self.in_flight})
+
+    def reset(self):
+        self.state = STARTING
+        self.in_flight = 0
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "warmup_ms": self.warmup_ms,
+            "steps": self.steps,
+        }
+
+
+class LifecycleMiddleware:
+    """ASGI 中间件：统计进行中的请求，停机期间拒绝写请求"""
+
+    def __init__(self, app, controller: Optional[AppLifecycle] = None):
+        self.app = app
+        self.controller = controller or lifecycle
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not self.controller.accepts(scope["method"], scope["path"]):
+            self.controller.rejected += 1
+            body = '{"detail":"服务正在停机，请稍后重试"}'.encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", b"1"),
+                    (b"connection", b"close"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        self.controller.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.in_flight -= 1
+
+
+# 全局生命周期状态（main 中登记中间件并在 lifespan 中预热 / 停机）
+lifecycle = AppLifecycle()
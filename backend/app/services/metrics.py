@@ -0,0 +1,367 @@
+"""
+Prometheus 指标
+进程内指标注册表，按 Prometheus 文本格式（text/plain; version=0.0.4）输出，无需额外依赖：
+- 路由延迟直方图、每个请求的数据库查询数（ASGI 中间件 + SQLAlchemy 事件）
+- 连接池占用 / 溢出 / 占满时长 / 连接占用时间（连接池事件 checkout / checkin / connect）
+- 投票落库计数、事件循环延迟
+- 抓取时回调采集的瞬时值（Socket.IO 连接数、房间订阅数、写缓冲与广播器状态）
+多 worker 部署时每个 worker 各自输出，由 Prometheus 按实例汇总
+"""
+import asyncio
+import contextvars
+import logging
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 延迟直方图默认桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每请求查询数直方图的桶
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        return f"{name}{{{rendered}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+class Metric:
+    """带标签的指标基类"""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, object] = {}
+
+    def _labels(self, values: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+    def samples(self) -> Iterable[Sample]:
+        for values, value in self._values.items():
+            yield self.name, self._labels(values), value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, labels: tuple = ()):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, labels: tuple = ()):
+        self._values[labels] = value
+
+    def get(self, labels: tuple = (), default: float = 0.0) -> float:
+        """当前值（未设置过时返回 default）"""
+        return self._values.get(labels, default)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value: float, labels: tuple = ()):
+        state = self._values.get(labels)
+        if state is None:
+            # [各桶计数..., 总和, 总数]
+            state = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def samples(self) -> Iterable[Sample]:
+        for values, state in self._values.items():
+            labels = self._labels(values)
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield self.name + "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield self.name + "_sum", labels, state[-2]
+            yield self.name + "_count", labels, state[-1]
+
+
+class Registry:
+    """指标注册表；collector 在抓取时调用，用于采集瞬时状态"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: Dict[object, Callable[[], Iterable[Metric]]] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Metric]], key: Optional[str] = None):
+        """登记 collector；同一 key 只保留最后登记的一个（如每次创建应用时重新登记的采集项）"""
+        self._collectors[collector if key is None else key] = collector
+
+    def render(self) -> str:
+        metrics = list(self._metrics)
+        for collector in list(self._collectors.values()):
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                logger.warning("指标采集失败: %s", e)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(_format_sample(*sample) for sample in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP 请求数", ("method", "route", "status")
+)
+http_latency = registry.histogram(
+    "http_request_duration_seconds", "HTTP 请求处理耗时（秒）", ("method", "route")
+)
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "每个 HTTP 请求执行的 SQL 语句数", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+db_pool_hold = registry.histogram(
+    "db_pool_connection_hold_seconds", "连接从借出到归还的占用时间（秒）", ("engine",)
+)
+db_pool_opened = registry.counter(
+    "db_pool_connections_opened_total", "连接池新建的数据库连接数", ("engine",)
+)
+votes_committed = registry.counter(
+    "votes_committed_total", "已落库的投票数（按写入路径）", ("mode",)
+)
+votes_duplicate = registry.counter(
+    "votes_duplicate_total", "被拦截的重复投票数"
+)
+loop_lag = registry.gauge(
+    "event_loop_lag_seconds", "事件循环调度延迟（秒）"
+)
+
+
+class PoolUsage:
+    """由连接池事件维护的单个引擎的连接占用情况"""
+
+    def __init__(self, engine, capacity: Optional[int] = None):
+        self.engine = engine
+        # 连接池容量（pool_size + max_overflow），未知或不限时为 None
+        self.capacity = capacity
+        self.checked_out = 0
+        # 连接全部借出（新请求开始排队）的起始时间
+        self.saturated_since: Optional[float] = None
+
+    def checkout(self):
+        self.checked_out += 1
+        if self.capacity is not None and self.checked_out >= self.capacity and self.saturated_since is None:
+            self.saturated_since = time.monotonic()
+
+    def checkin(self):
+        self.checked_out = max(0, self.checked_out - 1)
+        if self.capacity is None or self.checked_out < self.capacity:
+            self.saturated_since = None
+
+    def saturated_for(self, now: Optional[float] = None) -> float:
+        """连接已持续全部借出的时长（秒），未占满时为 0"""
+        if self.saturated_since is None:
+            return 0.0
+        return (now or time.monotonic()) - self.saturated_since
+
+
+# 已登记的引擎（名称 -> 连接占用），抓取时逐个采集连接池状态
+_pools: Dict[str, PoolUsage] = {}
+
+# 当前请求的 SQL 语句计数（由中间件为每个请求设置）
+_request_queries: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar(
+    "request_queries", default=None
+)
+
+
+def _route_label(scope) -> str:
+    """使用路由模板作为标签（如 /api/poll/{poll_id}/statistics），避免路径参数导致标签爆炸"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI 中间件：记录每个 HTTP 请求的耗时、状态码与 SQL 语句数"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+        queries = [0]
+        token = _request_queries.set(queries)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_queries.reset(token)
+            route = _route_label(scope)
+            method = scope["method"]
+            http_requests.inc(labels=(method, route, str(status["code"])))
+            http_latency.observe(elapsed, labels=(method, route))
+            db_queries_per_request.observe(queries[0], labels=(method, route))
+
+
+def instrument_engine(engine, name: str, capacity: Optional[int] = None):
+    """
+    为同步引擎（异步引擎传 async_engine.sync_engine）登记 SQL 计数与连接池事件
+    capacity 为连接池容量（pool_size + max_overflow），用于判断连接是否已全部借出
+    """
+    usage = _pools[name] = PoolUsage(engine, capacity)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+
+    @event.listens_for(engine, "connect")
+    def opened(dbapi_connection, connection_record):
+        db_pool_opened.inc(labels=(name,))
+
+    @event.listens_for(engine, "checkout")
+    def checked_out(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        usage.checkout()
+
+    def returned(connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            db_pool_hold.observe(time.perf_counter() - started, labels=(name,))
+            usage.checkin()
+
+    @event.listens_for(engine, "checkin")
+    def checked_in(dbapi_connection, connection_record):
+        returned(connection_record)
+
+    @event.listens_for(engine, "detach")
+    def detached(dbapi_connection, connection_record):
+        # 脱离连接池的连接不会再归还
+        returned(connection_record)
+
+
+def _collect_pools() -> List[Metric]:
+    """各连接池状态：每个指标族只输出一次，每个引擎一条样本（engine 标签）"""
+    size = Gauge("db_pool_size", "连接池容量（pool_size + max_overflow）", ("engine",))
+    checked_out = Gauge("db_pool_checked_out", "已借出的连接数", ("engine",))
+    overflow = Gauge("db_pool_overflow", "超出 pool_size 的溢出连接数", ("engine",))
+    saturated = Gauge("db_pool_saturated_seconds", "连接已持续全部借出的时长（秒）", ("engine",))
+    now = time.monotonic()
+    for name, usage in _pools.items():
+        checked_out.set(usage.checked_out, labels=(name,))
+        saturated.set(usage.saturated_for(now), labels=(name,))
+        if usage.capacity is not None:
+            size.set(usage.capacity, labels=(name,))
+        current = usage.engine.pool
+        if hasattr(current, "overflow"):
+            overflow.set(max(current.overflow(), 0), labels=(name,))
+    return [size, checked_out, overflow, saturated]
+
+
+registry.add_collector(_collect_pools)
+
+
+def pool_saturated_for() -> float:
+    """已登记引擎中连接持续全部借出的最长时长（秒），准入控制据此判断连接池是否排队"""
+    now = time.monotonic()
+    return max((usage.saturated_for(now) for usage in _pools.values()), default=0.0)
+
+
+def current_loop_lag() -> float:
+    """最近一次测得的事件循环调度延迟（秒）"""
+    return loop_lag.get()
+
+
+def instrument_socketio(sio):
+    """抓取时采集 Socket.IO 连接数与各房间订阅数（本 worker）"""
+
+    def collect():
+        clients = Gauge("socketio_connected_clients", "已连接的 Socket.IO 客户端数")
+        subscribers = Gauge("socketio_room_subscribers", "各房间的订阅客户端数", ("room",))
+        rooms = sio.manager.rooms.get("/", {})
+        clients.set(len(rooms.get(None, {})))
+        for room, members in rooms.items():
+            # 每个客户端都在以自身 sid 命名的房间中，不计入
+            if room is not None and room not in members:
+                subscribers.set(len(members), labels=(room,))
+        return [clients, subscribers]
+
+    registry.add_collector(collect, key="socketio")
+
+
+def stats_collector(prefix: str, stats: Callable[[], dict], documentation: str):
+    """将服务组件 stats() 返回的数值项按 <prefix>_<key> 输出为 gauge"""
+
+    def collect():
+        metrics = []
+        for key, value in stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            gauge = Gauge(f"{prefix}_{key}", f"{documentation}: {key}")
+            gauge.set(value)
+            metrics.append(gauge)
+        return metrics
+
+    registry.add_collector(collect, key=prefix)
+
+
+async def monitor_loop_lag(interval: float = 0.5):
+    """周期性测量事件循环调度延迟（定时器实际触发时间与预期的差值）"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag.set(max(0.0, loop.time() - expected))
@@ -0,0 +1,221 @@
+"""
+问卷快照缓存
+按问卷缓存预序列化的响应字节（app.services.serializer）与单调递增的版本号：
+- GET /api/poll 与统计接口直接返回缓存字节，并支持 ETag / If-None-Match（304）；
+  ETag 只由问卷内容（标题、选项与票数）计算，不含本进程的版本号与 epoch，负载均衡后的各 worker 对同样的票数给出同样的 ETag
+- 投票提交后用事务内读取的票数原地更新快照，无需回源数据库
+- 快照带 TTL，用于兜底其他进程写入造成的数据陈旧
+- 版本号只在本进程内递增，快照带进程随机生成的 epoch；每个问卷保留最近 POLL_SYNC_HISTORY 个版本的票数，
+  Socket.IO 断线重连时按客户端的 epoch / 版本号返回增量，版本过旧或 epoch 不同（其他 worker、进程重启）时返回完整快照
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.services import serializer
+from app.services.voting import OptionTally, PollTally
+
+# 快照有效期（毫秒），过期后回源数据库刷新
+POLL_CACHE_TTL_MS = int(os.getenv("POLL_CACHE_TTL_MS", "2000"))
+# 每个问卷保留的历史版本数（重连追赶增量的范围）
+POLL_SYNC_HISTORY = int(os.getenv("POLL_SYNC_HISTORY", "256"))
+
+
+# 问卷响应中只在本进程内有意义的字段，不参与 ETag 计算
+PROCESS_LOCAL_FIELDS = ("version", "epoch")
+
+
+def _etag(body: bytes, weak: bool = False) -> str:
+    # 以内容摘要作为 ETag，多进程下同样内容得到同样的 ETag
+    tag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+    return "W/" + tag if weak else tag
+
+
+def _poll_etag(poll_data: dict) -> str:
+    """
+    问卷响应的 ETag：去掉版本号与 epoch 后的内容摘要
+    不同 worker 的响应字节只在这两个字段上不同，语义等价，因此使用弱 ETag
+    """
+    content = {key: value for key, value in poll_data.items() if key not in PROCESS_LOCAL_FIELDS}
+    return _etag(serializer.dumps(content), weak=True)
+
+
+@dataclass
+class PollSnapshot:
+    """某一版本的问卷快照及其预序列化响应"""
+    tally: PollTally
+    version: int
+    epoch: str
+    loaded_at: float
+    poll_data: dict
+    poll_json: bytes
+    poll_body: bytes
+    poll_etag: str
+    statistics_body: bytes
+    statistics_etag: str
+
+    @classmethod
+    def build(cls, tally: PollTally, version: int, epoch: str = "") -> "PollSnapshot":
+        poll_data = serializer.poll_payload(tally, version, epoch)
+        poll_json = serializer.dumps(poll_data)
+        poll_body = serializer.poll_body(poll_json)
+        statistics_body = serializer.dumps(serializer.statistics_payload(tally))
+        return cls(
+            tally=tally,
+            version=version,
+            epoch=epoch,
+            loaded_at=time.monotonic(),
+            poll_data=poll_data,
+            poll_json=poll_json,
+            poll_body=poll_body,
+            poll_etag=_poll_etag(poll_data),
+            statistics_body=statistics_body,
+            statistics_etag=_etag(statistics_body),
+        )
+
+
+def _counts(tally: PollTally):
+    return [(opt.option_id, opt.vote_count) for opt in tally.options]
+
+
+class PollCache:
+    """进程内问卷快照缓存"""
+
+    def __init__(self, ttl_ms: int = POLL_CACHE_TTL_MS, history_size: int = POLL_SYNC_HISTORY):
+        self.ttl = ttl_ms / 1000
+        self.history_size = history_size
+        # 本进程版本号的命名空间，与其他 worker 或重启前的版本号区分
+        self.epoch = os.urandom(6).hex()
+        self.hits = 0
+        self.misses = 0
+        self.sync_deltas = 0
+        self.sync_snapshots = 0
+        self._entries: Dict[int, PollSnapshot] = {}
+        # 版本号独立保存，快照过期重载后版本仍单调递增
+        self._versions: Dict[int, int] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # 问卷ID -> 最近若干版本的 (版本号, 标题, 各选项票数)
+        self._history: Dict[int, Deque[Tuple[int, str, Dict[int, int]]]] = {}
+
+    def get(self, poll_id: int) -> Optional[PollSnapshot]:
+        """返回未过期的快照"""
+        snapshot = self._entries.get(poll_id)
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > self.ttl:
+            return None
+        return snapshot
+
+    def put(self, tally: PollTally, authoritative: bool = False) -> PollSnapshot:
+        """
+        写入票数快照；票数变化时版本号 +1
+        非权威来源（如投票事务）的快照总票数若小于缓存，说明是乱序到达的旧数据，忽略
+        """
+        current = self._entries.get(tally.poll_id)
+        if current is not None:
+            if _counts(current.tally) == _counts(tally) and current.tally.title == tally.title:
+                current.loaded_at = time.monotonic()
+                return current
+            if not authoritative and tally.total_votes < current.tally.total_votes:
+                return current
+        version = self._versions.get(tally.poll_id, 0) + 1
+        self._versions[tally.poll_id] = version
+        snapshot = PollSnapshot.build(tally, version, self.epoch)
+        self._entries[tally.poll_id] = snapshot
+        history = self._history.get(tally.poll_id)
+        if history is None:
+            history = self._history[tally.poll_id] = deque(maxlen=self.history_size)
+        history.append((version, tally.title, dict(_counts(tally))))
+        return snapshot
+
+    def changes_since(self, snapshot: PollSnapshot, version: int) -> Optional[List[OptionTally]]:
+        """自某一版本以来票数变化的选项；该版本已不在历史中（或标题有变化）时返回 None"""
+        if version == snapshot.version:
+            return []
+        for past_version, title, counts in self._history.get(snapshot.tally.poll_id, ()):
+            if past_version == version:
+                if title != snapshot.tally.title:
+                    return None
+                return [opt for opt in snapshot.tally.options if counts.get(opt.option_id) != opt.vote_count]
+        return None
+
+    def catch_up(self, snapshot: PollSnapshot, epoch: Optional[str], version: Optional[int]) -> dict:
+        """
+        断线重连的追赶消息：客户端的 epoch 与本进程一致且版本仍在历史中时返回增量（格式同 vote_update），
+        否则返回完整快照
+        """
+        changed = self.changes_since(snapshot, version) if epoch == self.epoch and version is not None else None
+        if changed is None:
+            self.sync_snapshots += 1
+            return {"type": "snapshot", "poll": snapshot.poll_data}
+        self.sync_deltas += 1
+        return {
+            "type": "delta",
+            "pollId": str(snapshot.tally.poll_id),
+            "epoch": snapshot.epoch,
+            "baseVersion": version,
+            "version": snapshot.version,
+            "options": [{"id": str(opt.option_id), "votes": opt.vote_count} for opt in changed],
+            "totalVotes": snapshot.tally.total_votes,
+        }
+
+    def invalidate(self, poll_id: Optional[int] = None):
+        """使指定问卷（或全部）快照失效"""
+        if poll_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(poll_id, None)
+
+    async def get_or_load(
+        self,
+        poll_id: int,
+        loader: Callable[[], Awaitable[Optional[PollTally]]],
+        authoritative: bool = True,
+    ) -> Optional[PollSnapshot]:
+        """
+        读取快照，未命中时回源加载；同一问卷的并发未命中只回源一次
+        从只读副本加载时 authoritative=False，副本落后时不会覆盖较新的快照
+        """
+        snapshot = self.get(poll_id)
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+        lock = self._locks.setdefault(poll_id, asyncio.Lock())
+        async with lock:
+            snapshot = self.get(poll_id)
+            if snapshot is not None:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            tally = await loader()
+        if tally is None:
+            # 不存在的问卷不保留锁，避免无效ID撑大缓存
+            self._locks.pop(poll_id, None)
+            return None
+        return self.put(tally, authoritative=authoritative)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "sync_deltas": self.sync_deltas,
+            "sync_snapshots": self.sync_snapshots,
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断 If-None-Match 请求头是否命中当前 ETag（弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+# 全局问卷快照缓存
+poll_cache = PollCache()
@@ -0,0 +1,311 @@
+"""
+问卷注册表
+进程内缓存问卷与选项的元数据（标题、slug、状态、起止时间、选项文本），投票期间这些数据不会变化，
+请求只需从数据库读取票数：
+- 按问卷ID、slug、选项ID查找问卷，元数据按 TTL 过期、超过 POLL_REGISTRY_MAX_POLLS 个时淘汰最久未使用的问卷
+- 进行中的问卷列表（status=active 且未到结束时间）单独按较短的 TTL 缓存，开始 / 结束时间在进程内判断
+- 当前问卷为进行中的问卷中ID最小的一个
+- 本进程通过 create_poll 创建的问卷立即登记；其他 worker 创建的问卷在进行中列表过期后可见
+"""
+import asyncio
+import logging
+import os
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Mapping, Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.services.voting import OptionTally, PollTally
+
+logger = logging.getLogger(__name__)
+
+polls_table = models.Poll.__table__
+options_table = models.Option.__table__
+
+# 问卷元数据有效期（毫秒）
+POLL_REGISTRY_TTL_MS = int(os.getenv("POLL_REGISTRY_TTL_MS", "60000"))
+# 进行中问卷列表有效期（毫秒），决定其他 worker 创建的问卷多久后可见
+POLL_REGISTRY_ACTIVE_TTL_MS = int(os.getenv("POLL_REGISTRY_ACTIVE_TTL_MS", "5000"))
+# 最多缓存的问卷数
+POLL_REGISTRY_MAX_POLLS = int(os.getenv("POLL_REGISTRY_MAX_POLLS", "1000"))
+# 进行中问卷列表最多返回的问卷数
+POLL_REGISTRY_MAX_ACTIVE = 100
+
+DRAFT = "draft"
+ACTIVE = "active"
+CLOSED = "closed"
+POLL_STATUSES = (DRAFT, ACTIVE, CLOSED)
+
+
+def utcnow() -> datetime:
+    """不带时区的 UTC 当前时间（与 starts_at / ends_at 的存储方式一致）"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class OptionMeta:
+    option_id: int
+    label: str
+
+
+@dataclass
+class PollMeta:
+    """问卷元数据（不含票数）"""
+    poll_id: int
+    title: str
+    created_at: datetime
+    slug: Optional[str] = None
+    status: str = ACTIVE
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+    options: List[OptionMeta] = field(default_factory=list)
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def from_model(cls, poll: models.Poll) -> "PollMeta":
+        return cls(
+            poll_id=poll.poll_id,
+            title=poll.title,
+            created_at=poll.created_at,
+            slug=poll.slug,
+            status=poll.status,
+            starts_at=poll.starts_at,
+            ends_at=poll.ends_at,
+            options=[OptionMeta(opt.option_id, opt.label) for opt in poll.options],
+        )
+
+    def is_active(self, now: Optional[datetime] = None) -> bool:
+        """是否处于可投票状态"""
+        now = now or utcnow()
+        if self.status != ACTIVE:
+            return False
+        if self.starts_at is not None and now < self.starts_at:
+            return False
+        return self.ends_at is None or now < self.ends_at
+
+    def tally(self, counts: Mapping[int, int]) -> PollTally:
+        """元数据与票数合成票数快照"""
+        return PollTally(
+            poll_id=self.poll_id,
+            title=self.title,
+            created_at=self.created_at,
+            options=[OptionTally(opt.option_id, opt.label, counts.get(opt.option_id, 0)) for opt in self.options],
+            is_active=self.is_active(),
+        )
+
+    def summary(self) -> dict:
+        """问卷列表接口格式"""
+        return {
+            "id": str(self.poll_id),
+            "slug": self.slug,
+            "title": self.title,
+            "status": self.status,
+            "isActive": self.is_active(),
+            "startsAt": self.starts_at.isoformat() if self.starts_at else None,
+            "endsAt": self.ends_at.isoformat() if self.ends_at else None,
+            "createdAt": self.created_at.isoformat(),
+        }
+
+
+def _meta_query(where):
+    """问卷及其选项文本（单次查询）"""
+    return (
+        select(
+            polls_table.c.poll_id,
+            polls_table.c.title,
+            polls_table.c.created_at,
+            polls_table.c.slug,
+            polls_table.c.status,
+            polls_table.c.starts_at,
+            polls_table.c.ends_at,
+            options_table.c.option_id,
+            options_table.c.label,
+        )
+        .outerjoin(options_table, options_table.c.poll_id == polls_table.c.poll_id)
+        .where(where)
+        .order_by(polls_table.c.poll_id, options_table.c.option_id)
+    )
+
+
+class PollRegistry:
+    """进程内问卷元数据缓存（TTL + LRU）"""
+
+    def __init__(
+        self,
+        ttl_ms: int = POLL_REGISTRY_TTL_MS,
+        active_ttl_ms: int = POLL_REGISTRY_ACTIVE_TTL_MS,
+        max_polls: int = POLL_REGISTRY_MAX_POLLS,
+    ):
+        self.ttl = ttl_ms / 1000
+        self.active_ttl = active_ttl_ms / 1000
+        self.max_polls = max_polls
+        # 问卷ID -> 元数据，按最近使用排序
+        self._polls: "OrderedDict[int, PollMeta]" = OrderedDict()
+        self._slugs: Dict[str, int] = {}
+        self._option_polls: Dict[int, int] = {}
+        # 进行中（及待开始）的问卷ID与加载时间
+        self._active_ids: Optional[List[int]] = None
+        self._active_loaded_at = 0.0
+        # 进行中列表过期时只由一个请求回源（重连风暴时避免并发查询）；
+        # 锁按事件循环在首次使用时创建，不跨事件循环共享（测试中每个客户端各用一个事件循环）
+        self._active_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def register(self, meta: PollMeta) -> PollMeta:
+        """登记（或替换）问卷元数据"""
+        self._drop(meta.poll_id)
+        self._polls[meta.poll_id] = meta
+        if meta.slug:
+            self._slugs[meta.slug] = meta.poll_id
+        for opt in meta.options:
+            self._option_polls[opt.option_id] = meta.poll_id
+        while len(self._polls) > self.max_polls:
+            self._drop(next(iter(self._polls)))
+            self.evictions += 1
+        return meta
+
+    def created(self, poll: models.Poll) -> PollMeta:
+        """本进程创建问卷后调用：登记元数据并刷新进行中列表"""
+        self._active_ids = None
+        return self.register(PollMeta.from_model(poll))
+
+    def _drop(self, poll_id: int):
+        meta = self._polls.pop(poll_id, None)
+        if meta is None:
+            return
+        if meta.slug and self._slugs.get(meta.slug) == poll_id:
+            del self._slugs[meta.slug]
+        for opt in meta.options:
+            self._option_polls.pop(opt.option_id, None)
+
+    def invalidate(self, poll_id: Optional[int] = None):
+        """使指定问卷（或全部）元数据失效"""
+        if poll_id is None:
+            self._polls.clear()
+            self._slugs.clear()
+            self._option_polls.clear()
+        else:
+            self._drop(poll_id)
+        self._active_ids = None
+
+    def _cached(self, poll_id: Optional[int]) -> Optional[PollMeta]:
+        """未过期的元数据（命中时移到最近使用端）"""
+        meta = self._polls.get(poll_id) if poll_id is not None else None
+        if meta is None or time.monotonic() - meta.loaded_at > self.ttl:
+            return None
+        self._polls.move_to_end(poll_id)
+        self.hits += 1
+        return meta
+
+    async def _load_many(self, db: AsyncSession, where) -> List[PollMeta]:
+        """加载满足条件的问卷元数据（单次查询）并登记"""
+        self.misses += 1
+        polls: Dict[int, PollMeta] = {}
+        for row in (await db.execute(_meta_query(where))).all():
+            meta = polls.get(row.poll_id)
+            if meta is None:
+                meta = polls[row.poll_id] = PollMeta(
+                    poll_id=row.poll_id,
+                    title=row.title,
+                    created_at=row.created_at,
+                    slug=row.slug,
+                    status=row.status,
+                    starts_at=row.starts_at,
+                    ends_at=row.ends_at,
+                )
+            if row.option_id is not None:
+                meta.options.append(OptionMeta(row.option_id, row.label))
+        return [self.register(meta) for meta in polls.values()]
+
+    async def _load(self, db: AsyncSession, where) -> Optional[PollMeta]:
+        polls = await self._load_many(db, where)
+        return polls[0] if polls else None
+
+    async def get(self, db: AsyncSession, poll_id: int) -> Optional[PollMeta]:
+        """按问卷ID查找"""
+        return self._cached(poll_id) or await self._load(db, polls_table.c.poll_id == poll_id)
+
+    async def get_by_slug(self, db: AsyncSession, slug: str) -> Optional[PollMeta]:
+        """按 slug 查找"""
+        return self._cached(self._slugs.get(slug)) or await self._load(db, polls_table.c.slug == slug)
+
+    async def resolve(self, db: AsyncSession, poll_ref: str) -> Optional[PollMeta]:
+        """按问卷ID（纯数字）或 slug 查找"""
+        if poll_ref.isdigit():
+            return await self.get(db, int(poll_ref))
+        return await self.get_by_slug(db, poll_ref)
+
+    async def poll_of_option(self, db: AsyncSession, option_id: int) -> Optional[PollMeta]:
+        """按选项ID查找所属问卷，选项不存在时返回 None"""
+        meta = self._cached(self._option_polls.get(option_id))
+        if meta is not None:
+            return meta
+        poll_of_option = (
+            select(options_table.c.poll_id)
+            .where(options_table.c.option_id == option_id)
+            .scalar_subquery()
+        )
+        return await self._load(db, polls_table.c.poll_id == poll_of_option)
+
+    def _active_lock(self) -> asyncio.Lock:
+        """当前事件循环的进行中列表锁"""
+        loop = asyncio.get_running_loop()
+        lock = self._active_locks.get(loop)
+        if lock is None:
+            lock = self._active_locks[loop] = asyncio.Lock()
+        return lock
+
+    def _active_stale(self) -> bool:
+        return self._active_ids is None or time.monotonic() - self._active_loaded_at > self.active_ttl
+
+    async def active(self, db: AsyncSession) -> List[PollMeta]:
+        """进行中的问卷（按问卷ID排序）"""
+        now = utcnow()
+        if self._active_stale():
+            async with self._active_lock():
+                if self._active_stale():
+                    self._active_ids = list((await db.execute(
+                        select(polls_table.c.poll_id)
+                        .where(
+                            polls_table.c.status == ACTIVE,
+                            or_(polls_table.c.ends_at.is_(None), polls_table.c.ends_at > now),
+                        )
+                        .order_by(polls_table.c.poll_id)
+                        .limit(POLL_REGISTRY_MAX_ACTIVE)
+                    )).scalars())
+                    self._active_loaded_at = time.monotonic()
+        cached = {poll_id: self._cached(poll_id) for poll_id in self._active_ids}
+        missing = [poll_id for poll_id, meta in cached.items() if meta is None]
+        if missing:
+            for meta in await self._load_many(db, polls_table.c.poll_id.in_(missing)):
+                cached[meta.poll_id] = meta
+        return [meta for meta in cached.values() if meta is not None and meta.is_active(now)]
+
+    async def current(self, db: AsyncSession) -> Optional[PollMeta]:
+        """当前问卷：进行中的问卷中ID最小的一个"""
+        polls = await self.active(db)
+        return polls[0] if polls else None
+
+    def stats(self) -> dict:
+        return {
+            "polls": len(self._polls),
+            "options": len(self._option_polls),
+            "active": len(self._active_ids) if self._active_ids is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# 全局问卷注册表
+poll_registry = PollRegistry()
@@ -0,0 +1,195 @@
+"""
+Socket.IO 跨进程消息分发
+Socket.IO 默认在进程内存中维护房间成员，多 worker / 多容器部署时，
+某个 worker 发出的房间消息无法送达连接在其他 worker 上的客户端。
+这里根据 SOCKETIO_MANAGER_URL 选择基于消息总线的 client manager：
+- 未配置：进程内管理（单进程部署）
+- redis:// / rediss://：Redis 发布订阅（多节点）
+- amqp://：RabbitMQ（多节点）
+- unix:///path/to/bus.sock：本机 Unix 套接字总线（单机多 worker，无需 Redis）
+- memory://：进程内总线（测试用，模拟多个服务实例）
+"""
+import asyncio
+import fcntl
+import os
+import pickle
+import struct
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+# 消息总线地址，未配置时使用进程内管理
+SOCKETIO_MANAGER_URL = os.getenv("SOCKETIO_MANAGER_URL", "")
+# 消息总线频道名
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "voting_system")
+
+# 进程内总线：频道 -> 订阅者队列
+_local_bus: Dict[str, List[asyncio.Queue]] = defaultdict(list)
+
+
+class AsyncLocalManager(AsyncPubSubManager):
+    """进程内消息总线，同一进程内的多个 Socket.IO 服务实例互相转发消息"""
+    name = 'asynclocal'
+
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._queue: Optional[asyncio.Queue] = None
+
+    async def _publish(self, data):
+        # 序列化后再投递，与真实总线一样不共享可变对象
+        payload = pickle.dumps(data)
+        for queue in list(_local_bus[self.channel]):
+            queue.put_nowait(payload)
+
+    async def _listen(self):
+        self._queue = asyncio.Queue()
+        _local_bus[self.channel].append(self._queue)
+        try:
+            while True:
+                yield await self._queue.get()
+        finally:
+            _local_bus[self.channel].remove(self._queue)
+
+
+_FRAME_HEADER = struct.Struct("!I")
+# 单个订阅者待发送数据超过该值时视为失联并断开，避免拖垮总线
+_MAX_PEER_BUFFER = 8 * 1024 * 1024
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(_FRAME_HEADER.size)
+    (length,) = _FRAME_HEADER.unpack(header)
+    return await reader.readexactly(length)
+
+
+def _frame(payload: bytes) -> bytes:
+    return _FRAME_HEADER.pack(len(payload)) + payload
+
+
+class AsyncUnixSocketManager(AsyncPubSubManager):
+    """
+    本机 Unix 套接字消息总线
+    同一台机器上的各 worker 通过文件锁选举出一个进程兼任转发者（broker），
+    其余进程连接到该套接字；转发者进程退出后锁被释放，其他进程重连时接替
+    """
+    name = 'asyncunixsocket'
+
+    def __init__(self, path, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._broker: Optional[asyncio.AbstractServer] = None
+        self._broker_lock_file = None
+        self._peers = set()
+
+    @property
+    def is_broker(self) -> bool:
+        return self._broker is not None
+
+    async def _try_become_broker(self):
+        """获取文件锁成功则在本进程启动转发服务"""
+        if self._broker is not None:
+            return
+        lock_file = open(self.path + ".lock", "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return
+        self._broker_lock_file = lock_file
+        # 持有锁即可安全清理上一个转发者遗留的套接字文件
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._broker = await asyncio.start_unix_server(self._serve_peer, path=self.path)
+
+    async def _serve_peer(self, reader, writer):
+        """转发者：把任一连接发来的消息转发给所有连接（含发送者，由 host_id 过滤）"""
+        self._peers.add(writer)
+        try:
+            while True:
+                frame = _frame(await _read_frame(reader))
+                for peer in list(self._peers):
+                    if peer.transport.get_write_buffer_size() > _MAX_PEER_BUFFER:
+                        self._peers.discard(peer)
+                        peer.close()
+                        continue
+                    peer.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def _connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            while self._writer is None or self._writer.is_closing():
+                await self._try_become_broker()
+                try:
+                    self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                except (FileNotFoundError, ConnectionRefusedError):
+                    # 转发者尚未就绪或刚刚退出，稍后重试（期间可能由本进程接替）
+                    await asyncio.sleep(0.1)
+
+    def _reset(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _publish(self, data):
+        payload = _frame(pickle.dumps((self.channel, data)))
+        for _ in range(2):
+            await self._connect()
+            try:
+                self._writer.write(payload)
+                await self._writer.drain()
+                return
+            except ConnectionError:
+                self._reset()
+        self._get_logger().error('unix socket bus publish failed')
+
+    async def _listen(self):
+        while True:
+            await self._connect()
+            reader = self._reader
+            try:
+                while True:
+                    channel, data = pickle.loads(await _read_frame(reader))
+                    if channel == self.channel:
+                        yield data
+            except (asyncio.IncompleteReadError, ConnectionError):
+                # 转发者退出，重连（必要时由本进程接替转发）
+                if reader is self._reader:
+                    self._reset()
+
+    async def close(self):
+        """关闭连接；本进程为转发者时释放锁，由其他进程接替"""
+        self._reset()
+        if self._broker is not None:
+            self._broker.close()
+            for peer in list(self._peers):
+                peer.close()
+            self._broker = None
+            self._broker_lock_file.close()
+            self._broker_lock_file = None
+
+
+def create_client_manager(url: str = SOCKETIO_MANAGER_URL, channel: str = SOCKETIO_CHANNEL):
+    """按总线地址创建 Socket.IO client manager；未配置时返回 None（使用进程内管理）"""
+    if not url:
+        return None
+    scheme = url.split("://", 1)[0]
+    if scheme in ("redis", "rediss"):
+        return socketio.AsyncRedisManager(url, channel=channel)
+    if scheme == "amqp":
+        return socketio.AsyncAioPikaManager(url, channel=channel)
+    if scheme == "unix":
+        return AsyncUnixSocketManager(url[len("unix://"):], channel=channel)
+    if scheme == "memory":
+        return AsyncLocalManager(channel=url[len("memory://"):] or channel)
+    raise ValueError(f"不支持的 Socket.IO 消息总线地址: {url}")
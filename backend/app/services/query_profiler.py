@@ -0,0 +1,188 @@
+"""
+按请求的 SQL 剖析与 N+1 检测（默认关闭，QUERY_PROFILER=true 或运行时设置 query_profiler.enabled 开启）
+- 通过 SQLAlchemy 引擎事件记录每个请求执行的语句、耗时与调用位置（app 内最近的调用帧）
+- 语句按"形状"（去掉字面量、合并 IN 列表）归并，同一形状在一个请求内执行次数达到阈值即标记为 N+1 嫌疑
+- 摘要通过 X-Query-Count / X-Query-Time-Ms / X-Query-N1 响应头返回；启动时已开启剖析的应用另提供 /debug/queries
+  查看最近请求的剖析结果（需管理令牌，见 admin_auth）
+"""
+import contextvars
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# 是否开启（有额外开销，仅用于开发与排查）
+QUERY_PROFILER = os.getenv("QUERY_PROFILER", "false").lower() == "true"
+# 同一语句形状在一个请求内执行多少次视为 N+1 嫌疑
+QUERY_PROFILER_N1_THRESHOLD = int(os.getenv("QUERY_PROFILER_N1_THRESHOLD", "3"))
+# 保留最近多少个请求的剖析结果
+QUERY_PROFILER_HISTORY = 100
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|:\w+)(?:\s*,\s*(?:\?|%s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """语句形状：去掉字面量、合并 IN 列表与空白，参数不同的同一查询归为一类"""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+def _call_site() -> str:
+    """
+    app 内最近的调用位置（文件:行号 函数名）
+    异步会话的 SQL 在 greenlet 中执行，调用方协程的帧在父 greenlet 上，沿父 greenlet 继续查找
+    """
+    frame = sys._getframe(2)
+    try:
+        import greenlet
+        current = greenlet.getcurrent()
+    except ImportError:
+        current = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and filename != __file__:
+            return f"{os.path.relpath(filename, os.path.dirname(_APP_DIR))}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+        if frame is None and current is not None and current.parent is not None:
+            current = current.parent
+            frame = current.gr_frame
+    return "unknown"
+
+
+@dataclass
+class QueryRecord:
+    statement: str
+    duration_ms: float
+    call_site: str
+
+
+@dataclass
+class RequestProfile:
+    """单个请求的 SQL 剖析结果"""
+    method: str
+    path: str
+    route: str = ""
+    queries: List[QueryRecord] = field(default_factory=list)
+
+    @property
+    def total_ms(self) -> float:
+        return round(sum(q.duration_ms for q in self.queries), 3)
+
+    def n_plus_one(self, threshold: int = QUERY_PROFILER_N1_THRESHOLD) -> List[dict]:
+        """执行次数达到阈值的语句形状及其调用位置"""
+        shapes = Counter(statement_shape(q.statement) for q in self.queries)
+        candidates = []
+        for shape, count in shapes.most_common():
+            if count < threshold:
+                break
+            sites = sorted({q.call_site for q in self.queries if statement_shape(q.statement) == shape})
+            candidates.append({"statement": shape, "count": count, "call_sites": sites})
+        return candidates
+
+    def summary(self) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "query_count": len(self.queries),
+            "total_ms": self.total_ms,
+            "n_plus_one": self.n_plus_one(),
+            "queries": [
+                {"statement": q.statement, "duration_ms": q.duration_ms, "call_site": q.call_site}
+                for q in self.queries
+            ],
+        }
+
+
+class QueryProfiler:
+    """SQL 剖析器：引擎事件写入当前请求的剖析结果（contextvar），中间件负责开始与结束"""
+
+    def __init__(self, enabled: bool = QUERY_PROFILER, history: int = QUERY_PROFILER_HISTORY):
+        self.enabled = enabled
+        self.recent: Deque[RequestProfile] = deque(maxlen=history)
+        self._current: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+            "query_profile", default=None
+        )
+
+    def instrument(self, engine):
+        """为同步引擎（异步引擎传 async_engine.sync_engine）登记语句耗时与调用位置"""
+
+        # 开始时间记在本条语句的执行上下文上：语句出错时 after_cursor_execute 不会触发，
+        # 记在连接上会残留到连接池中的连接、影响之后语句的耗时
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_execute(conn, cursor, statement, parameters, context, executemany):
+            if context is not None and self._current.get() is not None:
+                context._query_start = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_execute(conn, cursor, statement, parameters, context, executemany):
+            profile = self._current.get()
+            started = getattr(context, "_query_start", None)
+            if profile is None or started is None:
+                return
+            duration = time.perf_counter() - started
+            profile.queries.append(QueryRecord(statement, round(duration * 1000, 3), _call_site()))
+
+    def clear(self):
+        self.recent.clear()
+
+
+class QueryProfilerMiddleware:
+    """ASGI 中间件：开启剖析时记录每个 HTTP 请求的 SQL，并在响应头中返回摘要"""
+
+    def __init__(self, app, profiler: Optional[QueryProfiler] = None):
+        self.app = app
+        self.profiler = profiler or query_profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = profiler._current.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # 流式响应开始发送后执行的语句只计入 /debug/queries 中的结果
+                candidates = profile.n_plus_one()
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-query-count", str(len(profile.queries)).encode()),
+                    (b"x-query-time-ms", str(profile.total_ms).encode()),
+                    (b"x-query-n1", str(len(candidates)).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler._current.reset(token)
+            route = scope.get("route")
+            profile.route = getattr(route, "path", None) or ""
+            profiler.recent.append(profile)
+            for candidate in profile.n_plus_one():
+                logger.warning(
+                    "疑似 N+1 查询",
+                    extra={"path": profile.path, "count": candidate["count"],
+                           "statement": candidate["statement"], "call_sites": candidate["call_sites"]},
+                )
+
+
+# 全局剖析器（main 中登记到异步引擎）
+query_profiler = QueryProfiler()
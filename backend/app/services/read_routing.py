@@ -0,0 +1,239 @@
+"""
+读写分离路由
+写请求（投票、创建问卷）与后台任务使用主库，GET 接口的读请求路由到只读副本（REPLICA_DATABASE_URLS）：
+- 多个副本轮询使用
+- 复制延迟感知：后台定期在主库 replica_heartbeats 表写入心跳时间戳，读取各副本上的心跳得出延迟，
+  延迟超过 REPLICA_MAX_LAG_MS 或无法连接的副本不参与路由，全部不可用时回退到主库
+- 读己之写：客户端写入后 READ_STICKY_MS 内的读请求固定走主库
+  （响应写入 Cookie，多 worker 下同样生效；同时按 IP + User-Agent 在进程内记录，兼容不携带 Cookie 的客户端）
+- 从副本加载的票数快照以非权威方式写入问卷缓存，不会用落后的票数覆盖较新的快照
+本地可用两个 SQLite 文件（复制后启动，REPLICA_MAX_LAG_MS=0 关闭延迟检查）或两个 MySQL 容器验证
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+from fastapi import Depends, Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app import models
+from app.database import get_db
+from app.services.client_keys import anonymous_client_id
+from app.services.voting import insert_ignore
+
+logger = logging.getLogger(__name__)
+
+heartbeats_table = models.ReplicaHeartbeat.__table__
+
+# 副本允许的最大复制延迟（毫秒），0 表示不检查延迟
+REPLICA_MAX_LAG_MS = int(os.getenv("REPLICA_MAX_LAG_MS", "2000"))
+# 心跳写入与延迟检测间隔（毫秒）
+REPLICA_HEARTBEAT_MS = int(os.getenv("REPLICA_HEARTBEAT_MS", "1000"))
+# 客户端写入后读请求固定走主库的时长（毫秒）
+READ_STICKY_MS = int(os.getenv("READ_STICKY_MS", "5000"))
+
+HEARTBEAT_NAME = "replica_heartbeat"
+STICKY_COOKIE = "read_primary_until"
+# 进程内最多记录的读己之写客户端数
+STICKY_MAX_CLIENTS = 100000
+
+
+@dataclass
+class Replica:
+    name: str
+    session_factory: async_sessionmaker
+    lag_ms: Optional[float] = None
+    error: Optional[str] = None
+    reads: int = 0
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def is_replica(db: AsyncSession) -> bool:
+    """会话是否连接到只读副本"""
+    return db.info.get("replica") is not None
+
+
+class ReadRouter:
+    """按副本延迟与读己之写选择读请求使用的数据库"""
+
+    def __init__(
+        self,
+        primary_factory=None,
+        engines=(),
+        max_lag_ms: int = REPLICA_MAX_LAG_MS,
+        heartbeat_ms: int = REPLICA_HEARTBEAT_MS,
+        sticky_ms: int = READ_STICKY_MS,
+    ):
+        self.replicas: List[Replica] = []
+        self.bind(primary_factory, engines)
+        self.max_lag_ms = max_lag_ms
+        self.heartbeat_interval = heartbeat_ms / 1000
+        self.sticky_ms = sticky_ms
+        self._next = itertools.count()
+        # 客户端 -> 读己之写截止时间（毫秒时间戳），按写入顺序排列
+        self._sticky: "OrderedDict[str, int]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.sticky_reads = 0
+        self.fallbacks = 0
+
+    def bind(self, primary_factory, engines):
+        """使用主库会话工厂与副本引擎（全局实例由应用启动时绑定为该应用的数据库）"""
+        self.primary_factory = primary_factory
+        self.replicas = [
+            Replica(
+                name=f"replica{i}",
+                session_factory=async_sessionmaker(
+                    bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+                ),
+            )
+            for i, engine in enumerate(engines)
+        ]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def _available(self, replica: Replica) -> bool:
+        if replica.error is not None:
+            return False
+        if self.max_lag_ms <= 0:
+            return True
+        return replica.lag_ms is not None and replica.lag_ms <= self.max_lag_ms
+
+    def choose(self) -> Optional[Replica]:
+        """轮询选择一个可用副本，全部不可用时返回 None"""
+        if not self.replicas:
+            return None
+        start = next(self._next)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self._available(replica):
+                return replica
+        return None
+
+    @staticmethod
+    def _client(request: Request) -> str:
+        host = request.client.host if request.client else ""
+        return anonymous_client_id(host, request.headers.get("user-agent", ""))
+
+    def mark_write(self, request: Request, response: Response):
+        """客户端写入后调用：其后 sticky_ms 内的读请求走主库"""
+        if not self.enabled or self.sticky_ms <= 0:
+            return
+        until = _now_ms() + self.sticky_ms
+        client = self._client(request)
+        self._sticky[client] = until
+        self._sticky.move_to_end(client)
+        while len(self._sticky) > STICKY_MAX_CLIENTS:
+            self._sticky.popitem(last=False)
+        response.set_cookie(STICKY_COOKIE, str(until), max_age=max(1, self.sticky_ms // 1000), httponly=True)
+
+    def is_sticky(self, request: Request) -> bool:
+        """客户端是否处于读己之写窗口内"""
+        if not self.enabled:
+            return False
+        now = _now_ms()
+        try:
+            if int(request.cookies.get(STICKY_COOKIE, "0")) > now:
+                return True
+        except ValueError:
+            pass
+        # 顺带清理已过期的记录（按写入顺序，最早的最先过期）
+        while self._sticky and next(iter(self._sticky.values())) <= now:
+            self._sticky.popitem(last=False)
+        return self._sticky.get(self._client(request), 0) > now
+
+    def replica_session(self, request: Optional[Request] = None) -> Optional[AsyncSession]:
+        """读请求的副本会话；读己之写窗口内或无可用副本时返回 None（使用主库）"""
+        if not self.enabled:
+            return None
+        if request is not None and self.is_sticky(request):
+            self.sticky_reads += 1
+            return None
+        replica = self.choose()
+        if replica is None:
+            self.fallbacks += 1
+            return None
+        replica.reads += 1
+        db = replica.session_factory()
+        db.info["replica"] = replica.name
+        return db
+
+    async def heartbeat_once(self):
+        """主库写入心跳时间戳，读取各副本上的心跳计算复制延迟"""
+        async with self.primary_factory() as db:
+            result = await db.execute(
+                update(heartbeats_table)
+                .where(heartbeats_table.c.name == HEARTBEAT_NAME)
+                .values(beat_ms=_now_ms())
+            )
+            if result.rowcount == 0:
+                await db.execute(insert_ignore(heartbeats_table).values(name=HEARTBEAT_NAME, beat_ms=_now_ms()))
+            await db.commit()
+        for replica in self.replicas:
+            try:
+                async with replica.session_factory() as db:
+                    beat = await db.scalar(
+                        select(heartbeats_table.c.beat_ms).where(heartbeats_table.c.name == HEARTBEAT_NAME)
+                    )
+                replica.lag_ms = None if not beat else max(0, _now_ms() - beat)
+                replica.error = None
+            except Exception as e:
+                if replica.error is None:
+                    logger.warning("只读副本不可用", extra={"replica": replica.name, "error": str(e)})
+                replica.error = str(e)
+
+    def start(self):
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.heartbeat_once()
+            except Exception:
+                logger.exception("副本延迟检测失败")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "replicas": [
+                {"name": r.name, "lag_ms": r.lag_ms, "available": self._available(r), "reads": r.reads}
+                for r in self.replicas
+            ],
+            "sticky_reads": self.sticky_reads,
+            "fallbacks": self.fallbacks,
+        }
+
+
+# 全局读写路由（应用启动时绑定副本；未配置副本时所有读请求使用主库）
+read_router = ReadRouter()
+
+
+async def get_read_db(request: Request, primary: AsyncSession = Depends(get_db)):
+    """依赖项：获取读请求的异步数据库会话（副本或主库；主库会话在执行查询前不占用连接）"""
+    replica_db = read_router.replica_session(request)
+    if replica_db is None:
+        yield primary
+        return
+    async with replica_db:
+        yield replica_db
@@ -0,0 +1,247 @@
+"""
+票数对账任务
+options.vote_count 是 votes 表的计数缓存，事务异常、手工清理或脚本误操作都可能使二者不一致。
+对账任务按 vote_id 水位线增量聚合 votes 表，不做全表 GROUP BY：
+- tally_checkpoints 保存截至水位线各选项的投票记录数，watermarks 保存水位线，重启后接着聚合
+- 水位线只推进到上一轮观察到的最大 vote_id，给进行中的事务留出提交时间（自增ID可能乱序提交）
+- 每轮在同一事务（一致性快照）内聚合水位线之后的尾部投票，与 vote_count 比较得出偏差
+- 开启修复时以比较并交换（WHERE vote_count = 快照值）的方式修正，多个 worker 同时修复也不会重复修正
+- 开启计数分片时比较的是 vote_count + 各分片之和，修正写入 vote_count 基数
+- 归档工具删除的是水位线之前的投票，检查点不变；重置工具会按剩余投票重算检查点
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+
+from app import models
+from app.services.counters import option_total
+from app.services.watermarks import advance_watermark, read_watermark
+
+logger = logging.getLogger(__name__)
+
+votes_table = models.Vote.__table__
+options_table = models.Option.__table__
+checkpoints_table = models.TallyCheckpoint.__table__
+watermarks_table = models.Watermark.__table__
+
+# 对账间隔（毫秒），0 表示关闭
+VOTE_RECONCILE_INTERVAL_MS = int(os.getenv("VOTE_RECONCILE_INTERVAL_MS", "30000"))
+# 是否自动修复偏差（否则只报告）
+VOTE_RECONCILE_REPAIR = os.getenv("VOTE_RECONCILE_REPAIR", "false").lower() == "true"
+# 追赶水位线时每次聚合的 vote_id 区间长度
+VOTE_RECONCILE_BATCH = int(os.getenv("VOTE_RECONCILE_BATCH", "100000"))
+
+WATERMARK_NAME = "tally_reconciler"
+# 投票归档工具记录的已归档最大 vote_id（app.services.vote_archive）
+ARCHIVE_WATERMARK = "vote_archive"
+
+
+class TallyReconciler:
+    """按 vote_id 水位线增量对账 votes 与 options.vote_count"""
+
+    def __init__(
+        self,
+        session_factory=None,
+        interval_ms: int = VOTE_RECONCILE_INTERVAL_MS,
+        repair: bool = VOTE_RECONCILE_REPAIR,
+        batch_size: int = VOTE_RECONCILE_BATCH,
+    ):
+        # 全局实例的会话工厂由应用启动时绑定为该应用的数据库（app.main.lifespan）
+        self.session_factory = session_factory
+        self.interval = interval_ms / 1000
+        self.repair = repair
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._loaded = False
+        # 截至水位线各选项的投票记录数（与 tally_checkpoints 一致）
+        self._counted: Dict[int, int] = {}
+        self._settled_vote_id = 0
+        # 上一轮观察到的最大 vote_id，本轮水位线最多推进到这里
+        self._observed_vote_id: Optional[int] = None
+        self.runs = 0
+        self.checks = 0
+        self.repaired = 0
+        self.last_run_ms = 0.0
+        self.last_checked_at: Optional[float] = None
+        self.drift: List[dict] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    async def _load(self, db):
+        """从检查点表加载水位线与各选项计数"""
+        watermark = await read_watermark(db, WATERMARK_NAME)
+        rows = (await db.execute(
+            select(checkpoints_table.c.option_id, checkpoints_table.c.counted_votes)
+        )).all()
+        self._settled_vote_id = watermark
+        self._counted = {option_id: counted for option_id, counted in rows}
+        self._loaded = True
+
+    async def _advance(self, db, upper: int) -> bool:
+        """
+        聚合 (水位线, upper] 区间的投票并推进水位线
+        以水位线做比较并交换，其他 worker 已推进时放弃本次结果并重新加载，返回 False
+        """
+        lower = self._settled_vote_id
+        rows = (await db.execute(
+            select(votes_table.c.option_id, func.count())
+            .where(votes_table.c.vote_id > lower, votes_table.c.vote_id <= upper)
+            .group_by(votes_table.c.option_id)
+        )).all()
+        if not await advance_watermark(db, WATERMARK_NAME, lower, upper):
+            await db.rollback()
+            await self._load(db)
+            return False
+        for option_id, count in rows:
+            if option_id in self._counted:
+                await db.execute(
+                    update(checkpoints_table)
+                    .where(checkpoints_table.c.option_id == option_id)
+                    .values(counted_votes=checkpoints_table.c.counted_votes + count)
+                )
+            else:
+                await db.execute(
+                    insert(checkpoints_table).values(option_id=option_id, counted_votes=count)
+                )
+        await db.commit()
+        for option_id, count in rows:
+            self._counted[option_id] = self._counted.get(option_id, 0) + count
+        self._settled_vote_id = upper
+        return True
+
+    async def _reset(self, db):
+        """votes 表被清理（最大 vote_id 回退到水位线以下，且不是归档造成的）时清空检查点重新计数"""
+        await db.execute(delete(checkpoints_table))
+        await advance_watermark(db, WATERMARK_NAME, self._settled_vote_id, 0)
+        await db.commit()
+        self._counted = {}
+        self._settled_vote_id = 0
+        self._observed_vote_id = None
+        logger.warning("票数对账: votes 表已被清理，检查点已重置")
+
+    async def _check(self, db) -> List[dict]:
+        """在同一快照内聚合水位线之后的尾部投票，与 vote_count 比较"""
+        tail = dict((await db.execute(
+            select(votes_table.c.option_id, func.count())
+            .where(votes_table.c.vote_id > self._settled_vote_id)
+            .group_by(votes_table.c.option_id)
+        )).all())
+        actual = (await db.execute(
+            select(options_table.c.option_id, option_total())
+        )).all()
+        drift = []
+        for option_id, vote_count in actual:
+            expected = self._counted.get(option_id, 0) + tail.get(option_id, 0)
+            if vote_count != expected:
+                drift.append({
+                    "option_id": option_id,
+                    "expected": expected,
+                    "actual": vote_count,
+                    "drift": vote_count - expected,
+                })
+        return drift
+
+    async def _repair(self, db, drift: List[dict]):
+        """按快照值比较并交换修正；其间有新投票或其他 worker 已修正时跳过，留待下一轮"""
+        repaired = 0
+        for item in drift:
+            result = await db.execute(
+                update(options_table)
+                .where(
+                    options_table.c.option_id == item["option_id"],
+                    option_total() == item["actual"],
+                )
+                .values(vote_count=options_table.c.vote_count - item["drift"])
+            )
+            repaired += result.rowcount
+        await db.commit()
+        self.repaired += repaired
+        if repaired:
+            logger.warning("票数对账: 已修正 %d 个选项的票数", repaired)
+
+    async def run_once(self) -> List[dict]:
+        """执行一轮对账，返回本轮发现的偏差（水位线尚未追平时返回空列表）"""
+        started = time.monotonic()
+        async with self.session_factory() as db:
+            # 每轮重新加载：其他 worker 推进的水位线与重置工具重算的检查点即时生效
+            await self._load(db)
+            current = await db.scalar(select(func.max(votes_table.c.vote_id))) or 0
+            archived = await db.scalar(
+                select(watermarks_table.c.vote_id).where(watermarks_table.c.name == ARCHIVE_WATERMARK)
+            ) or 0
+            await db.commit()
+            # 归档会删除水位线以下（可能包括最新的）投票，最大 vote_id 不超过已归档位置时不视为清表
+            if current < self._settled_vote_id and current >= archived:
+                await self._reset(db)
+
+            # 追赶水位线：分段聚合，每段一个短事务
+            target = min(self._observed_vote_id or 0, current)
+            while self._settled_vote_id < target:
+                upper = min(self._settled_vote_id + self.batch_size, target)
+                await self._advance(db, upper)
+            caught_up = self._observed_vote_id is not None and self._settled_vote_id >= target
+            self._observed_vote_id = current
+
+            drift = []
+            if caught_up:
+                drift = await self._check(db)
+                await db.commit()
+                self.checks += 1
+                self.last_checked_at = time.time()
+                self.drift = drift
+                if drift:
+                    logger.warning(
+                        "票数对账: %d 个选项的 vote_count 与投票记录不一致", len(drift), extra={"drift": drift}
+                    )
+                    if self.repair:
+                        await self._repair(db, drift)
+        self.runs += 1
+        self.last_run_ms = round((time.monotonic() - started) * 1000, 2)
+        return drift
+
+    def start(self):
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("票数对账失败")
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "repair": self.repair,
+            "settled_vote_id": self._settled_vote_id,
+            "observed_vote_id": self._observed_vote_id,
+            "runs": self.runs,
+            "checks": self.checks,
+            "last_run_ms": self.last_run_ms,
+            "last_checked_at": self.last_checked_at,
+            "drifted_options": len(self.drift),
+            "drift": self.drift,
+            "repaired": self.repaired,
+        }
+
+
+# 全局对账任务（应用启动时开启）
+reconciler = TallyReconciler()
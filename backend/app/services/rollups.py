@@ -0,0 +1,280 @@
+"""
+投票时间序列汇总
+按选项、时间粒度（1s / 1m / 1h）、时间桶累计票数，图表查询直接读取汇总结果，不扫描投票记录：
+- 后台按 vote_id 水位线增量聚合新提交的投票（主键范围扫描，无需 voted_at 索引）
+- 每个 worker 在内存中保留最近一段时间的各粒度时间桶，时间窗口在保留范围内时直接从内存返回
+- 汇总结果同时累加写入 vote_rollups 表，以 watermarks 水位线比较并交换保证多 worker 下只写入一次
+- 水位线只推进到上一轮观察到的最大 vote_id，给进行中的事务留出提交时间
+- voted_at 按 UTC 存储（MySQL 会话时区固定为 UTC，见 app.database.utc_connect_args），时间桶起点即其 UNIX 时间戳
+"""
+import asyncio
+import calendar
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import mysql, sqlite
+
+from app import models
+from app.services.watermarks import advance_watermark, read_watermark
+
+logger = logging.getLogger(__name__)
+
+votes_table = models.Vote.__table__
+rollups_table = models.VoteRollup.__table__
+
+# 时间粒度名称 -> 秒数
+RESOLUTIONS = {"1s": 1, "1m": 60, "1h": 3600}
+# 各粒度在内存中保留的时长（秒）
+MEMORY_RETENTION = {1: 3600, 60: 86400, 3600: 30 * 86400}
+
+# 汇总间隔（毫秒），0 表示关闭
+VOTE_ROLLUP_INTERVAL_MS = int(os.getenv("VOTE_ROLLUP_INTERVAL_MS", "1000"))
+# 1s 粒度在汇总表中的保留时长（秒），1m / 1h 粒度永久保留
+VOTE_ROLLUP_SECOND_RETENTION_S = int(os.getenv("VOTE_ROLLUP_SECOND_RETENTION_S", "86400"))
+# 追赶水位线时每次聚合的 vote_id 区间长度
+VOTE_ROLLUP_BATCH = 100000
+# 单次查询最多返回的时间桶数
+VOTE_TIMESERIES_MAX_BUCKETS = 3600
+
+WATERMARK_NAME = "vote_rollups"
+
+# (option_id, 秒级时间戳, 票数)
+SecondCounts = List[Tuple[int, int, int]]
+
+
+def _upsert(dialect: str, rows: List[dict]):
+    """累加写入汇总表：主键冲突时 vote_count 相加"""
+    if dialect == "mysql":
+        stmt = mysql.insert(rollups_table).values(rows)
+        return stmt.on_duplicate_key_update(vote_count=rollups_table.c.vote_count + stmt.inserted.vote_count)
+    stmt = sqlite.insert(rollups_table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[rollups_table.c.option_id, rollups_table.c.resolution, rollups_table.c.bucket_start],
+        set_={"vote_count": rollups_table.c.vote_count + stmt.excluded.vote_count},
+    )
+
+
+def bucket_window(resolution: int, end: float, window: int) -> Tuple[int, int]:
+    """时间窗口对齐到时间桶：返回 (首个时间桶起点, 最后一个时间桶起点)"""
+    last = int(end) // resolution * resolution
+    first = int(end - window) // resolution * resolution + resolution
+    return min(first, last), last
+
+
+class VoteRollups:
+    """投票时间序列汇总（内存 + 汇总表）"""
+
+    def __init__(
+        self,
+        session_factory=None,
+        interval_ms: int = VOTE_ROLLUP_INTERVAL_MS,
+        batch_size: int = VOTE_ROLLUP_BATCH,
+    ):
+        # 全局实例的会话工厂由应用启动时绑定为该应用的数据库（app.main.lifespan）
+        self.session_factory = session_factory
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+        # 粒度 -> 选项 -> 时间桶起点 -> 票数
+        self._buckets: Dict[int, Dict[int, Dict[int, int]]] = {res: defaultdict(dict) for res in MEMORY_RETENTION}
+        self._vote_id = 0
+        self._observed_vote_id: Optional[int] = None
+        self._pruned_at = 0.0
+        self.runs = 0
+        self.persisted_ranges = 0
+        self.memory_reads = 0
+        self.table_reads = 0
+        self.last_run_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def _apply(self, rows: SecondCounts):
+        """将按秒聚合的票数累加到内存中各粒度的时间桶"""
+        for option_id, second, count in rows:
+            for res, options in self._buckets.items():
+                buckets = options[option_id]
+                bucket = second // res * res
+                buckets[bucket] = buckets.get(bucket, 0) + count
+
+    def _prune_memory(self, now: float):
+        for res, options in self._buckets.items():
+            cutoff = now - MEMORY_RETENTION[res]
+            for buckets in options.values():
+                for bucket in [b for b in buckets if b < cutoff]:
+                    del buckets[bucket]
+
+    async def _load(self, db):
+        """读取水位线，并从汇总表加载内存保留范围内的时间桶"""
+        self._vote_id = await read_watermark(db, WATERMARK_NAME)
+        now = time.time()
+        for res, options in self._buckets.items():
+            options.clear()
+            rows = (await db.execute(
+                select(rollups_table.c.option_id, rollups_table.c.bucket_start, rollups_table.c.vote_count)
+                .where(
+                    rollups_table.c.resolution == res,
+                    rollups_table.c.bucket_start >= now - MEMORY_RETENTION[res],
+                )
+            )).all()
+            for option_id, bucket, count in rows:
+                options[option_id][bucket] = count
+        await db.commit()
+        self.ready = True
+
+    async def _aggregate(self, db, lower: int, upper: int) -> SecondCounts:
+        """按选项、秒聚合 (lower, upper] 区间的投票"""
+        rows = (await db.execute(
+            select(votes_table.c.option_id, votes_table.c.voted_at, func.count())
+            .where(votes_table.c.vote_id > lower, votes_table.c.vote_id <= upper)
+            .group_by(votes_table.c.option_id, votes_table.c.voted_at)
+        )).all()
+        return [
+            (option_id, calendar.timegm(voted_at.timetuple()), count)
+            for option_id, voted_at, count in rows
+        ]
+
+    async def _persist(self, db, lower: int, upper: int, rows: SecondCounts):
+        """
+        将 (lower, upper] 的汇总累加写入汇总表
+        表中水位线与 lower 不一致（其他 worker 已写入或写入进度落后）时按表中水位线重新聚合
+        """
+        persisted = await read_watermark(db, WATERMARK_NAME)
+        if persisted >= upper:
+            await db.commit()
+            return
+        if persisted != lower:
+            upper = min(upper, persisted + self.batch_size)
+            rows = await self._aggregate(db, persisted, upper)
+        if not await advance_watermark(db, WATERMARK_NAME, persisted, upper):
+            # 其他 worker 抢先写入了该区间
+            await db.rollback()
+            return
+        merged: Dict[Tuple[int, int, int], int] = defaultdict(int)
+        for option_id, second, count in rows:
+            for res in RESOLUTIONS.values():
+                merged[(option_id, res, second // res * res)] += count
+        values = [
+            {"option_id": option_id, "resolution": res, "bucket_start": bucket, "vote_count": count}
+            for (option_id, res, bucket), count in merged.items()
+        ]
+        for i in range(0, len(values), 1000):
+            await db.execute(_upsert(db.bind.dialect.name, values[i:i + 1000]))
+        await db.commit()
+        self.persisted_ranges += 1
+
+    async def _prune_table(self, db, now: float):
+        """清理汇总表中过期的 1s 粒度时间桶（每小时一次）"""
+        if now - self._pruned_at < 3600:
+            return
+        self._pruned_at = now
+        await db.execute(
+            delete(rollups_table).where(
+                rollups_table.c.resolution == 1,
+                rollups_table.c.bucket_start < now - VOTE_ROLLUP_SECOND_RETENTION_S,
+            )
+        )
+        await db.commit()
+
+    async def run_once(self):
+        """执行一轮增量汇总"""
+        started = time.monotonic()
+        async with self.session_factory() as db:
+            if not self.ready:
+                await self._load(db)
+            current = await db.scalar(select(func.max(votes_table.c.vote_id))) or 0
+            await db.commit()
+            target = min(self._observed_vote_id or 0, current)
+            while self._vote_id < target:
+                upper = min(self._vote_id + self.batch_size, target)
+                rows = await self._aggregate(db, self._vote_id, upper)
+                await self._persist(db, self._vote_id, upper, rows)
+                self._apply(rows)
+                self._vote_id = upper
+            self._observed_vote_id = current
+            now = time.time()
+            self._prune_memory(now)
+            await self._prune_table(db, now)
+        self.runs += 1
+        self.last_run_ms = round((time.monotonic() - started) * 1000, 2)
+
+    def covers(self, resolution: int, first: int) -> bool:
+        """内存中是否保留了从 first 开始的时间桶"""
+        return self.ready and first >= time.time() - MEMORY_RETENTION[resolution]
+
+    async def series(
+        self,
+        db,
+        option_ids: Iterable[int],
+        resolution: int,
+        first: int,
+        last: int,
+    ) -> Dict[int, List[int]]:
+        """读取各选项 [first, last] 范围内每个时间桶的票数（内存未覆盖时查询汇总表）"""
+        option_ids = list(option_ids)
+        bucket_starts = range(first, last + 1, resolution)
+        if self.covers(resolution, first):
+            self.memory_reads += 1
+            options = self._buckets[resolution]
+            return {
+                option_id: [options.get(option_id, {}).get(b, 0) for b in bucket_starts]
+                for option_id in option_ids
+            }
+        self.table_reads += 1
+        rows = (await db.execute(
+            select(rollups_table.c.option_id, rollups_table.c.bucket_start, rollups_table.c.vote_count)
+            .where(
+                rollups_table.c.option_id.in_(option_ids),
+                rollups_table.c.resolution == resolution,
+                rollups_table.c.bucket_start >= first,
+                rollups_table.c.bucket_start <= last,
+            )
+        )).all()
+        counts = defaultdict(dict)
+        for option_id, bucket, count in rows:
+            counts[option_id][bucket] = count
+        return {option_id: [counts[option_id].get(b, 0) for b in bucket_starts] for option_id in option_ids}
+
+    def start(self):
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("投票时间序列汇总失败")
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "vote_id": self._vote_id,
+            "runs": self.runs,
+            "persisted_ranges": self.persisted_ranges,
+            "memory_reads": self.memory_reads,
+            "table_reads": self.table_reads,
+            "last_run_ms": self.last_run_ms,
+        }
+
+
+# 全局时间序列汇总（应用启动时开启）
+vote_rollups = VoteRollups()
@@ -0,0 +1,110 @@
+"""
+问卷序列化
+前端问卷格式（id / text / votes / totalVotes / ISO 时间）与统计格式只在此处构建，编码结果按快照版本缓存复用：
+- 安装 orjson 时使用 orjson 编码（pip install orjson），否则回退到标准库 json
+- FastJSONResponse 作为路由默认响应类，替代 FastAPI 默认的 JSON 编码
+- 投票响应由预编码的问卷字节拼接而成，同一版本的问卷不重复编码
+"""
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse, Response
+
+from app.services.voting import PollTally
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def dumps(data: Any) -> bytes:
+    """紧凑 UTF-8 JSON 编码（非 ASCII 字符不转义）"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def poll_payload(tally: PollTally, version: int, epoch: str = "") -> dict:
+    """将票数快照转换为前端期望的问卷格式（version 只在同一 epoch 内可比较）"""
+    created_at = tally.created_at.isoformat()
+    return {
+        "id": str(tally.poll_id),
+        "title": tally.title,
+        "description": "",
+        "options": [
+            {
+                "id": str(opt.option_id),
+                "text": opt.label,
+                "votes": opt.vote_count
+            }
+            for opt in tally.options
+        ],
+        "totalVotes": tally.total_votes,
+        "isActive": tally.is_active,
+        "version": version,
+        "epoch": epoch,
+        "createdAt": created_at,
+        "updatedAt": created_at
+    }
+
+
+def statistics_payload(tally: PollTally) -> dict:
+    """将票数快照转换为统计接口格式（与 schemas.PollStatistics 一致）"""
+    total_votes = tally.total_votes
+    return {
+        "poll_id": tally.poll_id,
+        "title": tally.title,
+        "total_votes": total_votes,
+        "options": [
+            {
+                "option_id": opt.option_id,
+                "label": opt.label,
+                "vote_count": opt.vote_count,
+                "percentage": round(opt.vote_count / total_votes * 100, 2) if total_votes > 0 else 0
+            }
+            for opt in tally.options
+        ]
+    }
+
+
+def _prefix(fields: dict, key: str) -> bytes:
+    """响应对象的固定前缀：拼接预编码的 JSON 与 "}" 即得到 {...fields, key: 预编码内容}"""
+    return dumps(fields)[:-1] + b"," + dumps(key) + b":"
+
+
+POLL_BODY_PREFIX = _prefix({"success": True}, "data")
+VOTE_CREATED_PREFIX = _prefix({"success": True, "message": "投票成功"}, "poll")
+VOTE_DUPLICATE_PREFIX = _prefix({"success": True, "message": "您已经投过票了，这是当前投票结果"}, "poll")
+
+
+def poll_body(poll_json: bytes) -> bytes:
+    """GET /api/poll 响应：{"success": true, "data": 问卷}"""
+    return POLL_BODY_PREFIX + poll_json + b"}"
+
+
+def vote_body(poll_json: bytes, created: bool) -> bytes:
+    """投票响应：{"success": true, "message": ..., "poll": 问卷}"""
+    prefix = VOTE_CREATED_PREFIX if created else VOTE_DUPLICATE_PREFIX
+    return prefix + poll_json + b"}"
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 dumps 编码的 JSON 响应"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class EncodedJSONResponse(Response):
+    """内容已是编码好的 JSON 字节"""
+    media_type = "application/json"
@@ -0,0 +1,241 @@
+"""
+投票记录归档与按问卷重置
+votes 表只保留进行中问卷的投票：热表小，索引常驻 buffer pool，写入保持快速。
+- 归档：已结束问卷（status=closed 或已过 ends_at）的投票按 vote_id 分批导出为 gzip 压缩的 CSV 文件
+  （列与导出接口的 CSV 一致），文件完整写入并改名后再分批删除，每批一个短事务；选项票数与投票人记录保留
+- 只归档对账与时间序列汇总水位线之前的投票（已计入检查点与汇总表），删除后二者的结果不变；
+  两个任务都还没有水位线时拒绝归档，否则删除的投票既没有计入检查点也没有计入汇总表
+- 文件名带本次归档的最大 vote_id，中断后重跑先删完已归档部分，再归档剩余投票，不会重复归档
+- 压缩与文件读写在线程池中执行，不阻塞事件循环（可在应用进程内调用）
+- 重置：按问卷分批删除投票记录与投票人，最后在一个短事务内重算票数、对账检查点并清理分片与汇总，
+  全程不长时间锁表，不阻塞其他问卷的投票
+"""
+import asyncio
+import glob
+import gzip
+import logging
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.services import reconciler, rollups
+from app.services.poll_registry import CLOSED, utcnow
+from app.services.vote_export import csv_lines, poll_votes_query
+from app.services.watermarks import advance_watermark, read_watermark
+
+logger = logging.getLogger(__name__)
+
+polls_table = models.Poll.__table__
+options_table = models.Option.__table__
+votes_table = models.Vote.__table__
+voters_table = models.PollVoter.__table__
+checkpoints_table = models.TallyCheckpoint.__table__
+rollups_table = models.VoteRollup.__table__
+shards_table = models.OptionCounterShard.__table__
+watermarks_table = models.Watermark.__table__
+
+# 归档文件目录
+VOTE_ARCHIVE_DIR = os.getenv("VOTE_ARCHIVE_DIR", "archives")
+# 归档与重置每批处理的行数（每批一个事务）
+VOTE_ARCHIVE_BATCH = int(os.getenv("VOTE_ARCHIVE_BATCH", "5000"))
+
+# 已归档删除的最大 vote_id（对账任务据此区分归档与清表）
+ARCHIVE_WATERMARK = reconciler.ARCHIVE_WATERMARK
+# 归档前须已处理的后台任务水位线
+SETTLED_WATERMARKS = (reconciler.WATERMARK_NAME, rollups.WATERMARK_NAME)
+
+ARCHIVE_FILE_PATTERN = re.compile(r"poll_(\d+)_votes_(\d+)\.csv\.gz$")
+
+
+class PollNotClosedError(Exception):
+    """问卷仍在进行中，不能归档"""
+
+
+class VotesNotSettledError(Exception):
+    """对账与时间序列汇总任务都还没有处理过投票，不能归档"""
+
+
+@dataclass
+class ArchiveResult:
+    poll_id: int
+    files: List[str]
+    archived: int = 0
+    deleted: int = 0
+    # 尚未被后台任务处理、留待下次归档的投票数
+    pending: int = 0
+
+
+def archive_file(directory: str, poll_id: int, last_vote_id: int) -> str:
+    return os.path.join(directory, f"poll_{poll_id}_votes_{last_vote_id}.csv.gz")
+
+
+def archived_upto(directory: str, poll_id: int) -> int:
+    """目录中该问卷已归档文件覆盖到的最大 vote_id"""
+    upto = 0
+    for path in glob.glob(os.path.join(directory, f"poll_{poll_id}_votes_*.csv.gz")):
+        match = ARCHIVE_FILE_PATTERN.search(os.path.basename(path))
+        if match:
+            upto = max(upto, int(match.group(2)))
+    return upto
+
+
+async def _option_ids(db: AsyncSession, poll_id: int) -> List[int]:
+    return list((await db.execute(
+        select(options_table.c.option_id).where(options_table.c.poll_id == poll_id)
+    )).scalars())
+
+
+async def _settled_upper(db: AsyncSession) -> Optional[int]:
+    """后台任务水位线中最小的一个（未运行的任务没有水位线，不参与）；均未运行时返回 None"""
+    values = (await db.execute(
+        select(watermarks_table.c.vote_id).where(watermarks_table.c.name.in_(SETTLED_WATERMARKS))
+    )).scalars().all()
+    return min(values) if values else None
+
+
+async def closed_poll_ids(db: AsyncSession, now: Optional[datetime] = None) -> List[int]:
+    """已结束的问卷"""
+    now = now or utcnow()
+    return list((await db.execute(
+        select(polls_table.c.poll_id)
+        .where(or_(polls_table.c.status == CLOSED, polls_table.c.ends_at <= now))
+        .order_by(polls_table.c.poll_id)
+    )).scalars())
+
+
+async def _delete_votes(db: AsyncSession, option_ids: List[int], upper: Optional[int], batch_size: int) -> int:
+    """按 vote_id 分批删除选项的投票（upper 为空时不限），每批提交一次"""
+    deleted = 0
+    while True:
+        query = select(votes_table.c.vote_id).where(votes_table.c.option_id.in_(option_ids))
+        if upper is not None:
+            query = query.where(votes_table.c.vote_id <= upper)
+        ids = list((await db.execute(query.order_by(votes_table.c.vote_id).limit(batch_size))).scalars())
+        if not ids:
+            return deleted
+        await db.execute(delete(votes_table).where(votes_table.c.vote_id.in_(ids)))
+        await db.commit()
+        deleted += len(ids)
+
+
+async def _advance_archive_watermark(db: AsyncSession, value: int):
+    """归档水位线只增不减"""
+    while True:
+        current = await read_watermark(db, ARCHIVE_WATERMARK)
+        if current >= value or await advance_watermark(db, ARCHIVE_WATERMARK, current, value):
+            await db.commit()
+            return
+        await db.rollback()
+
+
+async def archive_poll(
+    db: AsyncSession,
+    poll_id: int,
+    directory: str = VOTE_ARCHIVE_DIR,
+    batch_size: int = VOTE_ARCHIVE_BATCH,
+) -> ArchiveResult:
+    """将已结束问卷的投票归档到 gzip CSV 文件并从 votes 表删除"""
+    poll = (await db.execute(
+        select(polls_table.c.status, polls_table.c.ends_at).where(polls_table.c.poll_id == poll_id)
+    )).first()
+    if poll is None or not (poll.status == CLOSED or (poll.ends_at is not None and poll.ends_at <= utcnow())):
+        raise PollNotClosedError(poll_id)
+    upper = await _settled_upper(db)
+    if upper is None:
+        raise VotesNotSettledError(poll_id)
+    option_ids = await _option_ids(db, poll_id)
+    result = ArchiveResult(poll_id=poll_id, files=[])
+    await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+
+    # 上次中断时已写好文件但未删完的部分
+    done = await asyncio.to_thread(archived_upto, directory, poll_id)
+    if done:
+        result.deleted += await _delete_votes(db, option_ids, done, batch_size)
+    await db.commit()
+    partial = os.path.join(directory, f"poll_{poll_id}_votes.csv.gz.partial")
+    last_vote_id = done
+    f = await asyncio.to_thread(gzip.open, partial, "wt", encoding="utf-8", newline="")
+    try:
+        await asyncio.to_thread(f.write, csv_lines((), header=True))
+        while True:
+            query = poll_votes_query(poll_id, last_vote_id, batch_size).where(votes_table.c.vote_id <= upper)
+            rows = (await db.execute(query)).mappings().all()
+            await db.commit()
+            if not rows:
+                break
+            await asyncio.to_thread(f.write, csv_lines(rows))
+            last_vote_id = rows[-1]["vote_id"]
+            result.archived += len(rows)
+    finally:
+        await asyncio.to_thread(f.close)
+    if result.archived:
+        path = archive_file(directory, poll_id, last_vote_id)
+        await asyncio.to_thread(os.replace, partial, path)
+        result.files.append(path)
+        result.deleted += await _delete_votes(db, option_ids, last_vote_id, batch_size)
+    else:
+        await asyncio.to_thread(os.remove, partial)
+    if last_vote_id:
+        await _advance_archive_watermark(db, last_vote_id)
+
+    if option_ids:
+        result.pending = await db.scalar(
+            select(func.count()).select_from(votes_table).where(votes_table.c.option_id.in_(option_ids))
+        )
+        await db.commit()
+    logger.info("问卷投票已归档", extra={
+        "poll_id": poll_id, "archived": result.archived, "deleted": result.deleted, "pending": result.pending,
+    })
+    return result
+
+
+async def reset_poll(db: AsyncSession, poll_id: int, batch_size: int = VOTE_ARCHIVE_BATCH) -> dict:
+    """
+    清空问卷的投票：分批删除投票记录与投票人，最后重算票数
+    重置期间仍可投票，最后一步按剩余的投票记录重算 vote_count 与对账检查点，二者保持一致
+    """
+    option_ids = await _option_ids(db, poll_id)
+    votes = await _delete_votes(db, option_ids, None, batch_size) if option_ids else 0
+
+    voters = 0
+    while True:
+        keys = list((await db.execute(
+            select(voters_table.c.client_key).where(voters_table.c.poll_id == poll_id).limit(batch_size)
+        )).scalars())
+        if not keys:
+            break
+        await db.execute(
+            delete(voters_table).where(voters_table.c.poll_id == poll_id, voters_table.c.client_key.in_(keys))
+        )
+        await db.commit()
+        voters += len(keys)
+
+    if option_ids:
+        settled = await read_watermark(db, reconciler.WATERMARK_NAME)
+        remaining = (
+            select(func.count())
+            .select_from(votes_table)
+            .where(votes_table.c.option_id == options_table.c.option_id)
+            .scalar_subquery()
+        )
+        counted = (
+            select(func.count())
+            .select_from(votes_table)
+            .where(votes_table.c.option_id == checkpoints_table.c.option_id, votes_table.c.vote_id <= settled)
+            .scalar_subquery()
+        )
+        await db.execute(update(options_table).where(options_table.c.poll_id == poll_id).values(vote_count=remaining))
+        await db.execute(delete(shards_table).where(shards_table.c.option_id.in_(option_ids)))
+        await db.execute(
+            update(checkpoints_table).where(checkpoints_table.c.option_id.in_(option_ids)).values(counted_votes=counted)
+        )
+        await db.execute(delete(rollups_table).where(rollups_table.c.option_id.in_(option_ids)))
+        await db.commit()
+    logger.info("问卷投票已重置", extra={"poll_id": poll_id, "votes": votes, "voters": voters})
+    return {"poll_id": poll_id, "votes": votes, "voters": voters}
@@ -0,0 +1,261 @@
+"""
+投票写缓冲（write-behind）
+开启后 POST /api/poll/vote 只做校验并把投票放入进程内有界队列，立即确认；
+后台任务每 N 毫秒或攒够 M 票时批量落库：
+先排除已在 poll_voters 登记的客户端（如其他 worker 已受理同一客户端的投票），
+再多行 INSERT IGNORE 登记投票人、多行 INSERT 写入 votes、一条按选项聚合后的票数增量 UPDATE
+（开启计数分片时为分片行累加写入），只有登记成功的投票才写入与计数
+落库失败时按指数退避重试，持续失败的批次拆分后隔离出无法写入的投票记为死信（见 write_retry）
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.services.bulk_votes import BulkVote, write_votes
+from app.services.client_keys import client_key
+from app.services.metrics import votes_committed
+from app.services.write_retry import RetryBackoff, record_dead_letters, write_isolating
+
+logger = logging.getLogger(__name__)
+
+# 写入模式：direct（逐票事务提交，默认）/ buffered（写缓冲批量落库）
+VOTE_INGEST_MODE = os.getenv("VOTE_INGEST_MODE", "direct")
+# 批量落库的时间间隔（毫秒）
+VOTE_BUFFER_FLUSH_MS = int(os.getenv("VOTE_BUFFER_FLUSH_MS", "100"))
+# 单批最大票数
+VOTE_BUFFER_BATCH_SIZE = int(os.getenv("VOTE_BUFFER_BATCH_SIZE", "500"))
+# 队列容量上限（背压）
+VOTE_BUFFER_MAX_SIZE = int(os.getenv("VOTE_BUFFER_MAX_SIZE", "10000"))
+# 队列已满时入队最长等待时间（毫秒），超时则拒绝请求
+VOTE_BUFFER_ENQUEUE_TIMEOUT_MS = int(os.getenv("VOTE_BUFFER_ENQUEUE_TIMEOUT_MS", "50"))
+
+
+class BufferFullError(Exception):
+    """写缓冲已满或正在关闭，无法受理新的投票"""
+
+
+@dataclass
+class PendingVote:
+    option_id: int
+    poll_id: int
+    client_id: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class BufferStats:
+    enqueued: int = 0
+    rejected: int = 0
+    flushed_batches: int = 0
+    flushed_votes: int = 0
+    failed_flushes: int = 0
+    duplicates: int = 0
+    dead_letters: int = 0
+    last_flush_size: int = 0
+    max_flush_size: int = 0
+    last_flush_lag_ms: float = 0.0
+    max_flush_lag_ms: float = 0.0
+    last_flush_duration_ms: float = 0.0
+
+
+class VoteBuffer:
+    """进程内投票写缓冲"""
+
+    def __init__(
+        self,
+        session_factory=None,
+        flush_interval_ms: int = VOTE_BUFFER_FLUSH_MS,
+        batch_size: int = VOTE_BUFFER_BATCH_SIZE,
+        max_size: int = VOTE_BUFFER_MAX_SIZE,
+        enqueue_timeout_ms: int = VOTE_BUFFER_ENQUEUE_TIMEOUT_MS,
+        enabled: bool = VOTE_INGEST_MODE == "buffered",
+    ):
+        # 全局实例的会话工厂由应用启动时绑定为该应用的数据库（app.main.lifespan）
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_size = max_size
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self.enabled = enabled
+        self.stats = BufferStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        # 已受理但尚未落库的投票：用于进程内防重复与回显未落库票数
+        self._pending_clients: Set[Tuple[int, str]] = set()
+        self._pending_counts: Counter = Counter()
+        # 落库失败的批次，退避后下一轮优先重试
+        self._retry: List[PendingVote] = []
+        self._backoff = RetryBackoff()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """在当前事件循环中启动后台落库任务"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 30.0):
+        """停止受理新投票，并把队列中剩余的投票全部落库后退出"""
+        if not self.running:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            lost = self._queue.qsize() + len(self._retry)
+            logger.error("投票写缓冲排空超时，%d 票未能落库", lost)
+            self._task.cancel()
+        self._task = None
+
+    def reserve(self, poll_id: int, client_id: str) -> bool:
+        """在进程内占位，防止同一客户端的并发请求重复受理；已占位时返回 False"""
+        key = (poll_id, client_id)
+        if key in self._pending_clients:
+            return False
+        self._pending_clients.add(key)
+        return True
+
+    @property
+    def pending_clients(self) -> Set[Tuple[int, str]]:
+        """已受理但尚未落库的 (问卷, client_id)"""
+        return self._pending_clients
+
+    def release(self, poll_id: int, client_id: str):
+        """撤销占位（校验未通过时调用）"""
+        self._pending_clients.discard((poll_id, client_id))
+
+    async def submit(self, option_id: int, poll_id: int, client_id: str):
+        """将已校验的投票放入队列；队列持续满载或正在关闭时抛出 BufferFullError"""
+        if self._closing or not self.running:
+            self.release(poll_id, client_id)
+            self.stats.rejected += 1
+            raise BufferFullError("投票写缓冲不可用")
+        vote = PendingVote(option_id=option_id, poll_id=poll_id, client_id=client_id)
+        try:
+            await asyncio.wait_for(self._queue.put(vote), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.release(poll_id, client_id)
+            self.stats.rejected += 1
+            raise BufferFullError("投票写缓冲已满")
+        self._pending_counts[option_id] += 1
+        self.stats.enqueued += 1
+
+    def pending_count(self, option_id: int) -> int:
+        """已受理但尚未落库的票数"""
+        return self._pending_counts.get(option_id, 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        """写缓冲运行指标：队列深度、批量大小、落库延迟等"""
+        data = dict(self.stats.__dict__)
+        data.update(
+            mode="buffered" if self.enabled else "direct",
+            running=self.running,
+            queued=self._queue.qsize() if self._queue else 0,
+            retrying=len(self._retry),
+            retry_delay_ms=round(self._backoff.delay() * 1000, 1),
+            avg_flush_size=(
+                round(self.stats.flushed_votes / self.stats.flushed_batches, 2)
+                if self.stats.flushed_batches else 0.0
+            ),
+        )
+        return data
+
+    async def _run(self):
+        """后台循环：按时间间隔或批量大小触发落库，关闭时排空队列"""
+        while True:
+            batch = await self._collect()
+            if batch:
+                await self._flush(batch)
+            if self._closing and self._queue.empty() and not self._retry:
+                break
+            if self._retry:
+                await asyncio.sleep(self._backoff.delay())
+
+    async def _collect(self) -> List[PendingVote]:
+        """从队列中收集一批投票：攒满 batch_size 或等待超过 flush_interval 即返回"""
+        batch, self._retry = self._retry, []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        # 队列中已就绪的投票直接并入本批，不再等待
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush(self, batch: List[PendingVote]):
+        """写入一批投票；连续失败达到上限后拆分批次，隔离出无法写入的投票"""
+        started = time.monotonic()
+        try:
+            if self._backoff.exhausted:
+                await write_isolating(batch, self._write, self._dead_letter)
+            else:
+                await self._write(batch)
+        except Exception as e:
+            self.stats.failed_flushes += 1
+            self._backoff.failed(e)
+            # 拆分写入时已写入的投票不再重试
+            self._retry = [vote for vote in batch if (vote.poll_id, vote.client_id) in self._pending_clients]
+            logger.warning("投票批量落库失败，%.1f 秒后重试 %d 票: %s", self._backoff.delay(), len(self._retry), e)
+            return
+        self._backoff.succeeded()
+
+        finished = time.monotonic()
+        lag_ms = (finished - min(vote.enqueued_at for vote in batch)) * 1000
+        self.stats.flushed_batches += 1
+        self.stats.last_flush_size = len(batch)
+        self.stats.max_flush_size = max(self.stats.max_flush_size, len(batch))
+        self.stats.last_flush_lag_ms = round(lag_ms, 2)
+        self.stats.max_flush_lag_ms = max(self.stats.max_flush_lag_ms, round(lag_ms, 2))
+        self.stats.last_flush_duration_ms = round((finished - started) * 1000, 2)
+
+    async def _write(self, batch: List[PendingVote]):
+        """一次事务写入投票，只写入成功登记投票人的投票"""
+        votes = [
+            BulkVote(index, vote.option_id, vote.client_id, None, vote.poll_id, client_key(vote.client_id))
+            for index, vote in enumerate(batch)
+        ]
+        async with self.session_factory() as db:
+            try:
+                written = await write_votes(db, votes)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        votes_committed.inc(len(written), labels=("buffered",))
+        self.stats.flushed_votes += len(written)
+        self.stats.duplicates += len(batch) - len(written)
+        self._done(batch)
+
+    async def _dead_letter(self, vote: PendingVote, error: Exception):
+        await asyncio.to_thread(record_dead_letters, "buffer", [{
+            "optionId": vote.option_id, "pollId": vote.poll_id, "userToken": vote.client_id,
+        }], error)
+        self.stats.dead_letters += 1
+        self._done([vote])
+
+    def _done(self, batch: List[PendingVote]):
+        """已写入（或重复、死信）的投票不再计入未落库票数"""
+        for vote in batch:
+            self._pending_clients.discard((vote.poll_id, vote.client_id))
+        self._pending_counts.subtract(Counter(vote.option_id for vote in batch))
+        self._pending_counts += Counter()  # 清理计数为 0 的项
+
+
+# 全局写缓冲实例（VOTE_INGEST_MODE=buffered 时由应用启动）
+vote_buffer = VoteBuffer()
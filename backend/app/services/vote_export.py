@@ -0,0 +1,91 @@
+"""
+投票记录导出
+- 分页：按 vote_id 键集分页（cursor 为上一页最后一条的 vote_id），每页一次索引范围扫描
+- 流式导出：服务端游标 + yield_per 分批读取，逐批编码为 NDJSON / CSV 输出，内存占用与问卷规模无关
+"""
+import csv
+import io
+import json
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+votes_table = models.Vote.__table__
+options_table = models.Option.__table__
+
+# 分页默认与最大条数
+VOTES_PAGE_DEFAULT_LIMIT = 1000
+VOTES_PAGE_MAX_LIMIT = 10000
+# 流式导出时每批从数据库读取的行数
+VOTES_EXPORT_BATCH = 5000
+
+EXPORT_COLUMNS = ("vote_id", "option_id", "voted_at", "client_id")
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def poll_votes_query(poll_id: int, after: Optional[int] = None, limit: Optional[int] = None):
+    """问卷投票记录查询（按 vote_id 升序，从 after 之后开始）"""
+    option_ids = select(options_table.c.option_id).where(options_table.c.poll_id == poll_id)
+    query = (
+        select(*(votes_table.c[name] for name in EXPORT_COLUMNS))
+        .where(votes_table.c.option_id.in_(option_ids))
+        .order_by(votes_table.c.vote_id)
+    )
+    if after is not None:
+        query = query.where(votes_table.c.vote_id > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def read_votes_page(db: AsyncSession, poll_id: int, after: Optional[int], limit: int) -> List[dict]:
+    """读取一页投票记录"""
+    result = await db.execute(poll_votes_query(poll_id, after, limit))
+    return [dict(row) for row in result.mappings()]
+
+
+def _ndjson_lines(rows) -> str:
+    return "".join(
+        json.dumps(
+            {**row, "voted_at": row["voted_at"].isoformat()},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ) + "\n"
+        for row in rows
+    )
+
+
+def csv_lines(rows, header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(
+        (row["vote_id"], row["option_id"], row["voted_at"].isoformat(), row["client_id"] or "")
+        for row in rows
+    )
+    return buffer.getvalue()
+
+
+async def stream_votes(
+    db: AsyncSession,
+    poll_id: int,
+    fmt: str,
+    after: Optional[int] = None,
+    batch_size: int = VOTES_EXPORT_BATCH,
+) -> AsyncIterator[bytes]:
+    """流式导出问卷投票记录，每批编码为一个输出块；调用方负责会话的生命周期"""
+    if fmt == "csv":
+        yield csv_lines((), header=True).encode("utf-8")
+    result = await db.stream(
+        poll_votes_query(poll_id, after).execution_options(yield_per=batch_size)
+    )
+    async for partition in result.mappings().partitions():
+        text = csv_lines(partition) if fmt == "csv" else _ndjson_lines(partition)
+        yield text.encode("utf-8")
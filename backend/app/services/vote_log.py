@@ -0,0 +1,538 @@
+"""
+投票日志存储（单机活动部署）
+VOTE_INGEST_MODE=log 时投票路径不访问数据库：
+- 权威票数与已投票客户端保存在进程内存中（问卷首次投票时从数据库载入一次）
+- 每票追加写入本地内存映射（mmap）的只追加日志文件，组提交：VOTE_LOG_FSYNC_MS 窗口内的投票合并为一次 msync，
+  落盘后才确认请求
+- 后台每 VOTE_LOG_CHECKPOINT_MS 将已落盘的投票批量写入 votes / poll_voters / 选项票数，
+  并在同一事务内推进 vote_log 水位线（日志序号），其余模块照常读取这些表；
+  已在 poll_voters 登记的客户端（如载入问卷后批量投票写入）不重复写入与计数
+- 写入失败时按指数退避重试，持续失败的批次拆分后隔离出无法写入的投票记为死信并越过（见 write_retry）；
+  未写入数据库的投票超过 VOTE_LOG_MAX_PENDING 时拒绝新的投票，内存与日志文件不会无限增长
+- 启动时从水位线之后重放日志恢复未写入数据库的投票；已全部写入数据库的日志段文件自动删除
+日志段格式：段文件预分配 VOTE_LOG_SEGMENT_BYTES 字节，记录依次排列，
+每条记录为 16 字节头（负载长度、CRC32、序号）+ 负载（选项ID、问卷ID、投票时间、client_id），长度为 0 表示段结束；
+CRC 不符的记录视为崩溃时写了一半的尾部，恢复时丢弃（该票未被确认）
+仅适用于单进程部署：多个 worker 各自维护内存票数与防重复状态，互相不可见
+"""
+import asyncio
+import glob
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.services.bulk_votes import BulkVote, write_votes
+from app.services.client_keys import client_key
+from app.services.metrics import votes_committed
+from app.services.vote_buffer import VOTE_INGEST_MODE
+from app.services.voting import read_poll_counts
+from app.services.watermarks import advance_watermark, read_watermark
+from app.services.write_retry import RetryBackoff, record_dead_letters, write_isolating
+
+logger = logging.getLogger(__name__)
+
+voters_table = models.PollVoter.__table__
+
+# 日志段文件目录
+VOTE_LOG_DIR = os.getenv("VOTE_LOG_DIR", "data/vote_log")
+# 每个日志段文件的大小（字节）
+VOTE_LOG_SEGMENT_BYTES = int(os.getenv("VOTE_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+# 组提交窗口（毫秒）：窗口内的投票合并为一次 msync，0 表示每次落盘只等待已到达的投票
+VOTE_LOG_FSYNC_MS = float(os.getenv("VOTE_LOG_FSYNC_MS", "2"))
+# 写入数据库的检查点间隔（毫秒）
+VOTE_LOG_CHECKPOINT_MS = int(os.getenv("VOTE_LOG_CHECKPOINT_MS", "1000"))
+# 每个检查点事务最多写入的票数
+VOTE_LOG_CHECKPOINT_BATCH = int(os.getenv("VOTE_LOG_CHECKPOINT_BATCH", "5000"))
+# 未写入数据库的投票上限，超出时拒绝新的投票（数据库持续不可用时保护内存与磁盘）
+VOTE_LOG_MAX_PENDING = int(os.getenv("VOTE_LOG_MAX_PENDING", "500000"))
+
+# 已写入数据库的日志序号
+WATERMARK_NAME = "vote_log"
+
+HEADER = struct.Struct("<IIQ")
+PAYLOAD = struct.Struct("<QQd")
+SEGMENT_PATTERN = "segment_*.log"
+
+
+class VoteLogUnavailableError(Exception):
+    """投票日志未启动或正在关闭，无法受理新的投票"""
+
+
+@dataclass
+class LoggedVote:
+    seq: int
+    option_id: int
+    poll_id: int
+    client_id: str
+    voted_at: float = field(default_factory=time.time)
+
+    @property
+    def size(self) -> int:
+        return HEADER.size + PAYLOAD.size + len(self.client_id.encode("utf-8"))
+
+    def encode(self) -> bytes:
+        payload = PAYLOAD.pack(self.option_id, self.poll_id, self.voted_at) + self.client_id.encode("utf-8")
+        return HEADER.pack(len(payload), zlib.crc32(payload), self.seq) + payload
+
+    @property
+    def voted_at_utc(self) -> datetime:
+        return datetime.fromtimestamp(self.voted_at, timezone.utc).replace(tzinfo=None)
+
+
+def segment_path(directory: str, first_seq: int) -> str:
+    return os.path.join(directory, f"segment_{first_seq:020d}.log")
+
+
+def segment_first_seq(path: str) -> int:
+    return int(os.path.basename(path)[len("segment_"):-len(".log")])
+
+
+def read_segment(path: str) -> Tuple[List[LoggedVote], bool]:
+    """读取段文件中的全部完整记录，返回 (记录, 是否遇到损坏的尾部)"""
+    with open(path, "rb") as f:
+        data = f.read()
+    votes, offset = [], 0
+    while offset + HEADER.size <= len(data):
+        length, crc, seq = HEADER.unpack_from(data, offset)
+        if length == 0:
+            return votes, False
+        payload = data[offset + HEADER.size:offset + HEADER.size + length]
+        if length < PAYLOAD.size or len(payload) < length or zlib.crc32(payload) != crc:
+            return votes, True
+        option_id, poll_id, voted_at = PAYLOAD.unpack_from(payload)
+        votes.append(LoggedVote(seq, option_id, poll_id, payload[PAYLOAD.size:].decode("utf-8"), voted_at))
+        offset += HEADER.size + length
+    return votes, False
+
+
+class LogSegment:
+    """预分配并内存映射的日志段文件"""
+
+    def __init__(self, path: str, first_seq: int, size: int):
+        self.path = path
+        self.first_seq = first_seq
+        self.size = size
+        self.offset = 0
+        self.synced = 0
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+
+    def fits(self, length: int) -> bool:
+        # 段尾至少保留一个全零的记录头作为结束标记
+        return self.offset + length + HEADER.size <= self.size
+
+    def write(self, data: bytes):
+        self._mm[self.offset:self.offset + len(data)] = data
+        self.offset += len(data)
+
+    def sync(self, end: int):
+        """将 [synced, end) 区间刷到磁盘（msync，起点按页对齐）"""
+        if end <= self.synced:
+            return
+        start = self.synced - self.synced % mmap.PAGESIZE
+        self._mm.flush(start, end - start)
+        self.synced = end
+
+    def close(self):
+        self.sync(self.offset)
+        self._mm.close()
+        os.close(self._fd)
+
+
+@dataclass
+class VoteLogStats:
+    appended: int = 0
+    duplicates: int = 0
+    syncs: int = 0
+    last_sync_size: int = 0
+    max_sync_size: int = 0
+    last_sync_ms: float = 0.0
+    checkpoints: int = 0
+    checkpointed_votes: int = 0
+    failed_checkpoints: int = 0
+    rejected: int = 0
+    dead_letters: int = 0
+    last_checkpoint_ms: float = 0.0
+    replayed: int = 0
+    torn_records: int = 0
+    segments_removed: int = 0
+
+
+class VoteLog:
+    """内存票数 + 只追加日志 + 定期检查点"""
+
+    def __init__(
+        self,
+        session_factory=None,
+        directory: str = VOTE_LOG_DIR,
+        segment_bytes: int = VOTE_LOG_SEGMENT_BYTES,
+        fsync_ms: float = VOTE_LOG_FSYNC_MS,
+        checkpoint_ms: int = VOTE_LOG_CHECKPOINT_MS,
+        checkpoint_batch: int = VOTE_LOG_CHECKPOINT_BATCH,
+        max_pending: int = VOTE_LOG_MAX_PENDING,
+        enabled: bool = VOTE_INGEST_MODE == "log",
+    ):
+        # 全局实例的会话工厂由应用启动时绑定为该应用的数据库（app.main.lifespan）
+        self.session_factory = session_factory
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_window = fsync_ms / 1000
+        self.checkpoint_interval = checkpoint_ms / 1000
+        self.checkpoint_batch = checkpoint_batch
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self.stats = VoteLogStats()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._segment: Optional[LogSegment] = None
+        # 较早的段文件（首个序号），其中的投票全部写入数据库后删除
+        self._sealed: List[int] = []
+        self._next_seq = 1
+        self._synced_seq = 0
+        self._checkpoint_seq = 0
+        # 已追加但尚未写入数据库的投票（按序号）
+        self._pending: Deque[LoggedVote] = deque()
+        self._pending_counts: Counter = Counter()
+        self._backoff = RetryBackoff()
+        # 等待落盘的请求：(序号, future)
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        # 已载入的问卷：数据库中（已检查点）的各选项票数与已投票客户端（含未写入数据库的）
+        self._base_counts: Dict[int, Dict[int, int]] = {}
+        self._voters: Dict[int, Set[bytes]] = {}
+        self._load_locks: Dict[int, asyncio.Lock] = {}
+        self._io_lock: Optional[asyncio.Lock] = None
+        # 检查点与问卷载入互斥，载入时看到的数据库状态与未写入数据库的投票不重不漏
+        self._checkpoint_lock: Optional[asyncio.Lock] = None
+        self._dirty: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+
+    @property
+    def running(self) -> bool:
+        return self._segment is not None and not self._closing
+
+    # ---- 启动与恢复 ----
+
+    async def start(self):
+        """重放水位线之后的日志，打开新的日志段并启动组提交与检查点任务"""
+        if self._segment is not None:
+            return
+        self._reset_state()
+        os.makedirs(self.directory, exist_ok=True)
+        async with self.session_factory() as db:
+            self._checkpoint_seq = await read_watermark(db, WATERMARK_NAME)
+        last_seq = self._checkpoint_seq
+        paths = sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)))
+        for path in paths:
+            votes, torn = read_segment(path)
+            if torn:
+                self.stats.torn_records += 1
+                logger.warning("日志段尾部存在不完整的记录，已丢弃", extra={"path": path})
+            for vote in votes:
+                if vote.seq > self._checkpoint_seq:
+                    self._pending.append(vote)
+                    self._pending_counts[vote.option_id] += 1
+                last_seq = max(last_seq, vote.seq)
+        for path in paths:
+            if segment_first_seq(path) > last_seq:
+                # 没有任何记录的段（启动后未受理投票即退出），由新段取代
+                os.remove(path)
+            else:
+                self._sealed.append(segment_first_seq(path))
+        self.stats.replayed = len(self._pending)
+        self._synced_seq = last_seq
+        self._next_seq = last_seq + 1
+        self._segment = LogSegment(segment_path(self.directory, self._next_seq), self._next_seq, self.segment_bytes)
+        self._io_lock = asyncio.Lock()
+        self._checkpoint_lock = asyncio.Lock()
+        self._dirty = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._sync_loop()), asyncio.create_task(self._checkpoint_loop())]
+        logger.info("投票日志已启动", extra={
+            "checkpoint_seq": self._checkpoint_seq, "replayed": self.stats.replayed, "next_seq": self._next_seq,
+        })
+
+    async def stop(self):
+        """停止受理新投票，落盘并把剩余投票全部写入数据库后关闭日志段"""
+        if self._segment is None:
+            return
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self._sync()
+        while self._pending:
+            if not await self.checkpoint():
+                logger.error("关闭时未能写入数据库，%d 票保留在日志中，下次启动时重放", len(self._pending))
+                break
+        self._segment.close()
+        self._segment = None
+
+    # ---- 投票路径 ----
+
+    async def load_poll(self, db: AsyncSession, poll_id: int):
+        """问卷首次投票时从数据库载入票数与已投票客户端（之后不再访问数据库）"""
+        if poll_id in self._base_counts:
+            return
+        lock = self._load_locks.setdefault(poll_id, asyncio.Lock())
+        async with lock, self._checkpoint_lock:
+            if poll_id in self._base_counts:
+                return
+            voters = set((await db.execute(
+                select(voters_table.c.client_key).where(voters_table.c.poll_id == poll_id)
+            )).scalars())
+            counts = await read_poll_counts(db, poll_id)
+            await db.commit()
+            voters.update(client_key(vote.client_id) for vote in self._pending if vote.poll_id == poll_id)
+            self._voters[poll_id] = voters
+            self._base_counts[poll_id] = counts
+
+    def forget_poll(self, poll_id: int):
+        """数据库被其他路径写入（如批量投票）后，下次投票时重新载入该问卷"""
+        self._base_counts.pop(poll_id, None)
+        self._voters.pop(poll_id, None)
+
+    def counts(self, poll_id: int) -> Optional[Dict[int, int]]:
+        """已载入问卷的权威票数（数据库中的票数 + 未写入数据库的票数），未载入时返回 None"""
+        base = self._base_counts.get(poll_id)
+        if base is None:
+            return None
+        return {option_id: count + self._pending_counts.get(option_id, 0) for option_id, count in base.items()}
+
+    def pending_count(self, option_id: int) -> int:
+        """已落盘但尚未写入数据库的票数"""
+        return self._pending_counts.get(option_id, 0)
+
+    @property
+    def pending_clients(self) -> Set[Tuple[int, str]]:
+        """尚未写入数据库的 (问卷, client_id)"""
+        return {(vote.poll_id, vote.client_id) for vote in self._pending}
+
+    async def record(self, poll_id: int, option_id: int, client_id: str) -> bool:
+        """
+        记录一票：内存防重复后追加到日志，落盘后返回 True；该客户端已在此问卷投过票时返回 False
+        调用前须已 load_poll
+        """
+        if not self.running:
+            raise VoteLogUnavailableError("投票日志不可用")
+        if len(self._pending) >= self.max_pending:
+            self.stats.rejected += 1
+            raise VoteLogUnavailableError("未写入数据库的投票过多")
+        voters = self._voters[poll_id]
+        key = client_key(client_id)
+        if key in voters:
+            self.stats.duplicates += 1
+            return False
+        voters.add(key)
+        vote = LoggedVote(0, option_id, poll_id, client_id)
+        try:
+            future = await self._append(vote)
+        except Exception:
+            voters.discard(key)
+            raise
+        # 已写入日志的投票即使等待落盘时请求被取消、或刷盘出错，也会照常写入数据库
+        await future
+        return True
+
+    async def _append(self, vote: LoggedVote) -> asyncio.Future:
+        """写入当前段并登记为未写入数据库的投票，返回落盘后完成的 future"""
+        while not self._segment.fits(vote.size):
+            await self._rotate(vote.size)
+        # 序号在写入时分配，保证日志中的序号与写入顺序一致
+        vote.seq = self._next_seq
+        self._next_seq += 1
+        self._segment.write(vote.encode())
+        self._pending.append(vote)
+        self._pending_counts[vote.option_id] += 1
+        self.stats.appended += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((vote.seq, future))
+        self._dirty.set()
+        return future
+
+    async def _rotate(self, length: int):
+        """当前段写满时切换到新段，旧段刷盘后关闭"""
+        async with self._io_lock:
+            if self._segment.fits(length):
+                return
+            old = self._segment
+            self._segment = LogSegment(segment_path(self.directory, self._next_seq), self._next_seq, self.segment_bytes)
+            await asyncio.to_thread(old.close)
+            self._sealed.append(old.first_seq)
+
+    # ---- 组提交 ----
+
+    async def _sync_loop(self):
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            if self.fsync_window > 0:
+                await asyncio.sleep(self.fsync_window)
+            await self._sync()
+
+    async def _sync(self):
+        """一次 msync 覆盖已写入的全部记录，唤醒对应的等待者"""
+        async with self._io_lock:
+            segment, end, seq = self._segment, self._segment.offset, self._next_seq - 1
+            started = time.monotonic()
+            try:
+                await asyncio.to_thread(segment.sync, end)
+            except Exception as e:
+                logger.exception("投票日志刷盘失败")
+                self._fail_waiters(e)
+                return
+            size = 0
+            while self._waiters and self._waiters[0][0] <= seq:
+                _, future = self._waiters.popleft()
+                if not future.done():
+                    future.set_result(None)
+                size += 1
+            self._synced_seq = seq
+            if size:
+                self.stats.syncs += 1
+                self.stats.last_sync_size = size
+                self.stats.max_sync_size = max(self.stats.max_sync_size, size)
+                self.stats.last_sync_ms = round((time.monotonic() - started) * 1000, 2)
+
+    def _fail_waiters(self, error: Exception):
+        while self._waiters:
+            _, future = self._waiters.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    # ---- 检查点 ----
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(max(self.checkpoint_interval, self._backoff.delay()))
+            # 积压较多时连续写入多批
+            while await self.checkpoint() == self.checkpoint_batch:
+                pass
+
+    async def checkpoint(self) -> int:
+        """将一批已落盘的投票写入数据库并推进水位线，返回处理的票数（失败时为 0）"""
+        async with self._checkpoint_lock:
+            return await self._checkpoint()
+
+    async def _checkpoint(self) -> int:
+        batch = []
+        for vote in self._pending:
+            if len(batch) >= self.checkpoint_batch or vote.seq > self._synced_seq:
+                break
+            batch.append(vote)
+        if not batch:
+            return 0
+        started = time.monotonic()
+        checkpoint_seq = self._checkpoint_seq
+        try:
+            if self._backoff.exhausted:
+                await write_isolating(batch, self._write, self._dead_letter)
+            else:
+                await self._write(batch)
+        except Exception as e:
+            self.stats.failed_checkpoints += 1
+            self._backoff.failed(e)
+            logger.warning("投票日志写入数据库失败，%.1f 秒后重试: %s", self._backoff.delay(), e)
+            # 拆分写入时已写入的部分照常计入
+            return len([vote for vote in batch if vote.seq <= self._checkpoint_seq and vote.seq > checkpoint_seq])
+        self._backoff.succeeded()
+        self.stats.checkpoints += 1
+        self.stats.last_checkpoint_ms = round((time.monotonic() - started) * 1000, 2)
+        return len(batch)
+
+    async def _write(self, batch: List[LoggedVote]):
+        """一个事务内写入投票（只写入成功登记投票人的投票）并推进水位线"""
+        votes = [
+            BulkVote(index, vote.option_id, vote.client_id, vote.voted_at_utc, vote.poll_id, client_key(vote.client_id))
+            for index, vote in enumerate(batch)
+        ]
+        async with self.session_factory() as db:
+            try:
+                written = await write_votes(db, votes)
+                await self._advance(db, batch[-1].seq)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        for vote in written:
+            base = self._base_counts.get(vote.poll_id)
+            if base is not None:
+                base[vote.option_id] = base.get(vote.option_id, 0) + 1
+        votes_committed.inc(len(written), labels=("log",))
+        self.stats.checkpointed_votes += len(written)
+        self._checkpointed(batch)
+
+    async def _dead_letter(self, vote: LoggedVote, error: Exception):
+        """无法写入的投票记为死信后越过（推进水位线），日志段得以删除"""
+        async with self.session_factory() as db:
+            await self._advance(db, vote.seq)
+            await db.commit()
+        await asyncio.to_thread(record_dead_letters, "vote_log", [{
+            "seq": vote.seq, "optionId": vote.option_id, "pollId": vote.poll_id,
+            "userToken": vote.client_id, "votedAt": vote.voted_at_utc.isoformat(),
+        }], error)
+        self.stats.dead_letters += 1
+        self._checkpointed([vote])
+
+    async def _advance(self, db: AsyncSession, seq: int):
+        if not await advance_watermark(db, WATERMARK_NAME, self._checkpoint_seq, seq):
+            # 仅单进程部署：水位线被其他进程改动说明有多个实例共用同一数据库
+            raise RuntimeError("vote_log 水位线已被其他进程修改")
+
+    def _checkpointed(self, batch: List[LoggedVote]):
+        """批次（位于未写入队列的头部）已写入数据库或已越过"""
+        for _ in batch:
+            self._pending.popleft()
+        self._checkpoint_seq = batch[-1].seq
+        self._pending_counts.subtract(Counter(vote.option_id for vote in batch))
+        self._pending_counts += Counter()  # 清理计数为 0 的项
+        self._remove_checkpointed_segments()
+
+    def _remove_checkpointed_segments(self):
+        """删除全部投票都已写入数据库的旧段文件（下一段的首个序号不超过水位线 + 1）"""
+        current = self._segment.first_seq if self._segment is not None else self._next_seq
+        while self._sealed:
+            following = self._sealed[1] if len(self._sealed) > 1 else current
+            if following - 1 > self._checkpoint_seq:
+                break
+            first_seq = self._sealed.pop(0)
+            try:
+                os.remove(segment_path(self.directory, first_seq))
+            except FileNotFoundError:
+                pass
+            self.stats.segments_removed += 1
+
+    def snapshot(self) -> dict:
+        data = dict(self.stats.__dict__)
+        data.update(
+            enabled=self.enabled,
+            running=self.running,
+            next_seq=self._next_seq,
+            synced_seq=self._synced_seq,
+            checkpoint_seq=self._checkpoint_seq,
+            pending=len(self._pending),
+            waiting=len(self._waiters),
+            segments=len(self._sealed) + (1 if self._segment is not None else 0),
+            loaded_polls=len(self._base_counts),
+        )
+        return data
+
+
+# 全局投票日志（VOTE_INGEST_MODE=log 时由应用启动）
+vote_log = VoteLog()
@@ -0,0 +1,165 @@
+"""
+投票写入服务
+在一个短事务内完成：登记投票人防重复、写入投票记录、服务端原子累加票数、读取最新票数
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from sqlalchemy import select, insert, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.services.client_keys import client_key
+from app.services.counters import option_total, vote_counters
+
+if TYPE_CHECKING:
+    from app.services.poll_registry import PollMeta
+
+votes_table = models.Vote.__table__
+options_table = models.Option.__table__
+polls_table = models.Poll.__table__
+voters_table = models.PollVoter.__table__
+
+
+class OptionNotFoundError(Exception):
+    """投票选项不存在"""
+
+
+@dataclass
+class OptionTally:
+    option_id: int
+    label: str
+    vote_count: int
+
+
+@dataclass
+class PollTally:
+    """事务内读取到的问卷票数快照"""
+    poll_id: int
+    title: str
+    created_at: datetime
+    options: List[OptionTally] = field(default_factory=list)
+    is_active: bool = True
+
+    @property
+    def total_votes(self) -> int:
+        return sum(option.vote_count for option in self.options)
+
+
+@dataclass
+class VoteResult:
+    created: bool  # False 表示该客户端已在此问卷投过票
+    tally: PollTally
+    vote_id: Optional[int] = None
+
+
+def insert_ignore(table):
+    """INSERT IGNORE：主键冲突时跳过该行（MySQL / SQLite）"""
+    return insert(table).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+
+
+def _claim_voter(option_id: int, key: bytes):
+    """
+    INSERT IGNORE ... SELECT：按选项所属问卷登记投票人
+    选项存在性检查与防重复（poll_voters 主键唯一约束）合并进同一条语句，
+    影响行数为 0 表示选项不存在或该客户端已在此问卷投过票
+    """
+    source = select(options_table.c.poll_id, literal(key)).where(
+        options_table.c.option_id == option_id
+    )
+    return insert_ignore(voters_table).from_select(["poll_id", "client_key"], source)
+
+
+def _tally_query(poll_id_clause):
+    """读取问卷及其全部选项的当前票数（单次查询）"""
+    return (
+        select(
+            polls_table.c.poll_id,
+            polls_table.c.title,
+            polls_table.c.created_at,
+            options_table.c.option_id,
+            options_table.c.label,
+            option_total().label("vote_count"),
+        )
+        .outerjoin(options_table, options_table.c.poll_id == polls_table.c.poll_id)
+        .where(polls_table.c.poll_id == poll_id_clause)
+        .order_by(options_table.c.option_id)
+    )
+
+
+def _rows_to_tally(rows) -> Optional[PollTally]:
+    if not rows:
+        return None
+    first = rows[0]
+    return PollTally(
+        poll_id=first.poll_id,
+        title=first.title,
+        created_at=first.created_at,
+        options=[
+            OptionTally(row.option_id, row.label, row.vote_count)
+            for row in rows if row.option_id is not None
+        ],
+    )
+
+
+async def read_tally(db: AsyncSession, option_id: int) -> Optional[PollTally]:
+    """按选项ID读取其所属问卷的票数，选项不存在时返回 None"""
+    poll_of_option = (
+        select(options_table.c.poll_id)
+        .where(options_table.c.option_id == option_id)
+        .scalar_subquery()
+    )
+    return _rows_to_tally((await db.execute(_tally_query(poll_of_option))).all())
+
+
+async def read_poll_counts(db: AsyncSession, poll_id: int) -> Dict[int, int]:
+    """按问卷ID读取各选项票数（标题与选项文本由问卷注册表提供）"""
+    rows = await db.execute(
+        select(options_table.c.option_id, option_total()).where(options_table.c.poll_id == poll_id)
+    )
+    return {option_id: vote_count for option_id, vote_count in rows}
+
+
+async def has_voted(db: AsyncSession, poll_id: int, client_id: str) -> bool:
+    """检查客户端是否已在该问卷投过票（poll_voters 主键点查）"""
+    existing = await db.scalar(
+        select(voters_table.c.poll_id).where(
+            voters_table.c.poll_id == poll_id,
+            voters_table.c.client_key == client_key(client_id),
+        )
+    )
+    return existing is not None
+
+
+async def record_vote(
+    db: AsyncSession, option_id: int, client_id: str, poll: Optional["PollMeta"] = None
+) -> VoteResult:
+    """
+    原子化提交一票
+    1. INSERT IGNORE 登记投票人（防重复由 poll_voters 主键保证，并发下同样可靠）
+    2. 写入投票记录，服务端累加计数 vote_count + 1 或分片行 + 1（并发下不丢失增量）
+    3. 在同一事务内读取最新票数后提交（传入问卷元数据时只读取票数）
+    """
+    vote_id = None
+    try:
+        claimed = await db.execute(_claim_voter(option_id, client_key(client_id)))
+        created = claimed.rowcount == 1
+        if created:
+            inserted = await db.execute(
+                insert(votes_table).values(option_id=option_id, client_id=client_id)
+            )
+            vote_id = inserted.inserted_primary_key[0]
+            await vote_counters.add(db, {option_id: 1})
+        if poll is not None:
+            tally = poll.tally(await read_poll_counts(db, poll.poll_id))
+        else:
+            tally = await read_tally(db, option_id)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    if tally is None:
+        raise OptionNotFoundError(option_id)
+    return VoteResult(created=created, tally=tally, vote_id=vote_id)
@@ -0,0 +1,32 @@
+"""
+后台增量任务水位线
+各任务按 vote_id 增量处理投票记录，已处理到的位置保存在 watermarks 表中；
+推进水位线使用比较并交换，多个 worker 同时处理同一区间时只有一个能提交
+"""
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.services.voting import insert_ignore
+
+watermarks_table = models.Watermark.__table__
+
+
+async def read_watermark(db: AsyncSession, name: str) -> int:
+    """读取水位线，不存在时初始化为 0"""
+    value = await db.scalar(select(watermarks_table.c.vote_id).where(watermarks_table.c.name == name))
+    if value is None:
+        await db.execute(insert_ignore(watermarks_table).values(name=name, vote_id=0))
+        await db.commit()
+        value = await db.scalar(select(watermarks_table.c.vote_id).where(watermarks_table.c.name == name))
+    return value
+
+
+async def advance_watermark(db: AsyncSession, name: str, expected: int, value: int) -> bool:
+    """水位线仍为 expected 时更新为 value（不提交事务），返回是否成功"""
+    result = await db.execute(
+        update(watermarks_table)
+        .where(watermarks_table.c.name == name, watermarks_table.c.vote_id == expected)
+        .values(vote_id=value)
+    )
+    return result.rowcount == 1
@@ -0,0 +1,111 @@
+"""
+后台批量写入投票的失败处理（写缓冲落库、投票日志检查点共用）
+- 失败后按指数退避重试：间隔从 VOTE_WRITE_RETRY_BASE_MS 起每次翻倍，最长 VOTE_WRITE_RETRY_MAX_MS
+- 连接中断、锁等待超时、与并发投票冲突等暂时性错误只退避不计次，数据库恢复后整批写入
+- 其他错误（如选项已删除导致外键失败）连续 VOTE_WRITE_MAX_ATTEMPTS 次后逐半拆分批次分别写入，
+  单票仍然失败时记为死信：追加到 VOTE_DEAD_LETTER_FILE（每行一个 JSON）并记录 ERROR 日志，其余投票照常写入
+"""
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional, Sequence, TypeVar
+
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from app.services.bulk_votes import BulkVoteConflict
+
+logger = logging.getLogger(__name__)
+
+# 首次重试间隔（毫秒），之后每次翻倍
+VOTE_WRITE_RETRY_BASE_MS = int(os.getenv("VOTE_WRITE_RETRY_BASE_MS", "100"))
+# 最长重试间隔（毫秒）
+VOTE_WRITE_RETRY_MAX_MS = int(os.getenv("VOTE_WRITE_RETRY_MAX_MS", "5000"))
+# 非暂时性错误连续失败多少次后拆分批次、隔离无法写入的投票
+VOTE_WRITE_MAX_ATTEMPTS = int(os.getenv("VOTE_WRITE_MAX_ATTEMPTS", "5"))
+# 死信文件
+VOTE_DEAD_LETTER_FILE = os.getenv("VOTE_DEAD_LETTER_FILE", "data/vote_dead_letters.jsonl")
+
+T = TypeVar("T")
+
+
+def is_transient(error: BaseException) -> bool:
+    """数据库不可用或并发冲突等重试即可恢复的错误"""
+    if isinstance(error, (OperationalError, BulkVoteConflict)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class RetryBackoff:
+    """连续失败的计数与退避间隔"""
+
+    def __init__(
+        self,
+        base_ms: int = VOTE_WRITE_RETRY_BASE_MS,
+        max_ms: int = VOTE_WRITE_RETRY_MAX_MS,
+        max_attempts: int = VOTE_WRITE_MAX_ATTEMPTS,
+    ):
+        self.base = base_ms / 1000
+        self.max = max_ms / 1000
+        self.max_attempts = max_attempts
+        self.failures = 0
+        self.attempts = 0
+
+    @property
+    def exhausted(self) -> bool:
+        """非暂时性错误的失败次数已达上限，下一次写入应拆分批次"""
+        return self.attempts >= self.max_attempts
+
+    def failed(self, error: BaseException):
+        self.failures += 1
+        if not is_transient(error):
+            self.attempts += 1
+
+    def succeeded(self):
+        self.failures = 0
+        self.attempts = 0
+
+    def delay(self) -> float:
+        """下一次重试前的等待时间（秒），未失败时为 0"""
+        if not self.failures:
+            return 0.0
+        return min(self.base * 2 ** (self.failures - 1), self.max)
+
+
+async def write_isolating(
+    batch: Sequence[T],
+    write: Callable[[Sequence[T]], Awaitable[object]],
+    dead_letter: Callable[[T, Exception], Awaitable[object]],
+):
+    """
+    逐半拆分写入批次：write 失败时拆成两半分别重试，单票仍然失败时交给 dead_letter
+    按原顺序处理；遇到暂时性错误直接抛出，已写入的部分由 write 自行登记
+    """
+    try:
+        await write(batch)
+        return
+    except Exception as e:
+        if is_transient(e):
+            raise
+        if len(batch) == 1:
+            await dead_letter(batch[0], e)
+            return
+    middle = len(batch) // 2
+    await write_isolating(batch[:middle], write, dead_letter)
+    await write_isolating(batch[middle:], write, dead_letter)
+
+
+def record_dead_letters(source: str, votes: List[dict], error: Exception, path: Optional[str] = None):
+    """将无法写入数据库的投票追加到死信文件（同步写文件，协程中经 asyncio.to_thread 调用）"""
+    path = path or VOTE_DEAD_LETTER_FILE
+    now = datetime.now(timezone.utc).isoformat()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for vote in votes:
+            f.write(json.dumps({"source": source, "failedAt": now, "error": str(error), **vote}, ensure_ascii=False))
+            f.write("\n")
+    logger.error("投票无法写入数据库，已记入死信文件", extra={
+        "source": source, "votes": votes, "error": str(error), "path": path,
+    })
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+投票记录归档脚本
+将已结束问卷（status=closed 或已过 ends_at）的投票分批导出为 gzip CSV 文件后从 votes 表删除
+（app.services.vote_archive.archive_poll），选项票数与投票人记录保留；可重复执行，中断后重跑接着处理
+
+  python archive_votes.py                     # 归档所有已结束的问卷
+  python archive_votes.py --poll 3 --dir /data/vote-archives
+  zcat archives/poll_3_votes_*.csv.gz | head  # 查看归档内容
+"""
+
+import argparse
+import asyncio
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+# 导入 app 模块之前加载 .env（各模块在导入时读取配置）
+load_dotenv()
+
+from app.database import Database
+from app.services.vote_archive import (
+    VOTE_ARCHIVE_BATCH,
+    VOTE_ARCHIVE_DIR,
+    PollNotClosedError,
+    VotesNotSettledError,
+    archive_poll,
+    closed_poll_ids,
+)
+
+async def archive(poll_ids, directory, batch_size):
+    """逐个问卷归档"""
+    database = Database()
+    try:
+        async with database.async_session() as db:
+            if not poll_ids:
+                poll_ids = await closed_poll_ids(db)
+                await db.commit()
+            for poll_id in poll_ids:
+                try:
+                    result = await archive_poll(db, poll_id, directory, batch_size)
+                except PollNotClosedError:
+                    print(f"问卷 {poll_id} 不存在或仍在进行中，跳过")
+                    continue
+                except VotesNotSettledError:
+                    print("对账与时间序列汇总任务都还没有处理过投票，请待应用的后台任务运行一轮后再归档")
+                    return
+                print(f"问卷 {poll_id}: 归档 {result.archived} 条，删除 {result.deleted} 条 -> {', '.join(result.files) or '无新文件'}")
+                if result.pending:
+                    print(f"问卷 {poll_id}: {result.pending} 条投票尚未被对账/汇总任务处理，留待下次归档")
+    finally:
+        await database.dispose()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="归档已结束问卷的投票记录")
+    parser.add_argument("--poll", type=int, action="append", help="要归档的问卷ID（可重复），默认全部已结束的问卷")
+    parser.add_argument("--dir", default=VOTE_ARCHIVE_DIR, help="归档文件目录")
+    parser.add_argument("--batch", type=int, default=VOTE_ARCHIVE_BATCH, help="每批处理的行数")
+    args = parser.parse_args()
+
+    print("开始归档投票记录...")
+    try:
+        asyncio.run(archive(args.poll, args.dir, args.batch))
+    except Exception as e:
+        print(f"归档失败: {e}")
+        sys.exit(1)
+    print("归档完成！")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+"""
+投票系统基准测试
+用法见 python -m benchmarks --help
+"""
@@ -0,0 +1,331 @@
+"""
+基准测试场景与指标
+- 目标：进程内（httpx ASGITransport 直接驱动 app.main.create_app 创建的应用）或 HTTP 地址（本机启动的服务）
+- 接口场景：submit_vote / get_current_poll / get_poll_statistics，统计 p50/p95/p99 延迟与每秒请求数
+- 广播场景：N 个模拟 Socket.IO 客户端加入问卷房间，统计从投票提交到各客户端收到 vote_update 的延迟
+  （进程内目标的客户端经 Engine.IO 长轮询协议真实连接，与浏览器走同一条服务端路径）
+"""
+import abc
+import asyncio
+import json
+import math
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+
+@dataclass
+class ScenarioResult:
+    """单个场景的统计结果（延迟单位为毫秒）"""
+    count: int
+    errors: int
+    duration_s: float
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, duration: float) -> ScenarioResult:
+    values = sorted(latency * 1000 for latency in latencies)
+    count = len(values) + errors
+    return ScenarioResult(
+        count=count,
+        errors=errors,
+        duration_s=round(duration, 3),
+        rps=round(count / duration, 1) if duration > 0 else 0.0,
+        p50_ms=round(percentile(values, 50), 3),
+        p95_ms=round(percentile(values, 95), 3),
+        p99_ms=round(percentile(values, 99), 3),
+        max_ms=round(values[-1], 3) if values else 0.0,
+    )
+
+
+async def drive(
+    request: Callable[[int], Awaitable[httpx.Response]],
+    total: int,
+    concurrency: int,
+    warmup: int = 0,
+) -> ScenarioResult:
+    """以固定并发执行 total 次请求（先执行 warmup 次不计入统计）"""
+    for i in range(warmup):
+        await request(-1 - i)
+
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await request(index)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            if failed:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+class Target(abc.ABC):
+    """被测服务：提供 HTTP 客户端与模拟 Socket.IO 客户端"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    @abc.abstractmethod
+    async def start(self):
+        """开始测试前准备被测服务"""
+
+    @abc.abstractmethod
+    async def connect_listeners(self, poll_id: str, count: int, on_update: Callable[[int, dict], None]):
+        """连接 count 个客户端并加入问卷房间，收到 vote_update 时回调 on_update(客户端序号, 数据)"""
+
+    async def close(self):
+        await self.client.aclose()
+
+
+# Engine.IO v4 长轮询响应中多个数据包的分隔符
+EIO_RECORD_SEPARATOR = "\x1e"
+
+
+class PollingListener:
+    """
+    通过 Engine.IO 长轮询连接的 Socket.IO 客户端（只实现基准测试用到的部分）
+    与进程内目标共用 httpx 客户端，请求经 ASGITransport 直达应用的 Socket.IO 入口（app.state.socket_app），无需额外依赖
+    """
+
+    def __init__(self, client: httpx.AsyncClient, index: int, on_update: Callable[[int, dict], None]):
+        self.client = client
+        self.index = index
+        self.on_update = on_update
+        self.sid: Optional[str] = None
+        self._acks: Dict[int, asyncio.Future] = {}
+        self._next_ack = 0
+        self._reader: Optional[asyncio.Task] = None
+
+    def _url(self) -> str:
+        url = "/socket.io/?EIO=4&transport=polling"
+        return f"{url}&sid={self.sid}" if self.sid else url
+
+    async def _post(self, packet: str):
+        response = await self.client.post(self._url(), content=packet.encode("utf-8"))
+        response.raise_for_status()
+
+    async def connect(self):
+        response = await self.client.get(self._url())
+        response.raise_for_status()
+        # 握手响应为 0{"sid": ..., "pingInterval": ...}
+        self.sid = json.loads(response.text[1:])["sid"]
+        await self._post("40")
+        self._reader = asyncio.create_task(self._read())
+
+    async def call(self, event: str, data: dict, timeout: float = 10.0):
+        """发送事件并等待确认回调"""
+        self._next_ack += 1
+        ack_id = self._next_ack
+        future = self._acks[ack_id] = asyncio.get_running_loop().create_future()
+        await self._post(f"42{ack_id}" + json.dumps([event, data]))
+        return await asyncio.wait_for(future, timeout)
+
+    async def _read(self):
+        while True:
+            response = await self.client.get(self._url())
+            if response.status_code >= 400:
+                return
+            for packet in response.text.split(EIO_RECORD_SEPARATOR):
+                if packet == "2":
+                    await self._post("3")
+                elif packet == "1":
+                    return
+                elif packet.startswith("42"):
+                    event, *args = json.loads(packet[packet.index("["):])
+                    if event == "vote_update" and args:
+                        self.on_update(self.index, args[0])
+                elif packet.startswith("43"):
+                    body = packet[2:]
+                    ack_id = int(body[:body.index("[")])
+                    future = self._acks.pop(ack_id, None)
+                    if future is not None and not future.done():
+                        future.set_result(json.loads(body[body.index("["):]))
+
+    async def close(self):
+        # 先发送关闭包再放弃挂起的长轮询（服务端收到关闭包后不会再响应它，与浏览器客户端的做法一致）
+        if self.sid is not None:
+            try:
+                await self._post("1")
+            except httpx.HTTPError:
+                pass
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except (asyncio.CancelledError, httpx.HTTPError):
+                pass
+
+
+class InProcessTarget(Target):
+    """进程内目标：HTTP 请求与 Socket.IO 长轮询经 ASGITransport 直达应用（database 为 None 时按环境变量创建）"""
+
+    def __init__(self, database=None):
+        from app.main import create_app
+        self.app = create_app(database)
+        super().__init__(httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self.app.state.socket_app),
+            base_url="http://bench",
+        ))
+        self._lifespan = None
+        self._listeners: List[PollingListener] = []
+
+    async def start(self):
+        self._lifespan = self.app.router.lifespan_context(self.app)
+        await self._lifespan.__aenter__()
+
+    async def connect_listeners(self, poll_id: str, count: int, on_update: Callable[[int, dict], None]):
+        for i in range(count):
+            listener = PollingListener(self.client, i, on_update)
+            await listener.connect()
+            # 以 join_poll 的确认回调为准，确认后已进入房间
+            await listener.call("join_poll", {"pollId": poll_id})
+            self._listeners.append(listener)
+
+    async def close(self):
+        for listener in self._listeners:
+            await listener.close()
+        await super().close()
+        if self._lifespan is not None:
+            await self._lifespan.__aexit__(None, None, None)
+
+
+class HttpTarget(Target):
+    """HTTP 目标：请求发往已启动的服务，Socket.IO 客户端通过 python-socketio 客户端连接（需安装 aiohttp）"""
+
+    def __init__(self, base_url: str):
+        super().__init__(httpx.AsyncClient(base_url=base_url, timeout=30))
+        self.base_url = base_url
+        self._sockets = []
+
+    async def start(self):
+        pass
+
+    async def connect_listeners(self, poll_id: str, count: int, on_update: Callable[[int, dict], None]):
+        import socketio
+        for i in range(count):
+            sock = socketio.AsyncClient()
+            sock.on("vote_update", lambda payload, index=i: on_update(index, payload))
+            await sock.connect(self.base_url, transports=["websocket"])
+            await sock.emit("join_poll", {"pollId": poll_id})
+            self._sockets.append(sock)
+        # join_poll 无确认回调，稍作等待确保已进入房间
+        await asyncio.sleep(0.5)
+
+    async def close(self):
+        for sock in self._sockets:
+            await sock.disconnect()
+        await super().close()
+
+
+async def create_poll(target: Target, options: int = 5) -> dict:
+    """为本次基准测试新建问卷，避免受已有投票影响"""
+    response = await target.client.post("/api/poll", json={
+        "title": f"benchmark {uuid.uuid4().hex[:8]}",
+        "options": [{"label": f"选项{i + 1}"} for i in range(options)],
+    })
+    response.raise_for_status()
+    return response.json()
+
+
+async def bench_http(target: Target, poll: dict, requests: int, concurrency: int, warmup: int) -> Dict[str, ScenarioResult]:
+    """接口场景"""
+    poll_id = poll["poll_id"]
+    option_ids = [str(option["option_id"]) for option in poll["options"]]
+    run_id = uuid.uuid4().hex[:8]
+    client = target.client
+
+    def submit_vote(index: int):
+        return client.post("/api/poll/vote", json={
+            "optionId": option_ids[index % len(option_ids)],
+            "userToken": f"bench_{run_id}_{index}",
+        })
+
+    results = {}
+    results["submit_vote"] = await drive(submit_vote, requests, concurrency, warmup)
+    results["get_current_poll"] = await drive(lambda i: client.get("/api/poll"), requests, concurrency, warmup)
+    results["get_poll_statistics"] = await drive(
+        lambda i: client.get(f"/api/poll/{poll_id}/statistics"), requests, concurrency, warmup
+    )
+    return results
+
+
+async def bench_broadcast(target: Target, poll: dict, clients: int, rounds: int, timeout: float = 5.0) -> ScenarioResult:
+    """
+    广播场景：每轮提交一票，等待全部客户端收到包含新总票数的 vote_update
+    poll 须为新建且只在本场景中投票的问卷，第 k 轮的总票数即为 k
+    """
+    poll_id = str(poll["poll_id"])
+    option_id = str(poll["options"][0]["option_id"])
+    run_id = uuid.uuid4().hex[:8]
+    received: List[Optional[float]] = [None] * clients
+    expected_total = {"value": 0}
+    all_received = asyncio.Event()
+
+    def on_update(index: int, payload: dict):
+        if payload.get("pollId") != poll_id:
+            return
+        if payload.get("totalVotes", 0) >= expected_total["value"] and received[index] is None:
+            received[index] = time.perf_counter()
+            if all(at is not None for at in received):
+                all_received.set()
+
+    await target.connect_listeners(poll_id, clients, on_update)
+
+    latencies: List[float] = []
+    errors = 0
+    started = time.perf_counter()
+    for round_index in range(rounds):
+        received[:] = [None] * clients
+        all_received.clear()
+        # 推送可能先于投票响应到达，提交前即登记期望的总票数
+        expected_total["value"] = round_index + 1
+        sent_at = time.perf_counter()
+        response = await target.client.post("/api/poll/vote", json={
+            "optionId": option_id,
+            "userToken": f"bench_broadcast_{run_id}_{round_index}",
+        })
+        if response.status_code >= 400:
+            errors += clients
+            continue
+        try:
+            await asyncio.wait_for(all_received.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        for at in received:
+            if at is None:
+                errors += 1
+            else:
+                latencies.append(at - sent_at)
+    return summarize(latencies, errors, time.perf_counter() - started)
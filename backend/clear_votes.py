@@ -1,46 +1,61 @@
 #!/usr/bin/env python3
 """
 清理投票记录脚本
-用于测试时清除所有投票记录
+按问卷分批删除投票记录与投票人并重算票数（app.services.vote_archive.reset_poll），
+每批一个短事务，清理期间不阻塞其他问卷的投票
+
+  python clear_votes.py            # 清理所有问卷
+  python clear_votes.py --poll 3   # 只清理指定问卷
 """
 
+import argparse
+import asyncio
 import sys
 import os
 
 # 添加当前目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.database import SessionLocal
+from dotenv import load_dotenv
+
+# 导入 app 模块之前加载 .env（各模块在导入时读取配置）
+load_dotenv()
+
+from sqlalchemy import select
+
+from app.database import Database
 from app import models
+from app.services.vote_archive import VOTE_ARCHIVE_BATCH, reset_poll
 
-def clear_votes():
-    """清理所有投票记录并重置计数"""
-    db = SessionLocal()
+async def clear_votes(poll_ids, batch_size):
+    """清理投票记录并重置计数"""
+    database = Database()
     try:
-        # 删除所有投票记录
-        vote_count = db.query(models.Vote).count()
-        db.query(models.Vote).delete()
-        
-        # 重置所有选项的投票计数
-        options = db.query(models.Option).all()
-        for option in options:
-            option.vote_count = 0
-        
-        db.commit()
-        print(f"已清理 {vote_count} 条投票记录")
-        print("已重置所有选项的投票计数")
-        
-    except Exception as e:
-        db.rollback()
-        print(f"清理失败: {e}")
+        async with database.async_session() as db:
+            if not poll_ids:
+                poll_ids = list((await db.execute(
+                    select(models.Poll.poll_id).order_by(models.Poll.poll_id)
+                )).scalars())
+            for poll_id in poll_ids:
+                result = await reset_poll(db, poll_id, batch_size)
+                print(f"问卷 {poll_id}: 已清理 {result['votes']} 条投票记录、{result['voters']} 个投票人，票数已重置")
     finally:
-        db.close()
+        await database.dispose()
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="清理投票记录")
+    parser.add_argument("--poll", type=int, action="append", help="要清理的问卷ID（可重复），默认全部问卷")
+    parser.add_argument("--batch", type=int, default=VOTE_ARCHIVE_BATCH, help="每批删除的行数")
+    args = parser.parse_args()
+
     print("开始清理投票记录...")
-    clear_votes()
+    try:
+        asyncio.run(clear_votes(args.poll, args.batch))
+    except Exception as e:
+        print(f"清理失败: {e}")
+        sys.exit(1)
     print("清理完成！")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -11,18 +11,23 @@ from sqlalchemy.orm import Session
 # 添加当前目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.database import engine, SessionLocal
+from dotenv import load_dotenv
+
+# 导入 app 模块之前加载 .env（各模块在导入时读取配置）
+load_dotenv()
+
+from app.database import Database
 from app import models
 
-def create_tables():
+def create_tables(database):
     """创建数据库表"""
     print("正在创建数据库表...")
-    models.Base.metadata.create_all(bind=engine)
+    models.Base.metadata.create_all(bind=database.engine)
     print("数据库表创建完成！")
 
-def insert_sample_data():
+def insert_sample_data(database):
     """插入示例投票数据"""
-    db = SessionLocal()
+    db = database.session_factory()
     try:
         # 检查是否已有数据
         existing_poll = db.query(models.Poll).first()
@@ -69,13 +74,14 @@ def insert_sample_data():
 def main():
     """主函数"""
     print("开始初始化数据库...")
+    database = Database()
     
     try:
         # 1. 创建表
-        create_tables()
+        create_tables(database)
         
         # 2. 插入示例数据
-        insert_sample_data()
+        insert_sample_data(database)
         
         print("数据库初始化完成！")
         print("\n可以启动后端服务了:")
@@ -84,6 +90,8 @@ def main():
     except Exception as e:
         print(f"数据库初始化失败: {e}")
         sys.exit(1)
+    finally:
+        database.engine.dispose()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
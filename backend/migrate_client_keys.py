@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+投票人表迁移脚本
+创建 poll_voters 表（已有的表补建 voted_at 索引），并按 vote_id 分批从已有投票记录回填 (poll_id, client_key)
+可重复执行：已存在的索引与投票人行会被跳过
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+# 导入 app 模块之前加载 .env（各模块在导入时读取配置）
+load_dotenv()
+
+from sqlalchemy import inspect, select
+
+from app.database import Database
+from app import models
+from app.services.client_keys import client_key
+from app.services.voting import insert_ignore
+
+BATCH_SIZE = 5000
+
+votes_table = models.Vote.__table__
+options_table = models.Option.__table__
+voters_table = models.PollVoter.__table__
+
+def create_table(database):
+    """创建投票人表"""
+    print("正在创建 poll_voters 表...")
+    voters_table.create(bind=database.engine, checkfirst=True)
+    existing_indexes = {index["name"] for index in inspect(database.engine).get_indexes("poll_voters")}
+    for index in voters_table.indexes:
+        if index.name not in existing_indexes:
+            index.create(bind=database.engine)
+            print(f"已创建索引 {index.name}")
+    print("poll_voters 表已就绪")
+
+def backfill(database):
+    """按主键分批回填投票人"""
+    db = database.session_factory()
+    last_vote_id = 0
+    scanned = 0
+    inserted = 0
+    try:
+        while True:
+            rows = db.execute(
+                select(votes_table.c.vote_id, options_table.c.poll_id, votes_table.c.client_id)
+                .join(options_table, options_table.c.option_id == votes_table.c.option_id)
+                .where(votes_table.c.vote_id > last_vote_id)
+                .order_by(votes_table.c.vote_id)
+                .limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            last_vote_id = rows[-1].vote_id
+            scanned += len(rows)
+            voters = [
+                {"poll_id": poll_id, "client_key": client_key(client_id)}
+                for _, poll_id, client_id in rows
+                if client_id is not None
+            ]
+            if voters:
+                result = db.execute(insert_ignore(voters_table), voters)
+                inserted += max(result.rowcount, 0)
+            db.commit()
+            print(f"已处理至 vote_id={last_vote_id}")
+        print(f"共扫描 {scanned} 条投票记录，新增 {inserted} 个投票人")
+    except Exception as e:
+        db.rollback()
+        print(f"回填失败: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+def main():
+    """主函数"""
+    print("开始迁移投票人表...")
+    database = Database()
+    try:
+        create_table(database)
+        backfill(database)
+    finally:
+        database.engine.dispose()
+    print("迁移完成！")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+问卷状态迁移脚本
+为已有的 polls 表补充 slug / status / starts_at / ends_at 列及索引，已有问卷的状态为 active
+可重复执行：已存在的列与索引会被跳过
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+# 导入 app 模块之前加载 .env（各模块在导入时读取配置）
+load_dotenv()
+
+from sqlalchemy import inspect, text
+
+from app.database import Database
+
+COLUMNS = {
+    "slug": "VARCHAR(64) NULL",
+    "status": "VARCHAR(16) NOT NULL DEFAULT 'active'",
+    "starts_at": "DATETIME NULL",
+    "ends_at": "DATETIME NULL",
+}
+
+INDEXES = {
+    "uk_polls_slug": "CREATE UNIQUE INDEX uk_polls_slug ON polls (slug)",
+    "idx_polls_status_window": "CREATE INDEX idx_polls_status_window ON polls (status, starts_at, ends_at)",
+}
+
+def migrate(engine):
+    """补充缺少的列与索引"""
+    inspector = inspect(engine)
+    existing_columns = {column["name"] for column in inspector.get_columns("polls")}
+    existing_indexes = {index["name"] for index in inspector.get_indexes("polls")}
+    with engine.begin() as conn:
+        for name, ddl in COLUMNS.items():
+            if name in existing_columns:
+                print(f"列 {name} 已存在，跳过")
+                continue
+            conn.execute(text(f"ALTER TABLE polls ADD COLUMN {name} {ddl}"))
+            print(f"已添加列 {name}")
+        for name, ddl in INDEXES.items():
+            if name in existing_indexes:
+                print(f"索引 {name} 已存在，跳过")
+                continue
+            conn.execute(text(ddl))
+            print(f"已创建索引 {name}")
+
+def main():
+    """主函数"""
+    print("开始迁移问卷表...")
+    database = Database()
+    try:
+        migrate(database.engine)
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        sys.exit(1)
+    finally:
+        database.engine.dispose()
+    print("迁移完成！")
+
+if __name__ == "__main__":
+    main()
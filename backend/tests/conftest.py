@@ -0,0 +1,35 @@
+"""
+测试公共夹具
+"""
+from contextlib import contextmanager
+
+import pytest
+
+from app.services.query_profiler import query_profiler
+
+
+@pytest.fixture
+def query_budget(monkeypatch):
+    """
+    SQL 语句预算：块内每个 HTTP 请求执行的语句数超过预算或出现 N+1 嫌疑时测试失败
+
+        with query_budget(4):
+            client.post("/api/poll/vote", json=...)
+    """
+    monkeypatch.setattr(query_profiler, "enabled", True)
+
+    @contextmanager
+    def budget(max_queries: int, allow_n_plus_one: bool = False):
+        query_profiler.clear()
+        yield query_profiler.recent
+        for profile in query_profiler.recent:
+            summary = f"{profile.method} {profile.path}: " + "".join(
+                f"\n  [{q.call_site}] {q.statement}" for q in profile.queries
+            )
+            if len(profile.queries) > max_queries:
+                pytest.fail(f"SQL 语句数 {len(profile.queries)} 超出预算 {max_queries}，{summary}")
+            if not allow_n_plus_one and profile.n_plus_one():
+                pytest.fail(f"疑似 N+1 查询 {profile.n_plus_one()}，{summary}")
+
+    yield budget
+    query_profiler.clear()
@@ -0,0 +1,32 @@
+"""
+基准测试工具测试
+"""
+from benchmarks.harness import percentile, summarize
+from benchmarks.__main__ import compare
+
+
+class TestBenchmarkHarness:
+    """基准测试统计与基线比较测试类"""
+    
+    def test_percentiles(self):
+        """测试最近秩百分位数与汇总指标"""
+        values = [float(i) for i in range(1, 101)]
+        assert percentile(values, 50) == 50.0
+        assert percentile(values, 99) == 99.0
+        
+        result = summarize([0.001, 0.002, 0.003, 0.004], errors=1, duration=0.5)
+        assert result.count == 5
+        assert result.rps == 10.0
+        assert result.p50_ms == 2.0
+        assert result.max_ms == 4.0
+    
+    def test_compare_flags_regressions(self):
+        """测试吞吐下降或延迟上升超过阈值时判定为退化"""
+        baseline = {"scenarios": {"submit_vote": {"rps": 100.0, "p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0}}}
+        faster = {"scenarios": {"submit_vote": {"rps": 120.0, "p50_ms": 9.0, "p95_ms": 18.0, "p99_ms": 30.0}}}
+        slower = {"scenarios": {"submit_vote": {"rps": 100.0, "p50_ms": 10.0, "p95_ms": 30.0, "p99_ms": 30.0}}}
+        
+        assert compare(faster, baseline, 0.15)[1] is False
+        lines, regressed = compare(slower, baseline, 0.15)
+        assert regressed is True
+        assert any("p95_ms" in line and "退化" in line for line in lines)
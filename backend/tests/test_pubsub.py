@@ -0,0 +1,83 @@
+"""
+Socket.IO 跨进程消息分发测试
+"""
+import asyncio
+import httpx
+import pytest
+import socketio
+
+from benchmarks.harness import PollingListener
+from app.services.pubsub import (
+    AsyncLocalManager,
+    AsyncUnixSocketManager,
+    create_client_manager,
+)
+
+
+async def fan_out(manager_a, manager_b):
+    """worker A 发出的房间消息应送达连接在 worker B 上的客户端"""
+    sio_a = socketio.AsyncServer(async_mode="asgi", client_manager=manager_a)
+    sio_b = socketio.AsyncServer(async_mode="asgi", client_manager=manager_b)
+    
+    @sio_b.event
+    async def join(sid, data):
+        await sio_b.enter_room(sid, data["room"])
+        return True
+    
+    # 客户端经 Engine.IO 长轮询连接 worker B（与基准测试的模拟客户端相同）
+    received = []
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=socketio.ASGIApp(sio_b)), base_url="http://worker-b")
+    listener = PollingListener(http, 0, lambda index, update: received.append(update))
+    try:
+        await listener.connect()
+        await listener.call("join", {"room": "poll_1"})
+        # 等待 worker B 开始监听
+        await asyncio.sleep(0.2)
+        
+        await sio_a.emit("vote_update", {"pollId": "1", "version": 3}, room="poll_1")
+        for _ in range(50):
+            if received:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await listener.close()
+        await http.aclose()
+    return received
+
+
+class TestClientManagers:
+    """消息总线测试类"""
+    
+    def test_create_client_manager(self, tmp_path):
+        """测试按总线地址选择 client manager"""
+        assert create_client_manager("") is None
+        assert isinstance(create_client_manager("memory://votes"), AsyncLocalManager)
+        assert isinstance(
+            create_client_manager(f"unix://{tmp_path}/bus.sock"), AsyncUnixSocketManager
+        )
+        with pytest.raises(ValueError):
+            create_client_manager("kafka://localhost:9092")
+    
+    def test_local_bus_fan_out(self):
+        """测试进程内总线在两个服务实例间转发房间消息"""
+        received = asyncio.run(fan_out(
+            AsyncLocalManager(channel="test_local"),
+            AsyncLocalManager(channel="test_local"),
+        ))
+        assert received == [{"pollId": "1", "version": 3}]
+    
+    def test_unix_socket_bus_fan_out(self, tmp_path):
+        """测试 Unix 套接字总线：一个实例兼任转发者，另一个实例收到消息"""
+        path = str(tmp_path / "bus.sock")
+        manager_a = AsyncUnixSocketManager(path, channel="test_unix")
+        manager_b = AsyncUnixSocketManager(path, channel="test_unix")
+        
+        async def run():
+            try:
+                return await fan_out(manager_a, manager_b)
+            finally:
+                await manager_a.close()
+                await manager_b.close()
+        
+        received = asyncio.run(run())
+        assert received == [{"pollId": "1", "version": 3}]
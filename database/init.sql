@@ -6,8 +6,14 @@ USE `voting_system`;
 CREATE TABLE `polls` (
   `poll_id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT COMMENT '问卷唯一主键，自增',
   `title` VARCHAR(255) NOT NULL COMMENT '问卷标题',
+  `slug` VARCHAR(64) NULL COMMENT '问卷短标识（可选，用于按 slug 访问问卷）',
+  `status` VARCHAR(16) NOT NULL DEFAULT 'active' COMMENT '状态：draft / active / closed',
+  `starts_at` DATETIME NULL COMMENT '开始投票时间（UTC），为空表示立即开始',
+  `ends_at` DATETIME NULL COMMENT '结束投票时间（UTC），为空表示不限',
   `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
-  PRIMARY KEY (`poll_id`)
+  PRIMARY KEY (`poll_id`),
+  UNIQUE KEY `uk_polls_slug` (`slug`),
+  KEY `idx_polls_status_window` (`status`, `starts_at`, `ends_at`)
 ) ENGINE=InnoDB 
   DEFAULT CHARSET=utf8mb4 
   COMMENT='投票问卷表';
@@ -42,4 +48,83 @@ CREATE TABLE `votes` (
     ON UPDATE CASCADE
 ) ENGINE=InnoDB 
   DEFAULT CHARSET=utf8mb4 
-  COMMENT='投票记录表'; 
\ No newline at end of file
+  COMMENT='投票记录表'; 
+
+-- 4. 投票人表（按问卷防重复，客户端标识归一化为 16 字节摘要）
+CREATE TABLE `poll_voters` (
+  `poll_id` BIGINT UNSIGNED NOT NULL COMMENT '问卷ID，外键引用 polls.poll_id',
+  `client_key` BINARY(16) NOT NULL COMMENT '客户端标识摘要：UNHEX(LEFT(SHA2(client_id, 256), 32))',
+  `voted_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '投票时间戳',
+  PRIMARY KEY (`poll_id`, `client_key`),
+  KEY `idx_poll_voters_voted_at` (`voted_at`),
+  CONSTRAINT `fk_poll_voters_poll`
+    FOREIGN KEY (`poll_id`) REFERENCES `polls` (`poll_id`)
+    ON DELETE CASCADE 
+    ON UPDATE CASCADE
+) ENGINE=InnoDB 
+  DEFAULT CHARSET=utf8mb4 
+  COMMENT='投票人表（防重复）';
+
+
+-- 5. 票数对账检查点表（截至水位线 votes 表中各选项的投票记录数）
+CREATE TABLE `tally_checkpoints` (
+  `option_id` BIGINT UNSIGNED NOT NULL COMMENT '选项ID，外键引用 options.option_id',
+  `counted_votes` BIGINT NOT NULL DEFAULT 0 COMMENT '截至水位线的投票记录数',
+  PRIMARY KEY (`option_id`),
+  CONSTRAINT `fk_tally_checkpoints_option`
+    FOREIGN KEY (`option_id`) REFERENCES `options` (`option_id`)
+    ON DELETE CASCADE 
+    ON UPDATE CASCADE
+) ENGINE=InnoDB 
+  DEFAULT CHARSET=utf8mb4 
+  COMMENT='票数对账检查点表';
+
+-- 6. 水位线表（后台增量任务已处理到的 vote_id）
+CREATE TABLE `watermarks` (
+  `name` VARCHAR(32) NOT NULL COMMENT '任务名',
+  `vote_id` BIGINT NOT NULL DEFAULT 0 COMMENT '已处理到的 vote_id（含）',
+  `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB 
+  DEFAULT CHARSET=utf8mb4 
+  COMMENT='水位线表';
+
+
+-- 7. 投票时间序列汇总表（按选项、时间粒度、时间桶累计票数，图表查询无需扫描投票记录）
+CREATE TABLE `vote_rollups` (
+  `option_id` BIGINT UNSIGNED NOT NULL COMMENT '选项ID，外键引用 options.option_id',
+  `resolution` INT NOT NULL COMMENT '时间粒度（秒）：1 / 60 / 3600',
+  `bucket_start` BIGINT NOT NULL COMMENT '时间桶起点（UTC 秒级时间戳）',
+  `vote_count` INT NOT NULL DEFAULT 0 COMMENT '该时间桶内的票数',
+  PRIMARY KEY (`option_id`, `resolution`, `bucket_start`),
+  KEY `idx_vote_rollups_bucket` (`resolution`, `bucket_start`),
+  CONSTRAINT `fk_vote_rollups_option`
+    FOREIGN KEY (`option_id`) REFERENCES `options` (`option_id`)
+    ON DELETE CASCADE 
+    ON UPDATE CASCADE
+) ENGINE=InnoDB 
+  DEFAULT CHARSET=utf8mb4 
+  COMMENT='投票时间序列汇总表';
+
+-- 8. 选项票数分片表（VOTE_COUNTER_SHARDS > 1 时票数增量分散写入各分片行，避免热门选项单行锁争用）
+CREATE TABLE `option_counter_shards` (
+  `option_id` BIGINT UNSIGNED NOT NULL COMMENT '选项ID，外键引用 options.option_id',
+  `shard` INT NOT NULL COMMENT '分片号',
+  `vote_count` INT NOT NULL DEFAULT 0 COMMENT '该分片累计的票数',
+  PRIMARY KEY (`option_id`, `shard`),
+  CONSTRAINT `fk_option_counter_shards_option`
+    FOREIGN KEY (`option_id`) REFERENCES `options` (`option_id`)
+    ON DELETE CASCADE 
+    ON UPDATE CASCADE
+) ENGINE=InnoDB 
+  DEFAULT CHARSET=utf8mb4 
+  COMMENT='选项票数分片表';
+
+-- 9. 主库心跳表（读写分离按副本上读到的心跳时间戳计算复制延迟）
+CREATE TABLE `replica_heartbeats` (
+  `name` VARCHAR(32) NOT NULL COMMENT '心跳名',
+  `beat_ms` BIGINT NOT NULL DEFAULT 0 COMMENT '主库写入心跳时的 UNIX 毫秒时间戳',
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB 
+  DEFAULT CHARSET=utf8mb4 
+  COMMENT='主库心跳表';
@@ -0,0 +1,63 @@
+-- 投票记录表按时间分区（可选，MySQL 8.0）
+-- 分区后按月份裁剪扫描，归档（backend/archive_votes.py）清空的旧分区可直接 DROP PARTITION 回收空间，
+-- 热分区小，索引常驻 buffer pool。
+-- 注意：
+--   1. InnoDB 分区表不支持外键，须先删除 fk_votes_option；删除选项时的级联由应用负责
+--      （问卷的投票由 clear_votes.py / archive_votes.py 分批删除）
+--   2. 分区键须包含在所有唯一键中，主键改为 (vote_id, voted_at)；应用只按 vote_id 查询与范围扫描，不受影响
+--   3. ALTER 会重建整张表，请在低峰期执行或使用 pt-online-schema-change / gh-ost
+--   4. 分区按执行时的日期生成：phistory 存放当月之前的投票，pYYYY_MM 存放对应月份，pmax 兜底；
+--      下个月的分区由 votes_add_next_partition() 滚动创建（见文末的定时事件），pmax 始终为空，拆分无需搬数据
+USE `voting_system`;
+
+ALTER TABLE `votes` DROP FOREIGN KEY `fk_votes_option`;
+
+ALTER TABLE `votes`
+  DROP PRIMARY KEY,
+  ADD PRIMARY KEY (`vote_id`, `voted_at`);
+
+SET @this_month = DATE_FORMAT(CURDATE(), '%Y-%m-01');
+SET @ddl = CONCAT(
+  'ALTER TABLE `votes` PARTITION BY RANGE COLUMNS (`voted_at`) (',
+  'PARTITION phistory VALUES LESS THAN (''', @this_month, '''), ',
+  'PARTITION ', DATE_FORMAT(@this_month, 'p%Y_%m'), ' VALUES LESS THAN (''', DATE(@this_month) + INTERVAL 1 MONTH, '''), ',
+  'PARTITION pmax VALUES LESS THAN (MAXVALUE))'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- 从 pmax 拆出下个月的分区（已存在时不做任何事，可重复执行）
+DROP PROCEDURE IF EXISTS `votes_add_next_partition`;
+DELIMITER //
+CREATE PROCEDURE `votes_add_next_partition`()
+BEGIN
+  DECLARE next_month DATE DEFAULT DATE(DATE_FORMAT(CURDATE(), '%Y-%m-01')) + INTERVAL 1 MONTH;
+  DECLARE partition_name VARCHAR(16) DEFAULT DATE_FORMAT(next_month, 'p%Y_%m');
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'votes' AND PARTITION_NAME = partition_name
+  ) THEN
+    SET @ddl = CONCAT(
+      'ALTER TABLE `votes` REORGANIZE PARTITION pmax INTO (',
+      'PARTITION ', partition_name, ' VALUES LESS THAN (''', next_month + INTERVAL 1 MONTH, '''), ',
+      'PARTITION pmax VALUES LESS THAN (MAXVALUE))'
+    );
+    PREPARE stmt FROM @ddl;
+    EXECUTE stmt;
+    DEALLOCATE PREPARE stmt;
+  END IF;
+END //
+DELIMITER ;
+
+CALL `votes_add_next_partition`();
+
+-- 每天检查一次，下个月的分区总在月初之前建好（需开启 event_scheduler；
+-- 未开启时可用 cron 每天执行 mysql voting_system -e 'CALL votes_add_next_partition()'）
+DROP EVENT IF EXISTS `votes_rotate_partitions`;
+CREATE EVENT `votes_rotate_partitions`
+  ON SCHEDULE EVERY 1 DAY
+  DO CALL `votes_add_next_partition`();
+
+-- 某月的投票全部归档后回收该分区（先确认已无数据：SELECT COUNT(*) FROM votes PARTITION (p2024_01)）：
+-- ALTER TABLE `votes` DROP PARTITION p2024_01;
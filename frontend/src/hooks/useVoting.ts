@@ -1,6 +1,6 @@
 import { useState, useEffect, useCallback, useRef } from 'react';
 import { message } from 'antd';
-import { Poll } from '../types';
+import { Poll, PollSync, VoteUpdate } from '../types';
 import { VotingApiService } from '../services/api';
 import { websocketService } from '../services/websocket';
 
@@ -19,6 +19,23 @@ interface UseVotingActions {
   reconnectWebSocket: () => void;
 }
 
+/**
+ * 合并增量后客户端持有的版本：只有同一 epoch 且增量起点不晚于当前版本时，合并结果才等于该版本的快照，可以推进；
+ * 过期的增量不改变版本；其他 worker 的推送或漏收了中间的推送时清除版本，重连时服务端回复完整快照
+ */
+function nextVersion(current: Poll, update: VoteUpdate): Pick<Poll, 'version' | 'epoch'> {
+  if (current.epoch === undefined || current.version === undefined || update.epoch !== current.epoch) {
+    return { version: undefined, epoch: undefined };
+  }
+  if (update.version <= current.version) {
+    return { version: current.version, epoch: current.epoch };
+  }
+  if (update.baseVersion !== undefined && update.baseVersion <= current.version) {
+    return { version: update.version, epoch: update.epoch };
+  }
+  return { version: undefined, epoch: undefined };
+}
+
 export function useVoting(): UseVotingState & UseVotingActions {
   // 状态定义
   const [poll, setPoll] = useState<Poll | null>(null);
@@ -35,6 +52,7 @@ export function useVoting(): UseVotingState & UseVotingActions {
   const updatePoll = useCallback((newPoll: Poll | null) => {
     setPoll(newPoll);
     pollRef.current = newPoll;
+    websocketService.setLastSeen(newPoll?.epoch, newPoll?.version);
     
     // 检查用户是否已投票
     if (newPoll) {
@@ -81,6 +99,35 @@ export function useVoting(): UseVotingState & UseVotingActions {
     }
   }, [updatePoll]);
 
+  // 合并票数增量：票数只增不减，按选项取较大值合并，
+  // 多个 worker 的推送乱序到达（版本号各自独立）时结果同样正确
+  const handleVoteUpdate = useCallback((update: VoteUpdate) => {
+    const current = pollRef.current;
+    if (!current || current.id !== update.pollId) return;
+
+    const changed = new Map(update.options.map(option => [option.id, option.votes]));
+    const options = current.options.map(option =>
+      changed.has(option.id)
+        ? { ...option, votes: Math.max(option.votes, changed.get(option.id)!) }
+        : option
+    );
+    updatePoll({
+      ...current,
+      options,
+      totalVotes: options.reduce((sum, option) => sum + option.votes, 0),
+      ...nextVersion(current, update),
+    });
+  }, [updatePoll]);
+
+  // 加入房间（含断线重连）时的追赶回复：增量按 vote_update 合并，完整快照直接替换
+  const handlePollSync = useCallback((sync: PollSync) => {
+    if (sync.type === 'snapshot') {
+      updatePoll(sync.poll);
+    } else {
+      handleVoteUpdate(sync);
+    }
+  }, [updatePoll, handleVoteUpdate]);
+
   const handleWebSocketConnect = useCallback(() => {
     console.log('WebSocket 连接成功');
     setIsConnected(true);
@@ -133,6 +180,8 @@ export function useVoting(): UseVotingState & UseVotingActions {
       
       // 2. 设置 WebSocket 事件监听器
       websocketService.on('poll_update', handlePollUpdate);
+      websocketService.on('vote_update', handleVoteUpdate);
+      websocketService.on('poll_sync', handlePollSync);
       websocketService.on('connect', handleWebSocketConnect);
       websocketService.on('disconnect', handleWebSocketDisconnect);
       websocketService.on('error', handleWebSocketError);
@@ -152,6 +201,8 @@ export function useVoting(): UseVotingState & UseVotingActions {
       
       // 移除事件监听器
       websocketService.off('poll_update', handlePollUpdate);
+      websocketService.off('vote_update', handleVoteUpdate);
+      websocketService.off('poll_sync', handlePollSync);
       websocketService.off('connect', handleWebSocketConnect);
       websocketService.off('disconnect', handleWebSocketDisconnect);
       websocketService.off('error', handleWebSocketError);
@@ -162,6 +213,8 @@ export function useVoting(): UseVotingState & UseVotingActions {
   }, [
     refreshPoll,
     handlePollUpdate,
+    handleVoteUpdate,
+    handlePollSync,
     handleWebSocketConnect,
     handleWebSocketDisconnect,
     handleWebSocketError
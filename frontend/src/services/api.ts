@@ -1,5 +1,5 @@
 import axios, { AxiosResponse } from 'axios';
-import { Poll, VoteRequest, VoteResponse, ApiResponse } from '../types';
+import { Poll, PollTimeseries, TimeseriesResolution, VoteRequest, VoteResponse, ApiResponse } from '../types';
 
 // 创建 axios 实例，配置基础 URL 和默认设置
 const apiClient = axios.create({
@@ -85,6 +85,29 @@ export class VotingApiService {
     }
   }
 
+  /**
+   * 获取投票时间序列（如最近一小时每分钟票数）
+   */
+  static async getTimeseries(
+    pollId: string,
+    resolution: TimeseriesResolution = '1m',
+    window: number = 3600
+  ): Promise<PollTimeseries> {
+    try {
+      const response: ApiResponse<PollTimeseries> = await apiClient.get(
+        `/poll/${pollId}/timeseries`,
+        { params: { resolution, window } }
+      );
+      if (response.success && response.data) {
+        return response.data;
+      }
+      throw new Error(response.message || '获取投票趋势失败');
+    } catch (error) {
+      console.error('获取投票趋势失败:', error);
+      throw error;
+    }
+  }
+
   /**
    * 检查用户是否已经投票（基于本地存储）
    */
@@ -1,8 +1,8 @@
 import { io, Socket } from 'socket.io-client';
-import { Poll } from '../types';
+import { Poll, PollSync, VoteUpdate } from '../types';
 
 // WebSocket 事件类型
-export type WebSocketEventType = 'poll_update' | 'vote_result' | 'error' | 'connect' | 'disconnect';
+export type WebSocketEventType = 'poll_update' | 'vote_update' | 'poll_sync' | 'vote_result' | 'error' | 'connect' | 'disconnect';
 
 // WebSocket 事件监听器类型
 export type WebSocketEventListener = (data: any) => void;
@@ -15,6 +15,8 @@ export class WebSocketService {
   private reconnectAttempts = 0;
   private maxReconnectAttempts = 5;
   private reconnectInterval = 3000; // 3秒
+  // 客户端已看到的问卷版本，重连加入房间时带上，服务端据此只回复增量
+  private lastSeen: { epoch?: string; version?: number } = {};
 
   constructor() {
     this.initializeEventListeners();
@@ -24,7 +26,7 @@ export class WebSocketService {
    * 初始化事件监听器映射
    */
   private initializeEventListeners(): void {
-    const eventTypes: WebSocketEventType[] = ['poll_update', 'vote_result', 'error', 'connect', 'disconnect'];
+    const eventTypes: WebSocketEventType[] = ['poll_update', 'vote_update', 'poll_sync', 'vote_result', 'error', 'connect', 'disconnect'];
     eventTypes.forEach(eventType => {
       this.eventListeners.set(eventType, []);
     });
@@ -70,8 +72,12 @@ export class WebSocketService {
       this.reconnectAttempts = 0;
       this.emit('connect', { timestamp: new Date().toISOString() });
 
-      // 加入投票房间以接收实时更新
-      this.socket?.emit('join_poll', { pollId: 'current' });
+      // 加入投票房间以接收实时更新，回复为自上次看到的版本以来的增量或完整快照
+      this.socket?.emit('join_poll', { pollId: 'current', ...this.lastSeen }, (data: PollSync | null) => {
+        if (data) {
+          this.emit('poll_sync', data);
+        }
+      });
     });
 
     // 连接断开
@@ -87,6 +93,11 @@ export class WebSocketService {
       this.emit('poll_update', data);
     });
 
+    // 票数增量更新（服务端合并限频后推送，只包含变化的选项）
+    this.socket.on('vote_update', (data: VoteUpdate) => {
+      this.emit('vote_update', data);
+    });
+
     // 投票提交结果
     this.socket.on('vote_result', (data: any) => {
       console.log('收到投票结果:', data);
@@ -123,6 +134,13 @@ export class WebSocketService {
     }
   }
 
+  /**
+   * 记录客户端当前展示的问卷版本
+   */
+  setLastSeen(epoch?: string, version?: number): void {
+    this.lastSeen = { epoch, version };
+  }
+
   /**
    * 添加事件监听器
    */
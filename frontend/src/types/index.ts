@@ -13,6 +13,8 @@ export interface Poll {
   options: VoteOption[];
   totalVotes: number;
   isActive: boolean;
+  version?: number;  // 服务端快照版本号，票数变化时递增
+  epoch?: string;    // 版本号所属的服务端进程，不同进程（或重启前后）的版本号不可比较
   createdAt: string;
   updatedAt: string;
 }
@@ -30,6 +32,35 @@ export interface VoteResponse {
   poll?: Poll;
 }
 
+// 票数增量更新类型（options 仅包含自 baseVersion 以来发生变化的选项）
+export interface VoteUpdate {
+  pollId: string;
+  epoch?: string;
+  baseVersion?: number;  // 增量的起点版本（同一 epoch 内），客户端版本不早于它时才能推进版本号
+  version: number;
+  options: Pick<VoteOption, 'id' | 'votes'>[];
+  totalVotes: number;
+}
+
+// 加入房间时服务端的追赶回复：版本仍可比较时为增量（格式同 VoteUpdate），否则为完整快照
+export type PollSync =
+  | ({ type: 'delta' } & VoteUpdate)
+  | { type: 'snapshot'; poll: Poll };
+
+// 时间粒度
+export type TimeseriesResolution = '1s' | '1m' | '1h';
+
+// 投票时间序列（buckets 为各时间桶起点的 UTC 秒级时间戳，votes 与之一一对应）
+export interface PollTimeseries {
+  pollId: string;
+  resolution: TimeseriesResolution;
+  bucketSeconds: number;
+  start: number;
+  end: number;
+  buckets: number[];
+  options: (Pick<VoteOption, 'id' | 'text'> & { votes: number[] })[];
+}
+
 // WebSocket 消息类型
 export interface WebSocketMessage {
   type: 'poll_update' | 'vote_result' | 'error';